@@ -0,0 +1,166 @@
+"""
+Local cache of what is learnt about policies of a ruleset while they are
+loaded. Loading is the same for each job of the same ruleset, so jobs that
+come after the first one can skip the work that does not depend on the
+tenant, its account or region:
+- policies that cannot be loaded are dropped before Policy objects are
+  created for them;
+- policies without variables ({account_id}, {region}, ...) get a copy of
+  their data instead of being expanded.
+Resource managers, filters and actions are still created and validated
+for each job, because they keep state and bind to the options of a job.
+Entries are keyed by the hash of the ruleset and Cloud Custodian version.
+Batch containers are not reused, so besides a local directory entries are
+kept in the rulesets bucket
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import msgspec
+from c7n.version import version as c7n_version
+
+from helpers.log_helper import get_logger
+from services.clients.s3 import S3Client
+
+_LOG = get_logger(__name__)
+
+
+class CompiledPolicies(msgspec.Struct, kw_only=True):
+    invalid: set[str] = msgspec.field(default_factory=set)
+    static: set[str] = msgspec.field(default_factory=set)
+
+    def merge(self, other: 'CompiledPolicies') -> bool:
+        """
+        Adds policies from another entry of the same ruleset
+        :return: whether something new was added
+        """
+        size = len(self.invalid) + len(self.static)
+        self.invalid.update(other.invalid)
+        self.static.update(other.static)
+        return len(self.invalid) + len(self.static) != size
+
+    def known(self, name: str) -> bool:
+        return name in self.invalid or name in self.static
+
+
+class CompiledPoliciesCache:
+    """
+    Looks for an entry in the local directory first and then in the
+    bucket if a client is given. Entries found in the bucket are written
+    to the directory, so the following jobs of a long-living host do not
+    request it again
+    """
+    __slots__ = ('_directory', '_client', '_bucket', '_encoder', '_decoder')
+
+    prefix = 'compiled-policies/'
+
+    def __init__(self, directory: Path, client: S3Client | None = None,
+                 bucket: str | None = None):
+        """
+        :param directory: local directory with entries
+        :param client: S3 client to keep entries in the bucket as well
+        :param bucket: usually the rulesets bucket
+        """
+        self._directory = directory
+        self._client = client
+        self._bucket = bucket
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder(type=CompiledPolicies)
+
+    @staticmethod
+    def _name(ruleset_hash: str) -> str:
+        return f'{ruleset_hash}-{c7n_version}.json'
+
+    def _path(self, ruleset_hash: str) -> Path:
+        return self._directory / self._name(ruleset_hash)
+
+    def _key(self, ruleset_hash: str) -> str:
+        return self.prefix + self._name(ruleset_hash)
+
+    def _get_local(self, ruleset_hash: str) -> CompiledPolicies | None:
+        path = self._path(ruleset_hash)
+        try:
+            with open(path, 'rb') as file:
+                return self._decoder.decode(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, msgspec.DecodeError):
+            _LOG.warning(f'Cannot read compiled policies {path}. Ignoring',
+                         exc_info=True)
+            return None
+
+    def _put_local(self, ruleset_hash: str, item: CompiledPolicies) -> None:
+        """
+        Write is atomic, so parallel jobs do not see partial files
+        """
+        path = self._path(ruleset_hash)
+        try:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(self._encoder.encode(item))
+            os.replace(tmp, path)
+        except OSError:
+            _LOG.warning(f'Cannot write compiled policies {path}',
+                         exc_info=True)
+
+    def _get_remote(self, ruleset_hash: str) -> CompiledPolicies | None:
+        if not self._client:
+            return None
+        key = self._key(ruleset_hash)
+        try:
+            item = self._client.gz_get_json(self._bucket, key)
+            if item is None:
+                return None
+            return msgspec.convert(item, CompiledPolicies)
+        except Exception:  # the cache must not fail the job
+            _LOG.warning(f'Cannot read compiled policies {key}. Ignoring',
+                         exc_info=True)
+            return None
+
+    def _put_remote(self, ruleset_hash: str, item: CompiledPolicies) -> None:
+        key = self._key(ruleset_hash)
+        try:
+            self._client.gz_put_json(self._bucket, key, item)
+        except Exception:
+            _LOG.warning(f'Cannot write compiled policies {key}',
+                         exc_info=True)
+
+    def get(self, ruleset_hash: str) -> CompiledPolicies | None:
+        item = self._get_local(ruleset_hash)
+        if item is not None:
+            return item
+        item = self._get_remote(ruleset_hash)
+        if item is not None:
+            self._put_local(ruleset_hash, item)
+        return item
+
+    def put(self, ruleset_hash: str, item: CompiledPolicies) -> None:
+        """
+        Merges the item with the existing entries and writes the result
+        where something new was added. Concurrent jobs can overwrite the
+        entry in the bucket, then what one of them learnt is learnt again
+        """
+        local = self._get_local(ruleset_hash)
+        if local is None or local.merge(item):
+            self._put_local(ruleset_hash, local or item)
+        if not self._client:
+            return
+        remote = self._get_remote(ruleset_hash)
+        if remote is None or remote.merge(item):
+            self._put_remote(ruleset_hash, remote or item)
+
+
+def has_variables(data) -> bool:
+    """
+    Tells whether any string inside the policy data can be changed by
+    Policy.expand_variables. Conservative: any brace is enough
+    """
+    if isinstance(data, str):
+        return '{' in data or '}' in data
+    if isinstance(data, dict):
+        return any(map(has_variables, data.values()))
+    if isinstance(data, list):
+        return any(map(has_variables, data))
+    return False
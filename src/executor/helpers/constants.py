@@ -9,6 +9,12 @@ from helpers.constants import CAASEnv, Cloud
 class ExecutorMode(str, Enum):
     CONSISTENT = 'consistent'
     CONCURRENT = 'concurrent'
+    PARALLEL_PROCESSES = 'parallel_processes'
+
+
+class ProfileFormat(str, Enum):
+    SPEEDSCOPE = 'speedscope'
+    COLLAPSED = 'collapsed'
 
 
 ENV_AWS_ACCESS_KEY_ID = 'AWS_ACCESS_KEY_ID'
@@ -24,6 +30,20 @@ ENV_CLOUDSDK_CORE_PROJECT = 'CLOUDSDK_CORE_PROJECT'
 AWS_DEFAULT_REGION = 'us-east-1'
 
 DEFAULT_JOB_LIFETIME_MIN = 55
+# how many times a job that has reached its lifetime can be continued
+DEFAULT_MAX_CONTINUATIONS = 3
+
+# concurrent executor mode. Policies mostly wait for cloud APIs, so the
+# number of threads is not bound to the number of CPUs
+DEFAULT_EXECUTOR_THREADS = 32
+DEFAULT_GROUP_CONCURRENCY = 4
+DEFAULT_MAX_GROUP_CONCURRENCY = 16
+
+# threads that read outputs of policies after the scan
+DEFAULT_RESULT_WORKERS = 4
+
+# milliseconds between stack samples of the profiler
+DEFAULT_PROFILER_INTERVAL_MS = 10
 
 ENVS_TO_HIDE = {
     'PS1', 'PS2', 'PS3', 'PS4',
@@ -51,6 +71,20 @@ ACCESS_DENIED_ERROR_CODE = {
     Cloud.GOOGLE: set()
 }
 
+THROTTLING_ERROR_CODES = {
+    Cloud.AWS: {
+        'Throttling', 'ThrottlingException', 'ThrottledException',
+        'RequestThrottledException', 'TooManyRequestsException',
+        'ProvisionedThroughputExceededException',
+        'TransactionInProgressException', 'RequestLimitExceeded',
+        'BandwidthLimitExceeded', 'LimitExceededException',
+        'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+        'EC2ThrottledException'
+    },
+    Cloud.AZURE: set(),
+    Cloud.GOOGLE: set()
+}
+
 CACHE_FILE = 'cloud-custodian.cache'
 
 
@@ -1,22 +1,33 @@
+"""
+X-Ray tracing and statistical profiling of executor jobs. aws_xray_sdk is
+imported and libraries are patched only if a job is sampled, so that jobs
+which are not sampled do not pay for it at start.
+"""
+import functools
 import logging
+import random
+import sys
+import threading
 from abc import ABC, abstractmethod
-from typing import BinaryIO
+from collections import Counter
+from typing import TYPE_CHECKING, BinaryIO, Callable
 
 import msgspec
-from aws_xray_sdk.core import xray_recorder, patch
-from aws_xray_sdk.core.models.entity import Entity
-from aws_xray_sdk.core.sampling.local.sampler import LocalSampler
 
 from helpers.log_helper import get_logger
 
+if TYPE_CHECKING:
+    from aws_xray_sdk.core.models.entity import Entity
+    from aws_xray_sdk.core.recorder import AWSXRayRecorder
+
 _LOG = get_logger(__name__)
 
-patch(('requests', 'pymongo', 'botocore'))
+SAMPLING_RATE = .5  # 50% of jobs are sampled
 
 
 class Emitter(ABC):
     @abstractmethod
-    def send_entity(self, entity: Entity):
+    def send_entity(self, entity: 'Entity'):
         """
         Must write this entity data somewhere. Entity is a segment
         or subsegment
@@ -35,7 +46,7 @@ class BytesEmitter(Emitter):
         self._buffer = buffer
         self._encoder = msgspec.json.Encoder(enc_hook=str)
 
-    def send_entity(self, entity: Entity):
+    def send_entity(self, entity: 'Entity'):
         try:
             self._buffer.write(self._encoder.encode(entity.to_dict()))
             self._buffer.write(b'\n')
@@ -43,21 +54,194 @@ class BytesEmitter(Emitter):
             _LOG.exception('Failed to write entity to bytes buffer')
 
 
-SAMPLING_RULES = {
-    "version": 2,
-    "default": {
-        "fixed_target": 0,
-        "rate": .5  # 50% of jobs are sampled
-    },
-    "rules": [
-    ]
-}
-
-logging.getLogger('aws_xray_sdk').setLevel(logging.ERROR)
-xray_recorder.configure(
-    context_missing='IGNORE_ERROR',
-    sampling=True,
-    sampler=LocalSampler(SAMPLING_RULES),
-    service='custodian-executor',
-    streaming_threshold=1000
-)
+def _configured_recorder(emitter: Emitter) -> 'AWSXRayRecorder':
+    from aws_xray_sdk.core import patch, xray_recorder
+
+    patch(('requests', 'pymongo', 'botocore'))
+    logging.getLogger('aws_xray_sdk').setLevel(logging.ERROR)
+    xray_recorder.configure(
+        context_missing='IGNORE_ERROR',
+        sampling=False,  # decided by Tracer
+        service='custodian-executor',
+        streaming_threshold=1000,
+        emitter=emitter
+    )
+    return xray_recorder
+
+
+class Tracer:
+    """
+    Facade of X-Ray recorder that does nothing until a sampled segment
+    is begun
+    """
+    __slots__ = '_recorder',
+
+    def __init__(self):
+        self._recorder: 'AWSXRayRecorder | None' = None
+
+    @property
+    def sampled(self) -> bool:
+        return self._recorder is not None
+
+    def begin_segment(self, name: str, emitter: Emitter,
+                      rate: float = SAMPLING_RATE) -> bool:
+        """
+        Decides whether the job is sampled. Returns True if it is
+        """
+        if random.random() >= rate:
+            return False
+        self._recorder = _configured_recorder(emitter)
+        self._recorder.begin_segment(name)
+        return True
+
+    def end_segment(self) -> None:
+        if self._recorder is not None:
+            self._recorder.end_segment()
+
+    def capture(self, name: str) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self._recorder is None:
+                    return func(*args, **kwargs)
+                with self._recorder.in_subsegment(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def put_annotation(self, key: str, value) -> None:
+        if self._recorder is not None:
+            self._recorder.put_annotation(key, value)
+
+    def put_metadata(self, key: str, value) -> None:
+        if self._recorder is not None:
+            self._recorder.put_metadata(key, value)
+
+
+tracer = Tracer()
+
+
+Frame = tuple[str, str, int]  # function name, file, first line
+
+
+class StackSampler:
+    """
+    Statistical profiler. A daemon thread takes the stacks of all other
+    threads of the process every `interval` seconds and counts equal ones.
+    It measures wall time, so threads waiting for cloud APIs are sampled
+    as well as ones that use CPU. The root frame of each stack is the name
+    of its thread. Processes started by the job are not sampled unless
+    they start their own sampler
+    """
+    __slots__ = '_interval', '_stacks', '_stop', '_thread', '_tags'
+
+    def __init__(self):
+        self._interval = 0.
+        self._stacks: Counter[tuple[Frame, ...]] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._tags: dict[str, dict[str, None]] = {}  # ordered sets
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def samples(self) -> int:
+        return sum(self._stacks.values())
+
+    def start(self, interval: float) -> None:
+        """
+        :param interval: seconds between samples
+        """
+        if self._thread is not None:
+            return
+        self._interval = interval
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='stack-sampler')
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def put_tag(self, key: str, value: str) -> None:
+        """
+        Tags describe what was profiled: job id, tenants, clouds
+        """
+        if self._thread is not None:
+            self._tags.setdefault(key, {})[str(value)] = None
+
+    @property
+    def tags(self) -> dict[str, str]:
+        return {k: ','.join(v) for k, v in self._tags.items()}
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename,
+                                  code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append((names.get(ident, str(ident)), '', 0))
+                stack.reverse()
+                self._stacks[tuple(stack)] += 1
+
+    @staticmethod
+    def _frame_name(frame: Frame) -> str:
+        name, file, line = frame
+        if not file:
+            return name
+        return f'{name} ({file}:{line})'
+
+    def collapsed(self) -> bytes:
+        """
+        Brendan Gregg's collapsed stacks format, understood by
+        flamegraph.pl, speedscope and most other flame graph tools
+        """
+        return b''.join(
+            f'{";".join(map(self._frame_name, stack))} {count}\n'.encode()
+            for stack, count in self._stacks.most_common()
+        )
+
+    def speedscope(self) -> bytes:
+        """
+        Speedscope file format, https://www.speedscope.app. Tags go to the
+        name of the profile
+        """
+        frames: dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self._stacks.most_common():
+            samples.append([frames.setdefault(f, len(frames)) for f in stack])
+            weights.append(count * self._interval)
+        name = ' '.join(f'{k}={v}' for k, v in self.tags.items())
+        return msgspec.json.encode({
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'custodian-executor',
+            'activeProfileIndex': 0,
+            'shared': {'frames': [
+                {'name': n, 'file': f, 'line': line} if f else {'name': n}
+                for n, f, line in frames
+            ]},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            }]
+        })
+
+
+profiler = StackSampler()
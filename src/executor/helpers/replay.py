@@ -0,0 +1,294 @@
+"""
+Record and replay of cloud API responses. Recording mode captures responses
+that Cloud Custodian receives during a real scan into a directory, replay
+mode serves them back without network access and credentials, so that the
+executor can be benchmarked offline.
+
+Botocore requests are captured only for sessions that are created after the
+hooks are installed. Clients of the executor itself share a session that is
+created at import, so their S3 or MinIO requests go to the network as usual.
+Azure (requests) and Google (httplib2) ones are captured by host of the
+cloud API.
+
+Request bodies are not written, only their hashes. Responses are written as
+is, so fixtures can contain short-lived access tokens and resource data of
+the scanned account
+"""
+import hashlib
+import http
+import io
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import msgspec
+
+from helpers.log_helper import get_logger
+
+_LOG = get_logger(__name__)
+
+CLOUD_API_HOSTS = (
+    # Azure
+    'azure.com', 'azure.net', 'windows.net', 'microsoftonline.com',
+    'microsoft.com',
+    # Google
+    'googleapis.com',
+)
+_SKIPPED_HEADERS = {'set-cookie', 'status'}
+# requests and httplib2 decode bodies, so these do not apply to them anymore
+_ENCODING_HEADERS = {'content-encoding', '-content-encoding',
+                     'transfer-encoding', 'content-length'}
+
+
+class ReplayMissError(Exception):
+    """
+    Nothing was recorded for the request
+    """
+
+
+class Recording(msgspec.Struct, frozen=True):
+    method: str
+    url: str
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+
+def _to_bytes(body) -> bytes:
+    if isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode()
+    return b''  # streams and generators are not hashed
+
+
+def request_key(method: str, url: str, body=None) -> str:
+    h = hashlib.sha256(f'{method.upper()} {url}\n'.encode())
+    h.update(_to_bytes(body))
+    return h.hexdigest()[:32]
+
+
+def _headers(items, decoded: bool = True) -> dict[str, str]:
+    skipped = _SKIPPED_HEADERS | _ENCODING_HEADERS if decoded \
+        else _SKIPPED_HEADERS
+    return {
+        str(k).lower(): str(v) for k, v in items
+        if str(k).lower() not in skipped
+    }
+
+
+def _reason(status: int) -> str:
+    try:
+        return http.HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+
+class _Body(io.BytesIO):
+    """
+    Raw body of botocore AWSResponse
+    """
+    def stream(self, **kwargs):
+        yield self.read()
+
+
+class CloudApiCassette:
+    """
+    Installs hooks to botocore, requests and httplib2 that either write
+    responses to the given directory or serve them from there. In replay
+    mode equal requests get recorded responses in the order they were
+    recorded, the last one is repeated when they are exhausted. If the
+    body of a request differs from the recorded one (signed tokens,
+    timestamps), a response to a request with the same method and url is
+    served
+    """
+    def __init__(self, directory: Path, replay: bool = False,
+                 hosts: tuple[str, ...] = CLOUD_API_HOSTS):
+        """
+        :param directory: where responses are written to or read from
+        :param replay: serve recorded responses instead of writing them
+        :param hosts: requests to these hosts and their subdomains made
+        with requests and httplib2 are recorded
+        """
+        self._dir = Path(directory)
+        self._replay = replay
+        self._hosts = hosts
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters: dict[str, int] = defaultdict(int)
+        self._recorded: dict[str, list[Recording]] = {}
+        self._by_url: dict[tuple[str, str], list[Recording]] = {}
+        self._cursors: dict[str | tuple[str, str], int] = defaultdict(int)
+        self._undo = []
+
+    @property
+    def replay(self) -> bool:
+        return self._replay
+
+    def is_cloud_api(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ''
+        return any(host == h or host.endswith('.' + h) for h in self._hosts)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def _load(self) -> None:
+        decoder = msgspec.json.Decoder(Recording)
+        recorded = defaultdict(list)
+        by_url = defaultdict(list)
+        for path in sorted(self._dir.glob('*.json')):
+            recording = decoder.decode(path.read_bytes())
+            recorded[path.name.split('.', 1)[0]].append(recording)
+            by_url[(recording.method, recording.url)].append(recording)
+        self._recorded, self._by_url = dict(recorded), dict(by_url)
+        _LOG.info(f'{sum(map(len, recorded.values()))} cloud API responses '
+                  f'were loaded from {self._dir}')
+
+    def record(self, method: str, url: str, body, status: int,
+               headers: dict[str, str], content: bytes) -> None:
+        key = request_key(method, url, body)
+        with self._lock:
+            n = self._counters[key]
+            self._counters[key] += 1
+        recording = Recording(method=method.upper(), url=url, status=status,
+                              headers=headers, body=content)
+        self._dir.joinpath(f'{key}.{os.getpid()}.{n:06d}.json').write_bytes(
+            msgspec.json.encode(recording)
+        )
+
+    def play(self, method: str, url: str, body) -> Recording:
+        key = request_key(method, url, body)
+        recordings = self._recorded.get(key)
+        cursor = key
+        if not recordings:
+            cursor = (method.upper(), url)
+            recordings = self._by_url.get(cursor)
+        if not recordings:
+            raise ReplayMissError(f'No recorded response to {method} {url}')
+        with self._lock:
+            i = self._cursors[cursor]
+            self._cursors[cursor] += 1
+        return recordings[min(i, len(recordings) - 1)]
+
+    def install(self) -> None:
+        if self._undo:
+            return
+        if self._replay:
+            self._load()
+        else:
+            self._dir.mkdir(parents=True, exist_ok=True)
+        self._install_botocore()
+        self._install_requests()
+        self._install_httplib2()
+
+    def uninstall(self) -> None:
+        while self._undo:
+            self._undo.pop()()
+
+    # botocore
+    def _before_send(self, request, **kwargs):
+        if not self._replay:  # response is written by _before_parse
+            self._local.request = (request.method, request.url, request.body)
+            return
+        from botocore.awsrequest import AWSResponse
+
+        recording = self.play(request.method, request.url, request.body)
+        return AWSResponse(request.url, recording.status, recording.headers,
+                           _Body(recording.body))
+
+    def _before_parse(self, response_dict, **kwargs):
+        request = getattr(self._local, 'request', None)
+        self._local.request = None
+        body = response_dict.get('body')
+        if request is None or not isinstance(body, bytes):
+            return  # streaming output
+        self.record(
+            *request, status=response_dict['status_code'],
+            headers=_headers(response_dict['headers'].items(), decoded=False),
+            content=body
+        )
+
+    def _install_botocore(self) -> None:
+        """
+        Builtin handlers are registered by each new botocore session, the
+        ones that already exist are not affected
+        """
+        from botocore import handlers
+
+        specs = [('before-send', self._before_send)]
+        if not self._replay:
+            specs.append(('before-parse', self._before_parse))
+        handlers.BUILTIN_HANDLERS.extend(specs)
+
+        def undo():
+            for spec in specs:
+                handlers.BUILTIN_HANDLERS.remove(spec)
+        self._undo.append(undo)
+
+    # Azure
+    def _install_requests(self) -> None:
+        from requests.adapters import HTTPAdapter
+        from urllib3 import HTTPResponse
+
+        original = HTTPAdapter.send
+        cassette = self
+
+        def send(adapter, request, *args, **kwargs):
+            if not cassette.is_cloud_api(request.url):
+                return original(adapter, request, *args, **kwargs)
+            if not cassette.replay:
+                response = original(adapter, request, *args, **kwargs)
+                cassette.record(
+                    request.method, request.url, request.body,
+                    status=response.status_code,
+                    headers=_headers(response.headers.items()),
+                    content=response.content
+                )
+                return response
+            recording = cassette.play(request.method, request.url,
+                                      request.body)
+            return adapter.build_response(request, HTTPResponse(
+                body=io.BytesIO(recording.body),
+                headers=recording.headers,
+                status=recording.status,
+                reason=_reason(recording.status),
+                preload_content=False,
+                decode_content=False
+            ))
+
+        HTTPAdapter.send = send
+        self._undo.append(lambda: setattr(HTTPAdapter, 'send', original))
+
+    # Google
+    def _install_httplib2(self) -> None:
+        try:
+            import httplib2
+        except ImportError:
+            return
+        original = httplib2.Http.request
+        cassette = self
+
+        def request(h, uri, method='GET', body=None, *args, **kwargs):
+            if not cassette.is_cloud_api(uri):
+                return original(h, uri, method, body, *args, **kwargs)
+            if not cassette.replay:
+                response, content = original(h, uri, method, body, *args,
+                                             **kwargs)
+                cassette.record(method, uri, body, status=response.status,
+                                headers=_headers(response.items()),
+                                content=content)
+                return response, content
+            recording = cassette.play(method, uri, body)
+            response = httplib2.Response({**recording.headers,
+                                          'status': str(recording.status)})
+            response.reason = _reason(recording.status)
+            return response, recording.body
+
+        httplib2.Http.request = request
+        self._undo.append(lambda: setattr(httplib2.Http, 'request', original))
@@ -0,0 +1,190 @@
+"""
+In-process cache of described resources that is shared by all the policies
+of one job. Cloud Custodian creates a cache for each resource manager using
+c7n.cache.factory, so this module replaces that factory while installed.
+Resources are cached by Custodian's own key: account, region, resource
+type, source and query. Resources are saved only after they are augmented.
+Only one policy describes resources of a key at a time; other policies
+that need the same key wait for it instead of describing the same inventory
+"""
+import pickle  # nosec
+import threading
+from typing import Any, Callable
+
+from c7n import cache as c7n_cache
+from c7n.config import Config
+
+from helpers.log_helper import get_logger
+
+_LOG = get_logger(__name__)
+
+
+class ResourcesCache:
+    """
+    Thread-safe storage of pickled resources. Resources are kept pickled,
+    so each policy gets its own copy and annotations that are added by
+    filters of one policy are not visible to others
+    """
+    __slots__ = ('_lock', '_data', '_fetching', '_wait_timeout', '_factory',
+                 '_delegate_lock')
+
+    def __init__(self, wait_timeout: float = 600):
+        """
+        :param wait_timeout: max number of seconds to wait for resources
+        that are being described by another policy. After that the waiting
+        policy describes them itself
+        """
+        self._lock = threading.Lock()
+        self._data: dict[bytes, bytes] = {}
+        self._fetching: dict[bytes, threading.Event] = {}
+        self._wait_timeout = wait_timeout
+        self._factory: Callable[[Config], c7n_cache.Cache] | None = None
+        # Custodian file cache is not safe to be used by multiple threads
+        self._delegate_lock = threading.Lock()
+
+    @property
+    def installed(self) -> bool:
+        return self._factory is not None
+
+    def install(self) -> None:
+        """
+        Makes all the resource managers that are created after this call
+        use this cache. Does nothing if already installed
+        """
+        if self.installed:
+            return
+        _LOG.debug('Installing shared resources cache')
+        self._factory = c7n_cache.factory
+        c7n_cache.factory = self._cache_factory
+
+    def uninstall(self) -> None:
+        """
+        Restores Custodian cache factory and releases cached resources
+        """
+        if not self.installed:
+            return
+        c7n_cache.factory = self._factory
+        self._factory = None
+        with self._lock:
+            self._data.clear()
+            for event in self._fetching.values():
+                event.set()
+            self._fetching.clear()
+
+    def __enter__(self) -> 'ResourcesCache':
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    def _cache_factory(self, config: Config) -> c7n_cache.Cache:
+        delegate = self._factory(config)
+        if isinstance(delegate, c7n_cache.NullCache):
+            return delegate  # caching is disabled by config
+        return SharedCache(config, self, delegate, self._delegate_lock)
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(map(len, self._data.values()))
+
+    def acquire(self, key: bytes) -> tuple[bytes | None, bool]:
+        """
+        Returns cached resources by the key. If they are not cached, the
+        caller becomes responsible for describing them unless another
+        caller is already doing that. In such a case this method waits for
+        that caller.
+        :return: pickled resources or None and whether the caller must
+        release the key using `put` or `release`
+        """
+        while True:
+            with self._lock:
+                if (blob := self._data.get(key)) is not None:
+                    return blob, False
+                event = self._fetching.get(key)
+                if event is None:
+                    self._fetching[key] = threading.Event()
+                    return None, True
+            if not event.wait(self._wait_timeout):
+                _LOG.warning('Timed out waiting for resources to be '
+                             'described by another policy')
+                return None, False
+
+    def put(self, key: bytes, blob: bytes) -> None:
+        with self._lock:
+            self._data[key] = blob
+            event = self._fetching.pop(key, None)
+        if event:
+            event.set()
+
+    def release(self, key: bytes) -> None:
+        """
+        Lets one of waiting callers describe resources of this key
+        """
+        with self._lock:
+            event = self._fetching.pop(key, None)
+        if event:
+            event.set()
+
+
+class SharedCache(c7n_cache.Cache):
+    """
+    Cache of one resource manager. Uses shared in-memory resources cache in
+    front of the cache that Custodian would use otherwise
+    """
+
+    def __init__(self, config: Config, shared: ResourcesCache,
+                 delegate: c7n_cache.Cache, delegate_lock: threading.Lock):
+        super().__init__(config)
+        self._shared = shared
+        self._delegate = delegate
+        self._delegate_lock = delegate_lock
+        self._owned: set[bytes] = set()  # keys this manager must describe
+
+    def _delegated(self, method: Callable, *args) -> Any:
+        """
+        The delegate is used only once per key, so it's opened for each
+        call and calls are serialized
+        """
+        with self._delegate_lock:
+            self._delegate.load()
+            try:
+                return method(*args)
+            finally:
+                self._delegate.close()
+
+    def load(self) -> bool:
+        return True
+
+    def get(self, key: Any) -> list[dict] | None:
+        encoded = c7n_cache.encode(key)
+        if encoded in self._owned:
+            return None
+        blob, owned = self._shared.acquire(encoded)
+        if blob is not None:
+            return pickle.loads(blob)  # nosec
+        if not owned:
+            return None
+        self._owned.add(encoded)
+        resources = self._delegated(self._delegate.get, key)
+        if resources is not None:
+            self._put(encoded, resources)
+        return resources
+
+    def _put(self, encoded: bytes, data: list[dict]) -> None:
+        self._shared.put(
+            encoded, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        self._owned.discard(encoded)
+
+    def save(self, key: Any, data: list[dict]) -> None:
+        self._put(c7n_cache.encode(key), data)
+        self._delegated(self._delegate.save, key, data)
+
+    def size(self) -> int:
+        return self._shared.size()
+
+    def close(self) -> None:
+        # describing has failed or resources were not augmented
+        while self._owned:
+            self._shared.release(self._owned.pop())
@@ -0,0 +1,268 @@
+"""
+Adaptive scheduling of policies that call rate-limited cloud APIs. Policies
+are split into groups (a region and a service) and each group has its own
+concurrency limit that is adjusted using AIMD: additive increase while
+calls succeed, multiplicative decrease when the API throttles.
+Policies can also be ordered longest-first using their durations from the
+previous jobs, so that the slowest policies do not determine the tail of
+a job
+"""
+import statistics
+import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import (
+    Any,
+    Callable,
+    Generator,
+    Generic,
+    Hashable,
+    Iterable,
+    Mapping,
+    TYPE_CHECKING,
+    TypeVar,
+)
+
+from helpers.log_helper import get_logger
+
+if TYPE_CHECKING:
+    from services.clients.s3 import S3Client
+
+_LOG = get_logger(__name__)
+
+T = TypeVar('T')
+
+
+class AIMDLimit:
+    """
+    Concurrency limit of one group. It grows by one per window of
+    successful calls (a window is as many calls as the current limit) and
+    is halved when throttling is observed. Throttling that was observed
+    before the last decrease cannot decrease the limit again, so a burst
+    of throttled calls that is reported at once halves it only once
+    """
+    __slots__ = ('_value', '_min', '_max', '_decreased_at')
+
+    def __init__(self, initial: int, minimum: int = 1,
+                 maximum: int | None = None):
+        self._min = max(minimum, 1)
+        self._max = max(maximum or initial, self._min)
+        self._value = float(min(max(initial, self._min), self._max))
+        self._decreased_at = float('-inf')
+
+    @property
+    def value(self) -> int:
+        return int(self._value)
+
+    def increase(self) -> None:
+        self._value = min(self._value + 1 / self._value, self._max)
+
+    def decrease(self, observed_at: float) -> bool:
+        """
+        :param observed_at: monotonic time when throttling was observed
+        :return: whether the limit was decreased
+        """
+        if observed_at <= self._decreased_at:
+            return False
+        self._value = max(self._value / 2, self._min)
+        self._decreased_at = time.monotonic()
+        return True
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self._value:.2f}>'
+
+
+class AdaptiveScheduler(Generic[T]):
+    """
+    Runs items in a thread pool respecting concurrency limits of their
+    groups. Groups are served round-robin so one large group does not
+    occupy all the workers. After each completed item is yielded the
+    caller must report groups that were throttled using `feedback`, the
+    following items are submitted according to the updated limits
+    """
+    __slots__ = ('_workers', '_initial', '_min', '_max', '_limits',
+                 '_submitted')
+
+    def __init__(self, workers: int, initial: int, maximum: int,
+                 minimum: int = 1):
+        """
+        :param workers: total number of threads
+        :param initial: initial concurrency limit of each group
+        :param maximum: max concurrency limit of each group
+        :param minimum: min concurrency limit of each group
+        """
+        self._workers = max(workers, 1)
+        self._initial = initial
+        self._min = minimum
+        self._max = maximum
+        self._limits: dict[Hashable, AIMDLimit] = {}
+        # future -> its group
+        self._submitted: dict[Future, Hashable] = {}
+
+    def limit(self, group: Hashable) -> AIMDLimit:
+        limit = self._limits.get(group)
+        if limit is None:
+            limit = self._limits.setdefault(group, AIMDLimit(
+                initial=self._initial,
+                minimum=self._min,
+                maximum=self._max
+            ))
+        return limit
+
+    @property
+    def limits(self) -> dict[Hashable, int]:
+        return {group: limit.value for group, limit in self._limits.items()}
+
+    def feedback(self, future: Future,
+                 throttled: Mapping[Hashable, float] | None = None) -> None:
+        """
+        Adjusts limits after the item of the given future is completed
+        :param future: future that was yielded by `run`
+        :param throttled: groups that were throttled while this item was
+        running with monotonic time when throttling of each one was first
+        observed. The own group of the item is increased unless it's
+        among them
+        """
+        group = self._submitted.pop(future)
+        throttled = throttled or {}
+        for gr, observed_at in throttled.items():
+            if self.limit(gr).decrease(observed_at):
+                _LOG.info(f'Throttling observed. Concurrency limit of '
+                          f'{gr} is decreased to {self.limit(gr).value}')
+        if group not in throttled:
+            self.limit(group).increase()
+
+    def run(self, items: Iterable[T], group: Callable[[T], Hashable],
+            call: Callable[[T], Any]
+            ) -> Generator[tuple[T, Future], None, None]:
+        """
+        Yields items with their futures in order of completion
+        :param items:
+        :param group: returns a group of the given item
+        :param call: executed for each item inside a thread
+        """
+        pending: dict[Hashable, deque[T]] = {}
+        for item in items:
+            pending.setdefault(group(item), deque()).append(item)
+        running: dict[Hashable, int] = dict.fromkeys(pending, 0)
+        in_flight: dict[Future, T] = {}
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            while pending or in_flight:
+                submitted = True
+                while submitted and len(in_flight) < self._workers:
+                    submitted = False
+                    for gr in tuple(pending):
+                        if len(in_flight) >= self._workers:
+                            break
+                        if running[gr] >= self.limit(gr).value:
+                            continue
+                        item = pending[gr].popleft()
+                        if not pending[gr]:
+                            pending.pop(gr)
+                        future = executor.submit(call, item)
+                        self._submitted[future] = gr
+                        in_flight[future] = item
+                        running[gr] += 1
+                        submitted = True
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running[self._submitted[future]] -= 1
+                    yield in_flight.pop(future), future
+                    if future in self._submitted:  # no feedback given
+                        self.feedback(future)
+
+
+class PoliciesDurations:
+    """
+    Durations of policies in seconds by region and policy name. Each new
+    duration is averaged exponentially with the known one, so the profile
+    follows changes of the inventory without jumping because of one slow
+    execution
+    """
+    __slots__ = ('_data', '_alpha')
+
+    def __init__(self, data: dict[str, dict[str, float]] | None = None,
+                 alpha: float = 0.5):
+        """
+        :param data: {region: {policy: seconds}}
+        :param alpha: weight of a new duration
+        """
+        self._data = data or {}
+        self._alpha = alpha
+
+    @classmethod
+    def load(cls, client: 'S3Client', bucket: str, key: str
+             ) -> 'PoliciesDurations':
+        data = client.gz_get_json(bucket, key)
+        if not isinstance(data, dict):
+            _LOG.warning('Invalid policies durations file. Ignoring')
+            data = {}
+        return cls(data)
+
+    def save(self, client: 'S3Client', bucket: str, key: str) -> None:
+        client.gz_put_json(bucket, key, self._data)
+
+    def __len__(self) -> int:
+        return sum(map(len, self._data.values()))
+
+    def update(self, items: Iterable[dict]) -> None:
+        """
+        :param items: job statistics items with region, policy,
+        start_time and end_time
+        """
+        for item in items:
+            start, end = item.get('start_time'), item.get('end_time')
+            if start is None or end is None:
+                continue
+            duration = max(end - start, 0.)
+            policies = self._data.setdefault(item['region'], {})
+            known = policies.get(item['policy'])
+            if known is not None:
+                duration = self._alpha * duration + (1 - self._alpha) * known
+            policies[item['policy']] = round(duration, 3)
+
+    def get(self, region: str, policy: str) -> float | None:
+        """
+        Duration of the policy in the region. If the policy was not
+        executed in that region its average duration in other regions
+        is returned
+        """
+        duration = self._data.get(region, {}).get(policy)
+        if duration is not None:
+            return duration
+        other = [
+            policies[policy] for policies in self._data.values()
+            if policy in policies
+        ]
+        if other:
+            return statistics.fmean(other)
+        return None
+
+    def longest_first(self, items: Iterable[T],
+                      key: Callable[[T], tuple[str, str]]) -> list[T]:
+        """
+        Sorts items by their known durations in descending order. Items
+        without known durations are expected to take the median duration.
+        When items are taken by workers in this order, the longest ones
+        start first and the shorter ones fill the gaps
+        :param items:
+        :param key: returns region and policy name of an item
+        """
+        items = list(items)
+        estimates = [self.get(*key(item)) for item in items]
+        known = [e for e in estimates if e is not None]
+        if not known:
+            return items
+        default = statistics.median(known)
+        order = sorted(
+            range(len(items)),
+            key=lambda i: default if estimates[i] is None else estimates[i],
+            reverse=True
+        )
+        return [items[i] for i in order]
@@ -0,0 +1,172 @@
+"""
+Counting of throttled cloud API calls as they happen. Cloud SDKs retry
+throttled calls themselves, so a policy fails with a throttling error only
+when their retries are exhausted. The hooks of this module see each
+attempt, so the scheduler can decrease concurrency of the throttled group
+(a region and a service) before that.
+
+Botocore calls are counted only for sessions that are created after the
+hooks are installed. Azure (requests) and Google (httplib2) ones are
+recognized by host of the cloud API and are tagged with the global region
+because policies of these clouds are not regional
+"""
+import http
+import re
+import threading
+import time
+from typing import Hashable
+from urllib.parse import urlsplit
+
+from executor.helpers.constants import THROTTLING_ERROR_CODES
+from helpers.constants import Cloud, GLOBAL_REGION
+from helpers.log_helper import get_logger
+
+_LOG = get_logger(__name__)
+
+_AZURE_PROVIDER = re.compile(r'/providers/microsoft\.([a-z0-9]+)',
+                             re.IGNORECASE)
+
+
+def azure_service(url: str) -> str | None:
+    """
+    Service of Cloud Custodian Azure resource types by the url of ARM API
+    """
+    parts = urlsplit(url)
+    if parts.hostname != 'management.azure.com':
+        return
+    match = _AZURE_PROVIDER.search(parts.path)
+    if not match:  # subscriptions, resource groups
+        return 'azure.mgmt.resource'
+    return f'azure.mgmt.{match.group(1).lower()}'
+
+
+def google_service(url: str) -> str | None:
+    """
+    Service of Cloud Custodian Google resource types by the url of API
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if not host.endswith('.googleapis.com'):
+        return
+    if host == 'www.googleapis.com':  # www.googleapis.com/<service>/v1
+        return parts.path.strip('/').split('/', maxsplit=1)[0] or None
+    return host.split('.', maxsplit=1)[0]
+
+
+class ThrottlingCounter:
+    """
+    Installs hooks to botocore, requests and httplib2 that count throttled
+    responses by their group. Counted groups are drained by the scheduler
+    after each completed policy
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # group -> number of throttled calls and monotonic time of the
+        # first one since the last drain
+        self._pending: dict[Hashable, tuple[int, float]] = {}
+        self._total: dict[Hashable, int] = {}
+        self._undo = []
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.uninstall()
+
+    @property
+    def total(self) -> dict[Hashable, int]:
+        """
+        Number of throttled calls by group since the hooks were installed
+        """
+        with self._lock:
+            return dict(self._total)
+
+    def add(self, group: Hashable) -> None:
+        now = time.monotonic()
+        with self._lock:
+            count, first = self._pending.get(group, (0, now))
+            self._pending[group] = (count + 1, first)
+            self._total[group] = self._total.get(group, 0) + 1
+
+    def drain(self) -> dict[Hashable, float]:
+        """
+        Groups that were throttled since the previous drain with monotonic
+        time when the first throttled call of each one was observed
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for group, (count, _) in pending.items():
+            _LOG.debug(f'{count} throttled calls of {group}')
+        return {group: first for group, (_, first) in pending.items()}
+
+    def install(self) -> None:
+        if self._undo:
+            return
+        self._install_botocore()
+        self._install_requests()
+        self._install_httplib2()
+
+    def uninstall(self) -> None:
+        while self._undo:
+            self._undo.pop()()
+
+    # botocore
+    def _needs_retry(self, response, operation, request_dict, **kwargs):
+        """
+        Emitted after each attempt of a call. Returns nothing, so that
+        botocore's own retry handler decides whether to retry
+        """
+        if response is None:  # connection errors
+            return
+        http_response, parsed = response
+        code = parsed.get('Error', {}).get('Code')
+        if code not in THROTTLING_ERROR_CODES[Cloud.AWS] and \
+                http_response.status_code != http.HTTPStatus.TOO_MANY_REQUESTS:
+            return
+        region = request_dict.get('context', {}).get('client_region')
+        self.add((region or GLOBAL_REGION,
+                  operation.service_model.service_name))
+
+    def _install_botocore(self) -> None:
+        from botocore import handlers
+
+        spec = ('needs-retry', self._needs_retry)
+        handlers.BUILTIN_HANDLERS.append(spec)
+        self._undo.append(lambda: handlers.BUILTIN_HANDLERS.remove(spec))
+
+    # Azure
+    def _install_requests(self) -> None:
+        from requests.adapters import HTTPAdapter
+
+        original = HTTPAdapter.send
+        counter = self
+
+        def send(adapter, request, *args, **kwargs):
+            response = original(adapter, request, *args, **kwargs)
+            if response.status_code == http.HTTPStatus.TOO_MANY_REQUESTS \
+                    and (service := azure_service(request.url)):
+                counter.add((GLOBAL_REGION, service))
+            return response
+
+        HTTPAdapter.send = send
+        self._undo.append(lambda: setattr(HTTPAdapter, 'send', original))
+
+    # Google
+    def _install_httplib2(self) -> None:
+        try:
+            import httplib2
+        except ImportError:
+            return
+        original = httplib2.Http.request
+        counter = self
+
+        def request(h, uri, *args, **kwargs):
+            response, content = original(h, uri, *args, **kwargs)
+            if response.status == http.HTTPStatus.TOO_MANY_REQUESTS \
+                    and (service := google_service(uri)):
+                counter.add((GLOBAL_REGION, service))
+            return response, content
+
+        httplib2.Http.request = request
+        self._undo.append(lambda: setattr(httplib2.Http, 'request', original))
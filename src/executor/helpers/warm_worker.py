@@ -0,0 +1,121 @@
+"""
+Pre-warmed template of executor processes for on-prem installations.
+It imports Cloud Custodian with its resources and cloud SDKs once and then
+forks a new process for each job that it receives, so jobs do not spend
+seconds on interpreter start and imports. Each job gets its own process,
+so nothing is shared between jobs except the imported modules.
+
+It's launched by SubprocessBatchClient as a separate script and must not
+import modules of this project, because they read their environment at
+import time and each job has its own environment.
+
+Protocol: the parent writes json lines {"id": ..., "env": {...}} to stdin.
+The worker answers to the given file descriptor with {"id": ..., "pid": ...}
+when the job process is started and {"id": ..., "exit": ...} when it exits.
+The worker stops when its stdin is closed, running jobs are not affected
+"""
+import json
+import os
+import runpy
+import selectors
+import sys
+import traceback
+
+PRELOAD_RESOURCES = ('aws.*', 'azure.*', 'gcp.*', 'k8s.*')
+PRELOAD_MODULES = (
+    'boto3', 'botocore.session', 'msgspec', 'requests', 'pymongo',
+    'googleapiclient.discovery', 'google.auth', 'msrestazure.azure_exceptions'
+)
+
+
+def preload() -> None:
+    import importlib
+    from c7n.resources import load_resources
+
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    for rt in PRELOAD_RESOURCES:
+        try:
+            load_resources((rt,))
+        except Exception:  # provider is not installed
+            print(f'Cannot preload {rt} resources', file=sys.stderr)
+
+
+def run_job(script: str, env: dict) -> int:
+    """
+    Executed inside the forked job process
+    """
+    os.environ.clear()
+    os.environ.update(env)
+    sys.argv = [script]
+    try:
+        runpy.run_path(script, run_name='__main__')
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+
+
+def serve(script: str, out: int) -> None:
+    # the same sys.path as if the script was executed directly
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    preload()
+    responses = os.fdopen(out, 'w', buffering=1)
+    jobs: dict[int, str] = {}  # pid to job id
+
+    def send(item: dict) -> None:
+        responses.write(json.dumps(item) + '\n')
+
+    def start(request: dict) -> None:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                selector.close()
+                responses.close()
+                os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+                code = run_job(script, request['env'])
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        jobs[pid] = request['id']
+        send({'id': request['id'], 'pid': pid})
+
+    def reap() -> None:
+        while jobs:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            send({'id': jobs.pop(pid),
+                  'exit': os.waitstatus_to_exitcode(status)})
+
+    selector = selectors.DefaultSelector()
+    selector.register(0, selectors.EVENT_READ)
+    buffer = b''
+    while True:
+        if selector.select(timeout=1):
+            chunk = os.read(0, 65536)
+            if not chunk:
+                break  # parent is gone
+            *lines, buffer = (buffer + chunk).split(b'\n')
+            for line in filter(None, lines):
+                start(json.loads(line))
+        reap()
+    responses.close()
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], int(sys.argv[2]))
@@ -1,8 +1,19 @@
+import os
+from pathlib import Path
+import tempfile
+
 from typing_extensions import override
 
 from executor.helpers.constants import (ExecutorMode, AWS_DEFAULT_REGION,
-                                        DEFAULT_JOB_LIFETIME_MIN, ENVS_TO_HIDE,
-                                        HIDDEN_ENV_PLACEHOLDER)
+                                        DEFAULT_EXECUTOR_THREADS,
+                                        DEFAULT_GROUP_CONCURRENCY,
+                                        DEFAULT_JOB_LIFETIME_MIN,
+                                        DEFAULT_MAX_CONTINUATIONS,
+                                        DEFAULT_MAX_GROUP_CONCURRENCY,
+                                        DEFAULT_PROFILER_INTERVAL_MS,
+                                        ENVS_TO_HIDE,
+                                        HIDDEN_ENV_PLACEHOLDER,
+                                        ProfileFormat)
 from helpers.constants import (BatchJobEnv, BatchJobType, ENV_TRUE)
 from services.environment_service import EnvironmentService
 
@@ -103,6 +114,148 @@ class BatchEnvironmentService(EnvironmentService):
     def is_concurrent(self) -> bool:
         return self.executor_mode() == ExecutorMode.CONCURRENT
 
+    def executor_processes(self) -> int:
+        """
+        Number of worker processes for parallel_processes executor mode.
+        Number of CPUs by default
+        """
+        return self._positive_int(BatchJobEnv.EXECUTOR_PROCESSES,
+                                  os.cpu_count() or 1)
+
+    def _positive_int(self, name: str, default: int) -> int:
+        env = str(self._environment.get(name))
+        if env.isdigit() and int(env) > 0:
+            return int(env)
+        return default
+
+    def event_driven_processes(self) -> int:
+        """
+        Number of batch results (tenants) that an event-driven job processes
+        in parallel, each in its own process. One by default, that means
+        they are processed one by one in the main process
+        """
+        return self._positive_int(BatchJobEnv.EVENT_DRIVEN_PROCESSES, 1)
+
+    def executor_threads(self) -> int:
+        """
+        Total number of threads for concurrent executor mode
+        """
+        return self._positive_int(BatchJobEnv.EXECUTOR_THREADS,
+                                  DEFAULT_EXECUTOR_THREADS)
+
+    def executor_group_concurrency(self) -> int:
+        """
+        Initial number of policies of one region and service that can be
+        executed simultaneously in concurrent mode. The limit is adjusted
+        depending on observed API throttling
+        """
+        return self._positive_int(BatchJobEnv.EXECUTOR_GROUP_CONCURRENCY,
+                                  DEFAULT_GROUP_CONCURRENCY)
+
+    def executor_max_group_concurrency(self) -> int:
+        """
+        Max limit the concurrency of one group can grow to
+        """
+        return max(
+            self._positive_int(BatchJobEnv.EXECUTOR_MAX_GROUP_CONCURRENCY,
+                               DEFAULT_MAX_GROUP_CONCURRENCY),
+            self.executor_group_concurrency()
+        )
+
+    def checkpoint_key(self) -> str | None:
+        """
+        Present only for continuation jobs
+        """
+        return self._environment.get(BatchJobEnv.CHECKPOINT_KEY) or None
+
+    def continuation(self) -> int:
+        """
+        Number of continuation of the job, 0 for the first batch job
+        """
+        env = str(self._environment.get(BatchJobEnv.CONTINUATION))
+        if env.isdigit():
+            return int(env)
+        return 0
+
+    def max_continuations(self) -> int:
+        env = str(self._environment.get(BatchJobEnv.MAX_CONTINUATIONS))
+        if env.isdigit():
+            return int(env)
+        return DEFAULT_MAX_CONTINUATIONS
+
+    def can_continue(self) -> bool:
+        """
+        Whether the job can be continued by another batch job in case
+        it reaches its lifetime
+        """
+        return self.continuation() < self.max_continuations()
+
+    def policies_cache_dir(self) -> Path:
+        """
+        Directory where compiled policies are kept between jobs. Batch
+        containers are not reused, so it matters mostly for the on-prem
+        executor and mounted volumes. Entries are kept in the rulesets
+        bucket as well
+        """
+        env = self._environment.get(BatchJobEnv.POLICIES_CACHE_DIR)
+        if env:
+            return Path(env)
+        return Path(tempfile.gettempdir(), 'compiled-policies')
+
+    def skip_unchanged_shards(self) -> bool:
+        """
+        Whether to skip writing latest shards and meta which content is
+        not changed after the scan. Note that timestamps of such shard
+        parts are kept from the scan when their resources were changed
+        the last time
+        """
+        return str(
+            self._environment.get(BatchJobEnv.SKIP_UNCHANGED_SHARDS)
+        ).lower() in ENV_TRUE
+
+    def profiler_enabled(self) -> bool:
+        """
+        Whether to sample stacks of the job and write a profile to the
+        statistics bucket. Event-driven jobs with more than one process
+        also write a profile for each batch results process
+        """
+        return str(
+            self._environment.get(BatchJobEnv.PROFILER)
+        ).lower() in ENV_TRUE
+
+    def profiler_interval(self) -> float:
+        """
+        Seconds between stack samples
+        """
+        return self._positive_int(BatchJobEnv.PROFILER_INTERVAL_MS,
+                                  DEFAULT_PROFILER_INTERVAL_MS) / 1e3
+
+    def profiler_format(self) -> ProfileFormat:
+        _default = ProfileFormat.SPEEDSCOPE
+        env = self._environment.get(BatchJobEnv.PROFILER_FORMAT)
+        if not env:
+            return _default
+        try:
+            return ProfileFormat(env)
+        except ValueError:
+            return _default
+
+    def cloud_api_record_dir(self) -> Path | None:
+        """
+        Directory where responses of cloud APIs are recorded to be replayed
+        by benchmarks later
+        """
+        env = self._environment.get(BatchJobEnv.CLOUD_API_RECORD_DIR)
+        return Path(env) if env else None
+
+    def cloud_api_replay_dir(self) -> Path | None:
+        """
+        Directory with recorded responses of cloud APIs. If set, the job
+        does not make requests to clouds
+        """
+        env = self._environment.get(BatchJobEnv.CLOUD_API_REPLAY_DIR)
+        return Path(env) if env else None
+
     def scheduled_job_name(self) -> str | None:
         return self._environment.get(BatchJobEnv.SCHEDULED_JOB_NAME) or None
 
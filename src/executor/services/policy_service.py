@@ -1,4 +1,5 @@
 import hashlib
+import os
 import tempfile
 from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
@@ -115,17 +116,38 @@ class PoliciesService:
                       f'been downloaded. Returning path to it.')
             return path
 
+        path.with_suffix('.hash').unlink(missing_ok=True)
         ruleset = self._ruleset_service.get_latest_event_driven(cloud)
-        if ruleset:
-            with open(path, 'wb') as file:
+        # parallel processes can download it at the same time, so the
+        # file appears only when it's complete
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            if ruleset:
                 self._ruleset_service.download(ruleset, file)
-        else:
-            _LOG.warning(f'Event-driven ruleset item for cloud {cloud} not '
-                         f'found in DB. Creating an empty one')
-            with open(path, 'wb') as file:
+            else:
+                _LOG.warning(f'Event-driven ruleset item for cloud {cloud} '
+                             f'not found in DB. Creating an empty one')
                 file.write(b'{"policies": []}')
+        os.replace(tmp, path)
         return path
 
+    def ruleset_hash(self, path: Path) -> str:
+        """
+        Hash of the policies of a local ruleset file. It's calculated once
+        and kept next to the file
+        """
+        hash_path = path.with_suffix('.hash')
+        if hash_path.exists():
+            return hash_path.read_text()
+        with open(path, 'rb') as file:
+            payload = msgspec.json.decode(file.read())
+        value = self._ruleset_service.payload_hash(payload)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            file.write(value)
+        os.replace(tmp, hash_path)
+        return value
+
     def separate_ruleset(self, from_: Path,
                          keep: set[str] | None = None,
                          exclude: set[str] | None = None) -> list[PolicyDict]:
@@ -1,15 +1,24 @@
+import io
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Generator, TypedDict, Iterable, cast
+from typing import Generator, TypedDict, Iterable, cast, TYPE_CHECKING
 
 import msgspec
 from c7n.provider import get_resource_class
 from c7n.resources import load_resources
 from modular_sdk.models.tenant import Tenant
 
-from helpers import json_path_get
+from executor.helpers.constants import DEFAULT_RESULT_WORKERS
+from helpers import JsonPath, compile_json_path, json_path_steps_get
 from helpers.constants import (Cloud, GLOBAL_REGION, PolicyErrorType)
 from helpers.log_helper import get_logger
-from services.sharding import LazyPickleShardPart
+from services.sharding import SpillStore, SpilledShardPart
+
+if TYPE_CHECKING:
+    from services.clients.s3 import S3Client
 
 _LOG = get_logger(__name__)
 
@@ -55,6 +64,8 @@ class ReportFieldsLoader:
         date: str | None
 
     _mapping: dict[str, Fields] = {}
+    _accessors: dict[str, tuple[tuple[str, JsonPath], ...]] = {}
+    _loaded: set[str] = set()
 
     @classmethod
     def _load_for_resource_type(cls, rt: str) -> Fields | None:
@@ -95,6 +106,19 @@ class ReportFieldsLoader:
             cls._mapping[rt] = fields
         return cls._mapping[rt]
 
+    @classmethod
+    def accessors(cls, rt: str) -> tuple[tuple[str, JsonPath], ...]:
+        """
+        Report fields of the resource type with their compiled paths.
+        Fields without paths are skipped
+        """
+        if rt not in cls._accessors:
+            cls._accessors[rt] = tuple(
+                (field, compile_json_path(path))
+                for field, path in cls.get(rt).items() if path
+            )
+        return cls._accessors[rt]
+
     @classmethod
     def load(cls, resource_types: tuple = ('*',)):
         """
@@ -104,7 +128,11 @@ class ReportFieldsLoader:
         :param resource_types:
         :return:
         """
-        load_resources(set(resource_types))
+        to_load = set(resource_types) - cls._loaded
+        if not to_load:
+            return
+        load_resources(to_load)
+        cls._loaded.update(to_load)
 
 
 class RuleRawMetadata:
@@ -192,6 +220,22 @@ class RuleRawOutput:
         return self.resources is not None
 
 
+class IngestedRule:
+    """
+    What is left of one rule output after it was read: its metadata and
+    shard parts with spilled resources
+    """
+    __slots__ = ('region', 'rule', 'metadata', 'was_executed', 'parts')
+
+    def __init__(self, region: str, rule: str, metadata: RuleRawMetadata,
+                 was_executed: bool):
+        self.region = region
+        self.rule = rule
+        self.metadata = metadata
+        self.was_executed = was_executed
+        self.parts: list[SpilledShardPart] = []
+
+
 class JobResult:
     class FormattedItem(TypedDict):  # our detailed report item
         policy: dict
@@ -199,11 +243,28 @@ class JobResult:
 
     RegionRuleOutput = tuple[str, str, RuleRawOutput]
 
-    def __init__(self, work_dir: Path, cloud: Cloud):
+    def __init__(self, work_dir: Path, cloud: Cloud,
+                 workers: int = DEFAULT_RESULT_WORKERS):
+        """
+        :param work_dir:
+        :param cloud:
+        :param workers: number of threads that read rules outputs
+        """
         self._work_dir = work_dir
         self._cloud = cloud
+        self._workers = workers
 
         self._res_decoded = msgspec.json.Decoder(type=list[dict])
+        self._spill = SpillStore()
+        self._fields_lock = threading.Lock()
+        self._rules: list[IngestedRule] | None = None
+
+    def close(self) -> None:
+        """
+        Releases the storage that keeps resources of yielded shard parts.
+        The parts must not be used after that
+        """
+        self._spill.close()
 
     @staticmethod
     def cloud_to_resource_type_prefix() -> dict[Cloud, str]:
@@ -252,26 +313,28 @@ class JobResult:
         """
         assert output.was_executed, 'You must provide this method only with policies that was executed without exceptions'  # noqa
         rt = self.adjust_resource_type(output.metadata.resource_type)
-        ReportFieldsLoader.load((rt,))  # should be loaded before
-        fields = ReportFieldsLoader.get(rt)
-        for res in output.resources:
-            for field, path in fields.items():
-                if not path:
-                    continue
-                val = json_path_get(res, path)
+        with self._fields_lock:
+            ReportFieldsLoader.load((rt,))  # should be loaded before
+            accessors = ReportFieldsLoader.accessors(rt)
+        self.extend_resources(output.resources, accessors)
+
+    @staticmethod
+    def extend_resources(resources: list[dict],
+                         accessors: tuple[tuple[str, JsonPath], ...]) -> None:
+        """
+        Sets report fields of all the resources of one resource type.
+        Most fields are top-level keys, they are read without walking a path
+        """
+        for res in resources:
+            for field, steps in accessors:
+                if len(steps) == 1 and isinstance(steps[0], str):
+                    val = res.get(steps[0])
+                else:
+                    val = json_path_steps_get(res, steps)
                 if not val:
                     continue
                 res[field] = val
 
-    def iter_raw(self) -> Generator[RegionRuleOutput, None, None]:
-        dirs = filter(Path.is_dir, self._work_dir.iterdir())
-        for region in dirs:
-            for rule in filter(Path.is_dir, region.iterdir()):
-                loaded = self._load_raw_rule_output(rule)
-                if not loaded:
-                    continue
-                yield region.name, rule.name, loaded
-
     @staticmethod
     def resolve_azure_locations(it: Iterable[RegionRuleOutput]
                                 ) -> Generator[RegionRuleOutput, None, None]:
@@ -312,11 +375,51 @@ class JobResult:
                     resources=resources
                 )
 
-    def build_default_iterator(self) -> Iterable[RegionRuleOutput]:
-        it = self.iter_raw()
+    def _ingest_rule(self, region: str, root: Path) -> IngestedRule:
+        output = self._load_raw_rule_output(root)
+        item = IngestedRule(
+            region=region,
+            rule=root.name,
+            metadata=output.metadata,
+            was_executed=output.was_executed
+        )
+        if not output.was_executed:
+            return item
+        it = [(region, root.name, output)]
         if self._cloud == Cloud.AZURE:
             it = self.resolve_azure_locations(it)
-        return it
+        for location, rule, loc_output in it:
+            self._extend_resources(loc_output)
+            item.parts.append(SpilledShardPart.from_resources(
+                store=self._spill,
+                resources=loc_output.resources,
+                policy=rule,
+                location=location
+            ))
+        return item
+
+    def ingest(self) -> list[IngestedRule]:
+        """
+        Reads each rule directory once. Resources are extended with report
+        fields and spilled right away, so only metadata stays in memory.
+        Statistics, meta and shard parts are built from the result of
+        the first call
+        :return:
+        """
+        if self._rules is not None:
+            return self._rules
+        regions, roots = [], []
+        for region in filter(Path.is_dir, self._work_dir.iterdir()):
+            for rule in filter(Path.is_dir, region.iterdir()):
+                regions.append(region.name)
+                roots.append(rule)
+        _LOG.info(f'Reading outputs of {len(roots)} rules')
+        if self._workers > 1 and len(roots) > 1:
+            with ThreadPoolExecutor(max_workers=self._workers) as ex:
+                self._rules = list(ex.map(self._ingest_rule, regions, roots))
+        else:
+            self._rules = list(map(self._ingest_rule, regions, roots))
+        return self._rules
 
     def statistics(self, tenant: Tenant, failed: dict) -> list[dict]:
         """
@@ -327,8 +430,9 @@ class JobResult:
         """
         failed = failed or {}
         res = []
-        for region, rule, output in self.iter_raw():
-            metadata = output.metadata
+        for ingested in self.ingest():
+            region, rule = ingested.region, ingested.rule
+            metadata = ingested.metadata
             item = {
                 'policy': rule,
                 'region': region,
@@ -338,7 +442,7 @@ class JobResult:
                 'end_time': metadata.end_time,
                 'api_calls': metadata.api_calls,
             }
-            if output.was_executed:
+            if ingested.was_executed:
                 item['scanned_resources'] = metadata.all_resources_count
                 item['failed_resources'] = metadata.failed_resources_count
             elif _failed := failed.get((region, rule)):
@@ -352,16 +456,9 @@ class JobResult:
             res.append(item)
         return res
 
-    def iter_shard_parts(self) -> Generator[LazyPickleShardPart, None, None]:
-        for region, rule, output in self.build_default_iterator():
-            if not output.was_executed:
-                continue
-            self._extend_resources(output)  # todo use ijson
-            yield LazyPickleShardPart.from_resources(
-                resources=output.resources,
-                policy=rule,
-                location=region
-            )
+    def iter_shard_parts(self) -> Generator[SpilledShardPart, None, None]:
+        for ingested in self.ingest():
+            yield from ingested.parts
 
     def rules_meta(self) -> dict[str, dict]:
         """
@@ -370,12 +467,83 @@ class JobResult:
         :return:
         """
         result = {}
-        for _, rule, output in self.iter_raw():
+        for ingested in self.ingest():
             meta = {
-                k: v for k, v in output.metadata.policy.items()
+                k: v for k, v in ingested.metadata.policy.items()
                 if k not in ('filters', 'name')
             }
             if 'resource' in meta:
                 meta['resource'] = self.adjust_resource_type(meta['resource'])
-            result.setdefault(rule, {}).update(meta)
+            result.setdefault(ingested.rule, {}).update(meta)
         return result
+
+
+class JobCheckpoint:
+    """
+    Outputs of policies that were executed before a job reached its
+    lifetime together with policies that have failed. A continuation job
+    restores them to its work dir and executes only the remaining
+    policies, so its JobResult contains the outputs of all the attempts
+    """
+    __slots__ = ('_work_dir',)
+
+    FailedPolicies = dict[
+        tuple[str, str],
+        tuple[PolicyErrorType, str | None, list[str]]
+    ]
+    _failed = 'failed.json'
+
+    def __init__(self, work_dir: Path):
+        self._work_dir = work_dir
+
+    def completed(self) -> set[tuple[str, str]]:
+        """
+        Regions and names of policies which outputs are in the work dir.
+        Failed policies have outputs as well
+        """
+        return {
+            (region.name, rule.name)
+            for region in filter(Path.is_dir, self._work_dir.iterdir())
+            for rule in filter(Path.is_dir, region.iterdir())
+            if (rule / 'metadata.json').exists()
+        }
+
+    def save(self, client: 'S3Client', bucket: str, key: str,
+             failed: FailedPolicies) -> None:
+        data = msgspec.json.encode([
+            (region, policy, *item) for (region, policy), item in
+            failed.items()
+        ])
+        info = tarfile.TarInfo(self._failed)
+        info.size = len(data)
+        with tempfile.TemporaryFile() as fp:
+            with tarfile.open(fileobj=fp, mode='w:gz') as tar:
+                for path in self._work_dir.iterdir():
+                    tar.add(path, arcname=path.name)
+                tar.addfile(info, io.BytesIO(data))
+            fp.seek(0)
+            client.put_object(bucket, key, fp,
+                              content_type='application/gzip')
+
+    def restore(self, client: 'S3Client', bucket: str, key: str
+                ) -> FailedPolicies:
+        """
+        Extracts outputs of the checkpoint to the work dir
+        :return: failed policies of the previous attempts
+        """
+        with tempfile.TemporaryFile() as fp:
+            if not client.get_object(bucket, key, fp):
+                _LOG.warning(f'Checkpoint {key} does not exist')
+                return {}
+            fp.seek(0)
+            with tarfile.open(fileobj=fp, mode='r:gz') as tar:
+                failed = tar.extractfile(self._failed).read()
+                members = [m for m in tar if m.name != self._failed]
+                kw = {}
+                if hasattr(tarfile, 'data_filter'):
+                    kw['filter'] = 'data'
+                tar.extractall(self._work_dir, members=members, **kw)
+        return {
+            (region, policy): (PolicyErrorType(et), message, tb)
+            for region, policy, et, message, tb in msgspec.json.decode(failed)
+        }
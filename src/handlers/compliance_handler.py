@@ -105,9 +105,8 @@ class ComplianceReportHandler(AbstractHandler):
         else:
             collection = self._report_service.ed_job_collection(tenant,
                                                                 job.job)
-        collection.fetch_all()
-        coverages = self._coverage_service.coverage_from_collection(
-            collection, modular_helpers.tenant_cloud(tenant)
+        coverages = self._coverage_service.coverage_from_parts(
+            collection.iter_stored_parts(), modular_helpers.tenant_cloud(tenant)
         )
         response = ReportResponse(job, coverages, event.format)
         match event.format:
@@ -143,9 +142,8 @@ class ComplianceReportHandler(AbstractHandler):
                 code=HTTPStatus.BAD_REQUEST
             )
         collection = self._report_service.tenant_latest_collection(tenant)
-        collection.fetch_all()
-        coverages = self._coverage_service.coverage_from_collection(
-            collection, cloud
+        coverages = self._coverage_service.coverage_from_parts(
+            collection.iter_stored_parts(), cloud
         )
         response = ReportResponse(tenant, coverages, event.format)
         match event.format:
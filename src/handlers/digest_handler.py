@@ -87,8 +87,9 @@ class DigestReportHandler(AbstractHandler):
         :param job:
         :return:
         """
-        collection.fetch_all()
-        report = ShardsCollectionDigestConvertor().convert(collection)
+        report = ShardsCollectionDigestConvertor().convert_parts(
+            collection.iter_stored_parts()
+        )
         return ReportResponse(job, report, ReportFormat.JSON).dict()
 
     @validate_kwargs
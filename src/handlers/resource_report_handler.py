@@ -77,6 +77,25 @@ class MatchedResourcesIterator(Iterator[Payload]):
     def collection(self) -> ShardsCollection:
         return self._collection
 
+    def fetch(self) -> None:
+        """
+        Fetches only those parts of the collection that can be matched by
+        region and resource type. Meta of the collection must be already
+        fetched because policies are resolved by resource type from it
+        """
+        policies = None
+        if self._resource_type:
+            policies = self.metrics_service.resource_type_policies(
+                self._collection.meta, self._resource_type
+            )
+            if not policies:
+                _LOG.debug(f'No policies for {self._resource_type}')
+                return
+        self._collection.fetch_parts(
+            policies=policies,
+            locations={self._region} if self._region else None
+        )
+
     def create_resources_generator(self) -> ResourcesGenerator:
         """
         See metrics_service.create_resources_generator
@@ -416,8 +435,6 @@ class ResourceReportHandler(AbstractHandler):
             return build_response(code=HTTPStatus.NOT_FOUND,
                                   content='Platform not found')
         collection = self._report_service.platform_latest_collection(platform)
-        _LOG.debug('Fetching collection')
-        collection.fetch_all()
         _LOG.debug('Fetching meta')
         collection.fetch_meta()
 
@@ -431,6 +448,8 @@ class ResourceReportHandler(AbstractHandler):
             search_by=event.extras,
             dictionary_out=dictionary if event.obfuscated else None
         )
+        _LOG.debug('Fetching collection')
+        matched.fetch()
         content = {}
         match event.format:
             case ReportFormat.JSON:
@@ -474,13 +493,6 @@ class ResourceReportHandler(AbstractHandler):
         modular_helpers.assert_tenant_valid(tenant_item, event.customer)
 
         collection = self._report_service.tenant_latest_collection(tenant_item)
-        if event.region:
-            _LOG.debug('Region is provided. Fetching only shard with '
-                       'this region')
-            collection.fetch(region=event.region)
-        else:
-            _LOG.debug('Region is not provided. Fetching all shards')
-            collection.fetch_all()
         _LOG.debug('Fetching meta')
         collection.fetch_meta()
 
@@ -495,6 +507,8 @@ class ResourceReportHandler(AbstractHandler):
             search_by=event.extras,
             dictionary_out=dictionary if event.obfuscated else None
         )
+        _LOG.debug('Fetching collection')
+        matched.fetch()
         content = {}
         match event.format:
             case ReportFormat.JSON:
@@ -557,13 +571,6 @@ class ResourceReportHandler(AbstractHandler):
                 collection = self._report_service.ed_job_collection(
                     tenant_item, source.job
                 )
-            if event.region:
-                _LOG.debug('Region is provided. Fetching only shard with '
-                           'this region')
-                collection.fetch(region=event.region)
-            else:
-                _LOG.debug('Region is not provided. Fetching all shards')
-                collection.fetch_all()
             collection.meta = self._report_service.fetch_meta(tenant_item)
             matched = MatchedResourcesIterator(
                 collection=collection,
@@ -573,6 +580,7 @@ class ResourceReportHandler(AbstractHandler):
                 search_by_all=event.search_by_all,
                 search_by=event.extras
             )
+            matched.fetch()
             response = ResourceReportBuilder(
                 matched_findings_iterator=matched,
                 entity=tenant_item,
@@ -609,13 +617,6 @@ class ResourceReportHandler(AbstractHandler):
         else:
             collection = self._report_service.ed_job_collection(tenant,
                                                                 job.job)
-        if event.region:
-            _LOG.debug('Region is provided. Fetching only shard with '
-                       'this region')
-            collection.fetch(region=event.region)
-        else:
-            _LOG.debug('Region is not provided. Fetching all shards')
-            collection.fetch_all()
         collection.meta = self._report_service.fetch_meta(tenant)
 
         dictionary_url = None
@@ -629,6 +630,7 @@ class ResourceReportHandler(AbstractHandler):
             search_by=event.extras,
             dictionary_out=dictionary if event.obfuscated else None
         )
+        matched.fetch()
         response = ResourceReportBuilder(
             matched_findings_iterator=matched,
             entity=tenant,
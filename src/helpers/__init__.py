@@ -300,6 +300,48 @@ class NotHereDescriptor:
 JSON_PATH_LIST_INDEXES = re.compile(r'\w*\[(-?\d+)\]')
 
 
+JsonPath = tuple[str | int, ...]
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_json_path(path: str) -> JsonPath:
+    """
+    Parses a path for json_path_get once. Keys are strings and list
+    indexes are integers
+    >>> compile_json_path('$.c[-1][0].b')
+    ('c', -1, 0, 'b')
+    >>> compile_json_path('[-1].one')
+    (-1, 'one')
+    """
+    if path.startswith('$'):
+        path = path[1:]
+    if path.startswith('.'):
+        path = path[1:]
+    steps = []
+    for part in path.split('.'):
+        _key = part.split('[')[0]
+        if _key:
+            steps.append(_key)
+        steps.extend(map(int, re.findall(JSON_PATH_LIST_INDEXES, part)))
+    return tuple(steps)
+
+
+def json_path_steps_get(d: dict | list, steps: JsonPath) -> Any:
+    """
+    The same as json_path_get but with a compiled path
+    """
+    item = d
+    try:
+        for step in steps:
+            if isinstance(step, str):
+                item = item.get(step)
+            else:
+                item = item[step]
+    except (IndexError, TypeError, AttributeError):
+        return None
+    return item
+
+
 def json_path_get(d: dict | list, path: str) -> Any:
     """
     Simple json paths with only basic operations supported
@@ -310,25 +352,7 @@ def json_path_get(d: dict | list, path: str) -> Any:
     >>> json_path_get([-1, {'one': 'two'}], '[-1].one')
     'two'
     """
-    if path.startswith('$'):
-        path = path[1:]
-    if path.startswith('.'):
-        path = path[1:]
-    parts = path.split('.')
-
-    item = d
-    for part in parts:
-        try:
-            _key = part.split('[')[0]
-            _indexes = re.findall(JSON_PATH_LIST_INDEXES, part)
-            if _key:
-                item = item.get(_key)
-            for i in _indexes:
-                item = item[int(i)]
-        except (IndexError, TypeError, AttributeError):
-            item = None
-            break
-    return item
+    return json_path_steps_get(d, compile_json_path(path))
 
 
 FT = TypeVar('FT', bound=BinaryIO)  # file type
@@ -0,0 +1,167 @@
+"""
+Compression codecs for objects that we keep in S3. Each codec has its own
+key extension and content encoding, so objects that were written by one
+codec are never confused with objects written by another one
+"""
+import gzip
+import io
+import shutil
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterable
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+
+class Codec(ABC):
+    name: str  # used as Content-Encoding
+    extension: str
+
+    def key(self, key: str) -> str:
+        if not key.endswith(self.extension):
+            key = key.strip('.') + self.extension
+        return key
+
+    @abstractmethod
+    def compress_stream(self, src: BinaryIO, dst: BinaryIO) -> None:
+        """
+        Reads the whole source stream and writes compressed data to the
+        destination
+        """
+
+    @abstractmethod
+    def decompress_stream(self, src: BinaryIO, dst: BinaryIO) -> None:
+        """
+        Reads the whole compressed source and writes decompressed data to
+        the destination
+        """
+
+    @abstractmethod
+    def reader(self, src: BinaryIO) -> BinaryIO:
+        """
+        Returns file-like object that decompresses the source lazily.
+        Can be iterated over lines
+        """
+
+    def compress(self, data: bytes) -> bytes:
+        dst = io.BytesIO()
+        self.compress_stream(io.BytesIO(data), dst)
+        return dst.getvalue()
+
+    def decompress(self, data: bytes | memoryview) -> bytes:
+        dst = io.BytesIO()
+        self.decompress_stream(io.BytesIO(data), dst)
+        return dst.getvalue()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__} {self.name}>'
+
+
+class GzipCodec(Codec):
+    name = 'gzip'
+    extension = '.gz'
+
+    def __init__(self, level: int | None = None):
+        self._level = 9 if level is None else level
+
+    def compress_stream(self, src: BinaryIO, dst: BinaryIO) -> None:
+        with gzip.GzipFile(fileobj=dst, mode='wb',
+                           compresslevel=self._level) as gz:
+            shutil.copyfileobj(src, gz)
+
+    def decompress_stream(self, src: BinaryIO, dst: BinaryIO) -> None:
+        with gzip.GzipFile(fileobj=src, mode='rb') as gz:
+            shutil.copyfileobj(gz, dst)
+
+    def reader(self, src: BinaryIO) -> BinaryIO:
+        return gzip.GzipFile(fileobj=src, mode='rb')
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self._level)
+
+    def decompress(self, data: bytes | memoryview) -> bytes:
+        return gzip.decompress(data)
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard codec. Optionally uses a dictionary that was trained on
+    samples of similar objects. Objects that are compressed with a
+    dictionary can be decompressed only with the same dictionary
+    """
+    name = 'zstd'
+    extension = '.zst'
+
+    def __init__(self, level: int | None = None,
+                 dictionary: bytes | None = None):
+        if zstandard is None:
+            raise RuntimeError('zstandard must be installed to use zstd')
+        self._level = 3 if level is None else level
+        self._dict = None
+        if dictionary:
+            self._dict = zstandard.ZstdCompressionDict(dictionary)
+
+    # compressors and decompressors are not thread-safe, so they are
+    # created for each call. It's cheap comparing to compression itself
+
+    def _compressor(self) -> 'zstandard.ZstdCompressor':
+        return zstandard.ZstdCompressor(level=self._level,
+                                        dict_data=self._dict)
+
+    def _decompressor(self) -> 'zstandard.ZstdDecompressor':
+        return zstandard.ZstdDecompressor(dict_data=self._dict)
+
+    def compress_stream(self, src: BinaryIO, dst: BinaryIO) -> None:
+        self._compressor().copy_stream(src, dst)
+
+    def decompress_stream(self, src: BinaryIO, dst: BinaryIO) -> None:
+        self._decompressor().copy_stream(src, dst)
+
+    def reader(self, src: BinaryIO) -> BinaryIO:
+        # zstd reader does not support readline itself
+        return io.BufferedReader(self._decompressor().stream_reader(src))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor().compress(data)
+
+    def decompress(self, data: bytes | memoryview) -> bytes:
+        # does not require content size to be written to the frame
+        return self._decompressor().decompressobj().decompress(data)
+
+
+GZIP = GzipCodec()
+
+
+def build_codec(name: str | None = None, level: int | None = None,
+                dictionary: bytes | None = None) -> Codec:
+    """
+    :param name: codec name, gzip is used by default
+    :param level: compression level, codec default is used if not given
+    :param dictionary: trained dictionary, only for zstd
+    :return:
+    """
+    match name:
+        case None | GzipCodec.name:
+            if level is None:
+                return GZIP
+            return GzipCodec(level)
+        case ZstdCodec.name:
+            return ZstdCodec(level, dictionary)
+        case _:
+            raise ValueError(f'Not supported codec: {name}')
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 1 << 16
+                     ) -> bytes:
+    """
+    Trains zstd dictionary on samples of objects that will be compressed.
+    The more samples resemble the real data the better the ratio
+    :param samples:
+    :param size: max size of the dictionary in bytes
+    :return:
+    """
+    if zstandard is None:
+        raise RuntimeError('zstandard must be installed to train dictionary')
+    return zstandard.train_dictionary(size, list(samples)).as_bytes()
@@ -384,6 +384,22 @@ class CAASEnv:
     # cache
     INNER_CACHE_TTL_SECONDS = 'CAAS_INNER_CACHE_TTL_SECONDS'
 
+    # number of threads that read and write shards concurrently
+    SHARDS_IO_WORKERS = 'CAAS_SHARDS_IO_WORKERS'
+    # local disk cache of downloaded shards. Disabled if dir is not set
+    SHARDS_CACHE_DIR = 'CAAS_SHARDS_CACHE_DIR'
+    SHARDS_CACHE_MAX_SIZE_MB = 'CAAS_SHARDS_CACHE_MAX_SIZE_MB'
+    # format of latest shards: version and codec. Latest state that is
+    # kept in another format is resharded by `main.py reshard_latest`
+    SHARDS_VERSION = 'CAAS_SHARDS_VERSION'
+    SHARDS_CODEC = 'CAAS_SHARDS_CODEC'
+
+    # on-prem jobs are forked from a pre-warmed executor process
+    EXECUTOR_WARM_POOL = 'CAAS_EXECUTOR_WARM_POOL'
+    # on-prem job queue: max running jobs and memory reserved for each one
+    EXECUTOR_MAX_JOBS = 'CAAS_EXECUTOR_MAX_JOBS'
+    EXECUTOR_JOB_MEMORY_MB = 'CAAS_EXECUTOR_JOB_MEMORY_MB'
+
     # on-prem access
     MINIO_ENDPOINT = 'CAAS_MINIO_ENDPOINT'
     MINIO_ACCESS_KEY_ID = 'CAAS_MINIO_ACCESS_KEY_ID'
@@ -414,6 +430,27 @@ class BatchJobEnv(CAASEnv):
     AFFECTED_LICENSES = 'AFFECTED_LICENSES'
 
     EXECUTOR_MODE = 'EXECUTOR_MODE'
+    EXECUTOR_PROCESSES = 'EXECUTOR_PROCESSES'  # for parallel_processes mode
+    # for concurrent mode
+    EXECUTOR_THREADS = 'EXECUTOR_THREADS'
+    EXECUTOR_GROUP_CONCURRENCY = 'EXECUTOR_GROUP_CONCURRENCY'
+    EXECUTOR_MAX_GROUP_CONCURRENCY = 'EXECUTOR_MAX_GROUP_CONCURRENCY'
+    # number of batch results that an event-driven job processes at once
+    EVENT_DRIVEN_PROCESSES = 'EVENT_DRIVEN_PROCESSES'
+    SKIP_UNCHANGED_SHARDS = 'SKIP_UNCHANGED_SHARDS'
+    # key of the checkpoint that is restored by a continuation job
+    CHECKPOINT_KEY = 'CHECKPOINT_KEY'
+    CONTINUATION = 'CONTINUATION'  # number of the continuation job
+    MAX_CONTINUATIONS = 'MAX_CONTINUATIONS'
+    # local directory with compiled policies of previous jobs
+    POLICIES_CACHE_DIR = 'POLICIES_CACHE_DIR'
+    # opt-in statistical profiler of the job
+    PROFILER = 'PROFILER'
+    PROFILER_INTERVAL_MS = 'PROFILER_INTERVAL_MS'
+    PROFILER_FORMAT = 'PROFILER_FORMAT'
+    # cloud API responses are written to or served from these dirs
+    CLOUD_API_RECORD_DIR = 'CLOUD_API_RECORD_DIR'
+    CLOUD_API_REPLAY_DIR = 'CLOUD_API_REPLAY_DIR'
     JOB_TYPE = 'JOB_TYPE'
     SUBMITTED_AT = 'SUBMITTED_AT'
 
@@ -422,6 +459,7 @@ class BatchJobEnv(CAASEnv):
 
     SCHEDULED_JOB_NAME = 'SCHEDULED_JOB_NAME'
     TENANT_NAME = 'TENANT_NAME'
+    CUSTOMER_NAME = 'CUSTOMER_NAME'
     PLATFORM_ID = 'PLATFORM_ID'
     ALLOW_MANAGEMENT_CREDS = 'ALLOW_MANAGEMENT_CREDENTIALS'
 
@@ -656,6 +694,11 @@ DEFAULT_INNER_CACHE_TTL_SECONDS: int = 300
 
 DEFAULT_LM_TOKEN_LIFETIME_MINUTES = 120
 
+DEFAULT_SHARDS_IO_WORKERS = 4
+DEFAULT_SHARDS_CACHE_MAX_SIZE_MB = 512
+DEFAULT_EXECUTOR_MAX_JOBS = 4
+DEFAULT_EXECUTOR_JOB_MEMORY_MB = 1024
+
 # event-driven
 AWS_VENDOR = 'AWS'
 MAESTRO_VENDOR = 'MAESTRO'
@@ -8,7 +8,7 @@ from helpers.log_helper import get_logger
 from helpers.time_helper import utc_iso
 from services import SERVICE_PROVIDER
 from services.abs_lambda import EventProcessorLambdaHandler
-from services.job_service import JobUpdater
+from services.job_service import JobService, JobUpdater
 from services.license_manager_service import LicenseManagerService
 from services.clients.ssm import AbstractSSMClient
 
@@ -68,15 +68,33 @@ class JobUpdaterHandler(EventProcessorLambdaHandler):
     processors = ()
 
     def __init__(self, ssm: AbstractSSMClient,
-                 license_manager_service: LicenseManagerService):
+                 license_manager_service: LicenseManagerService,
+                 job_service: JobService):
         self.ssm = ssm
         self.license_manager_service = license_manager_service
+        self.job_service = job_service
 
     def update_standard(self, detail: StateChangeEventDetail,
                         environment: dict[str, str]):
         _LOG.info('Updating a standard job')
         job_id = environment.get(BatchJobEnv.CUSTODIAN_JOB_ID)
-        updater = JobUpdater.from_job_id(job_id)
+        job = self.job_service.get_nullable(job_id)
+        if not job:
+            _LOG.warning(f'Job {job_id} does not exist. Skipping')
+            return
+        continuation = environment.get(BatchJobEnv.CONTINUATION) or '0'
+        if (job.continuation or 0) != int(continuation):
+            # the job reached its lifetime and was continued by another
+            # batch job, the state of this one does not matter anymore.
+            # The continuation is saved to the job before it's submitted
+            _LOG.info(f'Batch job {detail["jobId"]} was superseded by '
+                      f'continuation {job.continuation}. Skipping')
+            return
+        updater = JobUpdater(job)
+        if job.batch_job_id != detail['jobId']:
+            # the continuation could have been submitted by a batch job
+            # that did not manage to save its id
+            updater.batch_job_id = detail['jobId']
         updater.status = detail['status']
         if not updater.job.created_at and detail.get('createdAt'):
             updater.created_at = self.timestamp_to_iso(detail['createdAt'])
@@ -154,6 +172,7 @@ class JobUpdaterHandler(EventProcessorLambdaHandler):
 HANDLER = JobUpdaterHandler(
     ssm=SERVICE_PROVIDER.ssm,
     license_manager_service=SERVICE_PROVIDER.license_manager_service,
+    job_service=SERVICE_PROVIDER.job_service,
 )
 
 
@@ -1,11 +1,14 @@
+from datetime import datetime
 from pathlib import PurePosixPath
 
-from helpers import get_logger
+from helpers import get_logger, urljoin
 from helpers.constants import DATA_TYPE, START_DATE
+from helpers.time_helper import utc_datetime
 from services import SERVICE_PROVIDER
 from services.clients.s3 import S3Client
 from services.environment_service import EnvironmentService
-from services.reports_bucket import ReportsBucketKeysBuilder
+from services.reports_bucket import ReportsBucketKeysBuilder, SnapshotsIndex
+from services.sharding import MANIFEST_FILENAME
 
 _LOG = get_logger(__name__)
 NEXT_STEP = 'recommendations'
@@ -17,6 +20,81 @@ class FindingsUpdater:
         self._s3_client = s3_client
         self._environment_service = environment_service
 
+    def _referenced_blobs(self, bucket: str, folder: str,
+                          index: SnapshotsIndex) -> set[str]:
+        """
+        Blobs that the last snapshot refers to. Old snapshots are full
+        copies without a manifest, so nothing is returned for them
+        """
+        if not index.last:
+            return set()
+        manifest = self._s3_client.gz_get_json(
+            bucket=bucket,
+            key=urljoin(folder, index.last, MANIFEST_FILENAME)
+        )
+        return set(manifest.get('files', {}).values())
+
+    def make_snapshot(self, bucket: str, latest: str,
+                      date: datetime | None = None) -> dict[str, str]:
+        """
+        Snapshot is a manifest that maps names of objects in latest to
+        content-addressed blobs. Blob is named by ETag of the source object,
+        so an object is copied only if there is no blob with such ETag
+        yet. ETags of objects encrypted with KMS are not MD5 of their
+        content, but they are still unique, so such objects are just
+        deduplicated worse.
+        Blobs are never deleted, so the ones that the previous snapshot
+        refers to exist. Only the rest are checked with a HEAD request
+        :param bucket:
+        :param latest: .../latest/
+        :param date: snapshot date, now by default
+        :return: manifest files
+        """
+        root = str(PurePosixPath(latest).parent)
+        blobs = ReportsBucketKeysBuilder.urljoin(
+            root, ReportsBucketKeysBuilder.blobs
+        )
+        folder = ReportsBucketKeysBuilder.urljoin(
+            root, ReportsBucketKeysBuilder.snapshots
+        )
+        index = SnapshotsIndex.load(self._s3_client, bucket, folder)
+        if index is None:  # first snapshot or only old ones exist
+            index = SnapshotsIndex.from_prefixes(self._s3_client, bucket,
+                                                 folder)
+        existing = self._referenced_blobs(bucket, folder, index)
+        files = {}
+        for obj in self._s3_client.list_objects(bucket=bucket, prefix=latest):
+            # key: /bla/bla/latest/1.json.gz
+            # blob: /bla/bla/blobs/9b2cf535f27731c974343645a3985328.json.gz
+            name = obj.key[len(latest):]
+            if not name or '/' in name:
+                continue
+            blob = blobs + obj.e_tag.strip('"') + ''.join(
+                PurePosixPath(name).suffixes
+            )
+            if blob not in existing and \
+                    not self._s3_client.object_exists(bucket, blob):
+                _LOG.debug(f'Copying {obj.key} to {blob}')
+                self._s3_client.copy(
+                    bucket=bucket,
+                    key=obj.key,
+                    destination_bucket=bucket,
+                    destination_key=blob
+                )
+                existing.add(blob)
+            files[name] = blob
+        if not files:
+            return files
+        dt = ReportsBucketKeysBuilder.datetime(date or utc_datetime())
+        self._s3_client.gz_put_json(
+            bucket=bucket,
+            key=urljoin(folder, dt, MANIFEST_FILENAME),
+            obj={'files': files}
+        )
+        if index.add(dt.rstrip('/')):
+            index.save(self._s3_client, bucket, folder)
+        return files
+
     def process_data(self, event: dict):
         """
         When this processor is executed we make a snapshot of existing
@@ -30,32 +108,10 @@ class FindingsUpdater:
             delimiter=ReportsBucketKeysBuilder.latest,
             prefix=ReportsBucketKeysBuilder.prefix
         )
-        # todo use s3control.create_job for this
+        now = utc_datetime()
         for prefix in prefixes:
             _LOG.debug(f'Processing key: {prefix}')
-            objects = self._s3_client.list_objects(
-                bucket=bucket,
-                prefix=prefix,
-            )
-            for obj in objects:
-                # prefix: /bla/bla/latest
-                # key: /bla/bla/latest/1.json.gz
-                # destination: /bla/bla/snapshots/2023/10/10/10/1.json.gz
-                key = obj.key
-                path = PurePosixPath(key)
-                destination = ReportsBucketKeysBuilder.urljoin(
-                    str(path.parent.parent),
-                    ReportsBucketKeysBuilder.snapshots,
-                    ReportsBucketKeysBuilder.datetime()
-                )
-                destination += path.name
-                _LOG.debug(f'Copying {key} to {destination}')
-                self._s3_client.copy(
-                    bucket=bucket,
-                    key=key,
-                    destination_bucket=bucket,
-                    destination_key=destination
-                )
+            self.make_snapshot(bucket, prefix, now)
         return {DATA_TYPE: NEXT_STEP, START_DATE: event.get(START_DATE),
                 'continuously': event.get('continuously')}
 
@@ -98,7 +98,7 @@ class Recommendation:
             _LOG.debug(f'Get file {tenant_key_builder.latest_key()} content')
             collection = self.report_service.tenant_latest_collection(
                 tenant)
-            collection.fetch_all()
+            collection.fetch_parts(policies=set(RULE_RECOMMENDATION_MAPPING))
             collection.fetch_meta()
             recommendations = self._build_recommendations(
                 RULE_RECOMMENDATION_MAPPING, collection)
@@ -156,7 +156,9 @@ class Recommendation:
                 _LOG.debug(f'Get file {obj.key} content')
                 collection = self.report_service.tenant_latest_collection(
                     tenant)
-                collection.fetch_all()
+                collection.fetch_parts(
+                    policies=set(RULE_RECOMMENDATION_MAPPING)
+                )
                 collection.fetch_meta()
                 recommendations = self._build_recommendations(
                     RULE_RECOMMENDATION_MAPPING, collection)
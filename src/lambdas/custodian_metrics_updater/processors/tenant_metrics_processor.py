@@ -2,7 +2,7 @@ import calendar
 import json
 from datetime import datetime, timedelta
 from functools import cmp_to_key
-from typing import List, Dict, TypedDict, Optional
+from typing import List, Dict, Iterable, TypedDict, Optional
 
 from dateutil.relativedelta import relativedelta, SU
 from modular_sdk.models.tenant import Tenant
@@ -34,8 +34,12 @@ from services.report_service import ReportService
 from services.reports_bucket import TenantReportsBucketKeysBuilder, \
     PlatformReportsBucketKeysBuilder, StatisticsBucketKeysBuilder
 from services.setting_service import SettingsService
-from services.sharding import (ShardsCollectionFactory, ShardsS3IO,
-                               ShardsCollection)
+from services.sharding import (
+    BaseShardPart,
+    ShardPart,
+    ShardsCollection,
+    ShardsCollectionFactory,
+)
 
 _LOG = get_logger(__name__)
 
@@ -547,19 +551,23 @@ class TenantMetrics:
             })
 
             builder = TenantReportsBucketKeysBuilder(tenant_obj)
+            key = None
             if event.get(END_DATE):
-                key = (builder.nearest_snapshot_key(self.end_date)
-                       or builder.latest_key())
+                key = builder.nearest_snapshot_key(self.end_date)
+            if key:
+                collection = ShardsCollectionFactory.from_snapshot_key(
+                    cloud=Cloud[tenant_obj.cloud.upper()],
+                    key=key,
+                    bucket=self.environment_service.default_reports_bucket_name(),
+                    client=self.s3_client
+                )
             else:
-                key = builder.latest_key()
-
-            collection = ShardsCollectionFactory.from_tenant(tenant_obj)
-            collection.io = ShardsS3IO(
-                bucket=self.environment_service.default_reports_bucket_name(),
-                key=key,
-                client=self.s3_client
-            )
-            collection.fetch_all()
+                collection = ShardsCollectionFactory.from_s3_key(
+                    cloud=Cloud[tenant_obj.cloud.upper()],
+                    key=builder.latest_key(),
+                    bucket=self.environment_service.default_reports_bucket_name(),
+                    client=self.s3_client
+                )
             collection.fetch_meta()
 
             merge_dictionaries(self._collect_tenant_metrics(collection, tenant_obj),
@@ -576,20 +584,23 @@ class TenantMetrics:
                 self.platform_service.fetch_application(platform)
 
                 builder = PlatformReportsBucketKeysBuilder(platform)
+                k8s_key = None
                 if event.get(END_DATE):
-                    k8s_key = (builder.nearest_snapshot_key(self.end_date)
-                               or builder.latest_key())
+                    k8s_key = builder.nearest_snapshot_key(self.end_date)
+                if k8s_key:
+                    k8s_collection = ShardsCollectionFactory.from_snapshot_key(
+                        cloud=Cloud.KUBERNETES,
+                        key=k8s_key,
+                        bucket=self.environment_service.default_reports_bucket_name(),
+                        client=self.s3_client
+                    )
                 else:
-                    k8s_key = builder.latest_key()
-
-                k8s_collection = ShardsCollectionFactory.from_cloud(
-                    Cloud.KUBERNETES)
-                k8s_collection.io = ShardsS3IO(
-                    bucket=self.environment_service.default_reports_bucket_name(),
-                    key=k8s_key,
-                    client=self.s3_client
-                )
-                k8s_collection.fetch_all()
+                    k8s_collection = ShardsCollectionFactory.from_s3_key(
+                        cloud=Cloud.KUBERNETES,
+                        key=builder.latest_key(),
+                        bucket=self.environment_service.default_reports_bucket_name(),
+                        client=self.s3_client
+                    )
                 k8s_collection.fetch_meta()
 
                 result_tenant_data[name][KUBERNETES_TYPE].setdefault(
@@ -705,28 +716,26 @@ class TenantMetrics:
                 ), None) if not tenant_obj else tenant_obj
                 # SHARDS
 
-                collection = ShardsCollectionFactory.from_tenant(tenant_obj)
-                collection.io = ShardsS3IO(
-                    bucket=self.environment_service.default_reports_bucket_name(),
+                collection = ShardsCollectionFactory.from_snapshot_key(
+                    cloud=Cloud[tenant_obj.cloud.upper()],
                     key=TenantReportsBucketKeysBuilder(
                         tenant_obj).nearest_snapshot_key(self.end_date),
+                    bucket=self.environment_service.default_reports_bucket_name(),
                     client=self.s3_client
                 )
-                collection.fetch_all()
                 collection.fetch_meta()
 
+                collector, light = self._read_collection(
+                    collection,
+                    modular_helpers.get_tenant_regions(tenant_obj)
+                )
                 if COMPLIANCE_TYPE not in file_content:
                     coverage = self._get_tenant_compliance(
                         modular_helpers.tenant_cloud(tenant_obj),
-                        collection
+                        light
                     )
                     file_content[COMPLIANCE_TYPE] = coverage
 
-                collector = self._initiate_resource_collector(
-                    collection,
-                    modular_helpers.get_tenant_regions(tenant_obj)
-                )
-
                 if FINOPS_TYPE not in file_content:
                     file_content[FINOPS_TYPE] = collector.finops()
                 if ATTACK_VECTOR_TYPE not in file_content:
@@ -1005,9 +1014,11 @@ class TenantMetrics:
         return last_scan_date
 
     def _initiate_resource_collector(self, collection: ShardsCollection,
-                                     regions) -> ResourcesAndOverviewCollector:
+                                     regions,
+                                     parts: Iterable[BaseShardPart] | None = None
+                                     ) -> ResourcesAndOverviewCollector:
         it = self.metrics_service.create_resources_generator(
-            collection, regions
+            collection, regions, parts
         )
         col = self.ResourcesAndOverviewCollector(collection.meta,
                                                  self.mappings_collector)
@@ -1015,9 +1026,36 @@ class TenantMetrics:
             col.add_resource(rule, region, dto)
         return col
 
+    def _read_collection(self, collection: ShardsCollection, regions
+                         ) -> tuple[ResourcesAndOverviewCollector,
+                                    ShardsCollection]:
+        """
+        Reads stored parts of the collection once instead of fetching
+        them. Resources are given to the collector right away. Coverage
+        needs only policies and locations of parts and whether they are
+        empty, so the returned collection keeps at most one resource of
+        each part. Meta of the collection must be already fetched
+        :return: the collector and a light collection for coverage
+        """
+        light = ShardsCollectionFactory.difference()
+
+        def it():
+            for part in collection.iter_stored_parts():
+                light.put_part(ShardPart(
+                    policy=part.policy,
+                    location=part.location,
+                    timestamp=part.timestamp,
+                    resources=part.resources[:1]
+                ))
+                yield part
+
+        collector = self._initiate_resource_collector(collection, regions,
+                                                      it())
+        return collector, light
+
     def _collect_tenant_metrics(self, collection, tenant_obj) -> dict:
         result = {}
-        collector = self._initiate_resource_collector(
+        collector, light = self._read_collection(
             collection, modular_helpers.get_tenant_regions(tenant_obj)
         )
 
@@ -1025,7 +1063,7 @@ class TenantMetrics:
         _LOG.debug(f'Calculating {tenant_obj.name} coverage')
         result.update({
             COMPLIANCE_TYPE: self._get_tenant_compliance(
-                modular_helpers.tenant_cloud(tenant_obj), collection)
+                modular_helpers.tenant_cloud(tenant_obj), light)
         })
         # resources
         _LOG.debug(f'Collecting {tenant_obj.name} resources metrics')
@@ -1059,12 +1097,12 @@ class TenantMetrics:
 
     def _collect_k8s_metrics(self, collection) -> dict:
         result = {}
-        collector = self._initiate_resource_collector(collection, [])
+        collector, light = self._read_collection(collection, [])
 
         # coverage
         _LOG.debug(f'Calculating k8s coverage')
         compliance = self._get_tenant_compliance(
-            Cloud.KUBERNETES, collection).get('regions_data', [])
+            Cloud.KUBERNETES, light).get('regions_data', [])
         if not compliance:
             result['compliance_data'] = []
         else:
@@ -17,6 +17,7 @@ from helpers.constants import (
     ATTACK_VECTOR_TYPE,
     COMPLIANCE_TYPE,
     CUSTOMER_ATTR,
+    Cloud,
     CustodianEndpoint,
     DATA_ATTR,
     END_DATE,
@@ -379,15 +380,9 @@ class ReportGenerator(EventProcessorLambdaHandler):
                     futures = [ ex.submit(self._fetch_difference, tenant_item, bucket_name, result) for result in results ]
                     for future in as_completed(futures):
                         collections.append(future.result())
-                latest = ShardsCollectionFactory.from_tenant(tenant_item)
-                latest.io = ShardsS3IO(
-                    bucket=bucket_name,
-                    key=TenantReportsBucketKeysBuilder(tenant_item).latest_key(),
-                    client=self.s3_service
-                )
-                latest.fetch_meta()
                 new_resources = self.merge_collections(
-                    collections, latest.meta
+                    collections, self._fetch_latest_meta(tenant_item,
+                                                         bucket_name)
                 )
                 if not new_resources:
                     _LOG.warning(
@@ -777,6 +772,16 @@ class ReportGenerator(EventProcessorLambdaHandler):
         collection.fetch_all()
         return collection
 
+    def _fetch_latest_meta(self, tenant: Tenant, bucket_name: str) -> dict:
+        latest = ShardsCollectionFactory.from_s3_key(
+            cloud=Cloud[tenant.cloud.upper()],
+            key=TenantReportsBucketKeysBuilder(tenant).latest_key(),
+            bucket=bucket_name,
+            client=self.s3_service
+        )
+        latest.fetch_meta()
+        return latest.meta
+
     def merge_collections(self, collections: list[ShardsCollection],
                           meta: dict) -> list[dict]:
         content = {}
@@ -60,6 +60,7 @@ UPDATE_API_GATEWAY_MODELS_ACTION = 'update_api_models'
 PARSE_XLSX_STANDARD_ACTION = 'parse_standards'
 SHOW_PERMISSIONS_ACTION = 'show_permissions'
 INIT_ACTION = 'init'
+RESHARD_LATEST_ACTION = 'reshard_latest'
 
 DEFAULT_HOST = '0.0.0.0'
 DEFAULT_PORT = 8000
@@ -153,6 +154,21 @@ def build_parser() -> argparse.ArgumentParser:
         GENERATE_OPENAPI_ACTION,
         help='Generates Open API spec for Rule Engine API'
     )
+    reshard_parser = sub_parsers.add_parser(
+        RESHARD_LATEST_ACTION,
+        help='Rewrites latest state of tenants into the format configured '
+             'by CAAS_SHARDS_VERSION and CAAS_SHARDS_CODEC. Must not be '
+             'executed while jobs for the tenants are running'
+    )
+    reshard_parser.add_argument(
+        '--customers', nargs='+', required=False,
+        help='Names of customers whose tenants to reshard. All by default'
+    )
+    reshard_parser.add_argument(
+        '--tenants', nargs='+', required=False,
+        help='Names of tenants to reshard. All tenants of the customers '
+             'by default'
+    )
     init_xlsx_cli_parser(sub_parsers.add_parser(
         PARSE_XLSX_STANDARD_ACTION,
         help='Parses Custom Core\'s xlsx with standards'
@@ -398,6 +414,7 @@ class Run(ActionHandler):
         app = self.make_app(dr_wrapper)
 
         SP.ap_job_scheduler.start()
+        SP.batch.start()  # jobs queued before restart
         ensure_all()
         # ensure_retry_job()
         if gunicorn:
@@ -601,6 +618,47 @@ class SetMetaRepos(ActionHandler):
         _LOG.info('Repositories were set')
 
 
+class ReshardLatest(ActionHandler):
+    """
+    Resharding is not atomic, so it's a maintenance step instead of a part
+    of jobs: both standard and event-driven jobs write to latest
+    """
+    @staticmethod
+    def iter_tenants(customers: list[str] | None = None,
+                     tenants: list[str] | None = None):
+        if not customers:
+            customers = [c.name for c in
+                         SP.modular_client.customer_service().i_get_customer()]
+        ts = SP.modular_client.tenant_service()
+        for customer in customers:
+            for tenant in ts.i_get_tenant_by_customer(customer_id=customer):
+                if tenants and tenant.name not in tenants:
+                    continue
+                yield tenant
+
+    def __call__(self, customers: list[str] | None = None,
+                 tenants: list[str] | None = None):
+        from services.modular_helpers import tenant_cloud
+        from services.reports_bucket import TenantReportsBucketKeysBuilder
+        from services.sharding import reshard_to_configured
+
+        if not SP.environment_service.shards_version():
+            _LOG.warning('CAAS_SHARDS_VERSION is not set. Nothing to do')
+            return
+        for tenant in self.iter_tenants(customers, tenants):
+            cloud = tenant_cloud(tenant)
+            if not cloud:
+                _LOG.warning(f'Skipping tenant {tenant.name} with '
+                             f'unknown cloud {tenant.cloud}')
+                continue
+            resharded = reshard_to_configured(
+                cloud=cloud,
+                key=TenantReportsBucketKeysBuilder(tenant).latest_key()
+            )
+            if resharded:
+                _LOG.info(f'Latest of tenant {tenant.name} was resharded')
+
+
 def main(args: list[str] | None = None):
     parser = build_parser()
     arguments = parser.parse_args(args)
@@ -619,7 +677,8 @@ def main(args: list[str] | None = None):
 
         (UPDATE_API_GATEWAY_MODELS_ACTION,): UpdateApiGatewayModels(),
         (SHOW_PERMISSIONS_ACTION,): ShowPermissions(),
-        (INIT_ACTION,): InitAction()
+        (INIT_ACTION,): InitAction(),
+        (RESHARD_LATEST_ACTION,): ReshardLatest()
     }
     func: Callable = mapping.get(key) or (lambda **kwargs: _LOG.error('Hello'))
     for dest in ALL_NESTING:
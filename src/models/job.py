@@ -1,6 +1,11 @@
 import os
 
-from pynamodb.attributes import UnicodeAttribute, ListAttribute, TTLAttribute
+from pynamodb.attributes import (
+    ListAttribute,
+    NumberAttribute,
+    TTLAttribute,
+    UnicodeAttribute,
+)
 from pynamodb.indexes import AllProjection
 
 from helpers.constants import CAASEnv, JobState
@@ -27,6 +32,7 @@ JOB_RULES_TO_SCAN = 'ru'
 JOB_PLATFORM_ID = 'p'
 JOB_TTL = 'ttl'
 JOB_AFFECTED_LICENSE = 'al'
+JOB_CONTINUATION = 'cn'
 
 
 class TenantNameSubmittedAtIndex(BaseGSI):
@@ -85,6 +91,9 @@ class Job(BaseModel):
     platform_id = UnicodeAttribute(null=True, attr_name=JOB_PLATFORM_ID)
     affected_license = UnicodeAttribute(null=True,
                                         attr_name=JOB_AFFECTED_LICENSE)
+    # number of the continuation batch job that owns the job. It's set
+    # before the continuation is submitted
+    continuation = NumberAttribute(null=True, attr_name=JOB_CONTINUATION)
 
     ttl = TTLAttribute(null=True, attr_name=JOB_TTL)
 
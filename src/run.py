@@ -15,11 +15,16 @@ Exit codes:
   credentials or conceivably some other temporal reason. Retry is allowed.
 """
 from abc import ABC, abstractmethod
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from http import HTTPStatus
 import io
 from itertools import chain
+import multiprocessing
+import multiprocessing.connection
 import operator
+import os
 from pathlib import Path
 import sys
 import tempfile
@@ -28,34 +33,52 @@ import time
 import traceback
 from typing import Generator, Optional, cast
 
-from botocore.exceptions import ClientError
 from c7n.config import Config
 from c7n.exceptions import PolicyValidationError
 from c7n.policy import Policy, PolicyCollection
 from c7n.provider import clouds
 from c7n.resources import load_resources
-from google.auth.exceptions import GoogleAuthError
-from googleapiclient.errors import HttpError
 from modular_sdk.commons.constants import ENV_KUBECONFIG, ParentType
 from modular_sdk.models.parent import Parent
 from modular_sdk.models.tenant import Tenant
 from modular_sdk.services.environment_service import EnvironmentContext
-from msrestazure.azure_exceptions import CloudError
+import msgspec
 
 from executor.helpers.constants import (
     ACCESS_DENIED_ERROR_CODE,
     AWS_DEFAULT_REGION,
     CACHE_FILE,
+    DEFAULT_EXECUTOR_THREADS,
+    DEFAULT_GROUP_CONCURRENCY,
+    DEFAULT_MAX_GROUP_CONCURRENCY,
     ExecutorError,
     ExecutorMode,
     INVALID_CREDENTIALS_ERROR_CODES,
+    ProfileFormat,
     ENV_AWS_DEFAULT_REGION,
+    THROTTLING_ERROR_CODES,
 )
-from executor.helpers.profiling import BytesEmitter, xray_recorder as _XRAY
+from executor.helpers.compiled_policies import (
+    CompiledPolicies,
+    CompiledPoliciesCache,
+    has_variables,
+)
+from executor.helpers.profiling import (
+    BytesEmitter,
+    profiler as _PROFILER,
+    tracer as _XRAY,
+)
+from executor.helpers.replay import CloudApiCassette
+from executor.helpers.resources_cache import ResourcesCache
+from executor.helpers.scheduler import AdaptiveScheduler, PoliciesDurations
+from executor.helpers.throttling import ThrottlingCounter
 from executor.services import BSP
 from services.clients.lm_client import LMException
 from executor.services.policy_service import PolicyDict
-from executor.services.report_service import JobResult
+from executor.services.report_service import (
+    JobCheckpoint,
+    JobResult,
+)
 from helpers.constants import (
     BatchJobEnv,
     BatchJobType,
@@ -75,23 +98,22 @@ from models.scheduled_job import ScheduledJob
 from services import SP
 from services.ambiguous_job_service import AmbiguousJob
 from services.clients import Boto3ClientFactory
-from services.clients.dojo_client import DojoV2Client
 from services.clients.eks_client import EKSClient
 from services.clients.sts import TokenGenerator, StsClient
 from services.job_lock import TenantSettingJobLock
 from services.job_service import JobUpdater, NullJobUpdater
 from services.platform_service import K8STokenKubeconfig, Kubeconfig, Platform
-from services.chronicle_service import ChronicleConverterType
-from services.udm_generator import ShardCollectionUDMEntitiesConvertor, ShardCollectionUDMEventsConvertor
-from services.ruleset_service import RulesetName
-from services.report_convertors import ShardCollectionDojoConvertor
+from services.ruleset_service import RulesetName, RulesetService
 from services.reports_bucket import (
     PlatformReportsBucketKeysBuilder,
     StatisticsBucketKeysBuilder,
     TenantReportsBucketKeysBuilder,
 )
-from services.clients.chronicle import ChronicleV2Client
-from services.sharding import ShardsCollection, ShardsCollectionFactory, ShardsS3IO
+from services.sharding import (
+    ShardsCollection,
+    ShardsCollectionFactory,
+    ShardsS3IO,
+)
 
 _LOG = get_logger(__name__)
 
@@ -101,7 +123,17 @@ class ExecutorException(Exception):
         self.error = error
 
 
+_TIME_THRESHOLD: float | None = None
+
+
 def get_time_left() -> float:
+    """
+    Timestamp after which policies are not executed anymore. It's calculated
+    once when the job starts
+    """
+    global _TIME_THRESHOLD
+    if _TIME_THRESHOLD is not None:
+        return _TIME_THRESHOLD
     _LOG.debug('Retrieving job time threshold')
     if BSP.environment_service.is_docker():
         _LOG.debug('On prem job - using current timestamp as start time')
@@ -116,19 +148,32 @@ def get_time_left() -> float:
             minutes=BSP.environment_service.job_lifetime_min())
     )
     _LOG.debug(f'Threshold: {threshold}, {datetime.fromtimestamp(threshold)}')
+    _TIME_THRESHOLD = threshold
     return threshold
 
 
-TIME_THRESHOLD: float = get_time_left()
+# runner which policies are executed by forked worker processes. Workers
+# inherit it from the parent process, so policies are not pickled
+_FORKED_RUNNER: Optional['Runner'] = None
+# batch results processes must not inherit clients of the job process:
+# MongoClient of pymongo and connection pools of botocore are not fork-safe
+BATCH_RESULTS_START_METHOD = 'spawn'
+
+
+def _run_forked_policy(index: int
+                       ) -> tuple[int, 'Runner.FailedPolicies', tuple | None]:
+    return _FORKED_RUNNER._run_forked(index)
 
 
 class PoliciesLoader:
     __slots__ = ('_cloud', '_output_dir', '_regions', '_cache', 
-                 '_cache_period')
+                 '_cache_period', '_resources_cache', '_compiled_cache')
 
     def __init__(self, cloud: Cloud, output_dir: Path,
                  regions: set[str] | None = None, cache: str = CACHE_FILE,
-                 cache_period: int = 30):
+                 cache_period: int = 30,
+                 resources_cache: ResourcesCache | None = None,
+                 compiled_cache: CompiledPoliciesCache | None = None):
         """
 
         :param cloud:
@@ -136,6 +181,11 @@ class PoliciesLoader:
         :param regions:
         :param cache:
         :param cache_period:
+        :param resources_cache: in-memory cache that is shared by all the
+        loaded policies. It's installed when policies are loaded and must
+        be uninstalled after they are executed
+        :param compiled_cache: cache of what is known about policies of
+        rulesets that were loaded by the previous jobs
         """
         self._cloud = cloud
         self._output_dir = output_dir
@@ -145,6 +195,8 @@ class PoliciesLoader:
                          f'{self._cloud}')
         self._cache = cache
         self._cache_period = cache_period
+        self._resources_cache = resources_cache
+        self._compiled_cache = compiled_cache
 
     def set_global_output(self, policy: Policy) -> None:
         policy.options.output_dir = str(
@@ -264,7 +316,8 @@ class PoliciesLoader:
         _LOG.debug(f'Not global policies: {n_not_global}')
 
     def _load(self, policies: list[PolicyDict], 
-              options: Config | None = None) -> list[Policy]:
+              options: Config | None = None,
+              ruleset_hash: str | None = None) -> list[Policy]:
         """
         Unsafe load using internal CLoud Custodian API:
         - does not load file, we already have policies list
@@ -275,12 +328,37 @@ class PoliciesLoader:
         - don't need schema validation
         - don't need filters from config and some other things
         :param policies:
+        :param ruleset_hash: hash of the ruleset these policies are taken
+        from. The policies can be a part of it. Calculated from the
+        policies if not given
         :return:
         """
         if not options:
             options = self._base_config()
         options.region = ''
+        compiled = None
+        if self._compiled_cache:
+            if not ruleset_hash:
+                ruleset_hash = RulesetService.payload_hash(policies)
+            compiled = self._compiled_cache.get(ruleset_hash)
+        if compiled is not None:
+            _LOG.debug('Compiled policies are found')
+            policies = [
+                p for p in policies if p['name'] not in compiled.invalid
+            ]
+        else:
+            compiled = CompiledPolicies()
+        learnt = CompiledPolicies()
+        for policy in policies:
+            name = policy['name']
+            if not compiled.known(name) and not has_variables(policy):
+                learnt.static.add(name)
+        static = compiled.static | learnt.static
+
         load_resources(self._get_resource_types(policies))
+        if self._resources_cache:
+            # resource managers get their caches when policies are created
+            self._resources_cache.install()
         # here we should probably validate schema, but it's too time-consuming
         provider_policies = {}
         for policy in policies:
@@ -289,6 +367,7 @@ class PoliciesLoader:
             except PolicyValidationError:
                 _LOG.warning(f'Cannot load policy {policy["name"]} '
                              f'dict to object. Skipping', exc_info=True)
+                learnt.invalid.add(policy['name'])
                 continue
             provider_policies.setdefault(pol.provider_name, []).append(pol)
 
@@ -303,33 +382,57 @@ class PoliciesLoader:
             )
 
         # Variable expansion and non schema validation
+        encoded = {}
+        decoder = msgspec.json.Decoder(type=dict)
         result = []
         for p in collection:
-            p.expand_variables(p.get_variables())
+            if p.name in static:
+                # the same as expansion, but without formatting each string
+                if p.name not in encoded:
+                    encoded[p.name] = msgspec.json.encode(p.data)
+                self._rebind(p, decoder.decode(encoded[p.name]))
+            else:
+                p.expand_variables(p.get_variables())
             try:
                 p.validate()
             except PolicyValidationError as e:
                 _LOG.warning(f'Policy {p.name} validation failed',
                              exc_info=True)
+                learnt.invalid.add(p.name)
                 continue
             except (ValueError, Exception):
                 _LOG.warning('Unexpected error occurred validating policy',
                              exc_info=True)
                 continue
             result.append(p)
+        if self._compiled_cache and (learnt.invalid or learnt.static):
+            learnt.static -= learnt.invalid
+            self._compiled_cache.put(ruleset_hash, learnt)
         return result
 
-    def load_from_policies(self, policies: list[PolicyDict]) -> list[Policy]:
+    @staticmethod
+    def _rebind(policy: Policy, data: dict) -> None:
+        """
+        Gives the policy its own copy of data. Policies of different regions
+        share data after they are initialized and filters can change it
+        """
+        policy.data = data
+        policy.conditions.update(data)
+        policy.resource_manager = policy.load_resource_manager()
+
+    def load_from_policies(self, policies: list[PolicyDict],
+                           ruleset_hash: str | None = None) -> list[Policy]:
         """
         This functionality is already present inside Cloud Custodian but that
         is that part of private python API, besides it does more that we need.
         So, this is our small implementation which does exactly what we need
         here.
         :param policies:
+        :param ruleset_hash:
         :return:
         """
         _LOG.info('Loading policies')
-        items = self._load(policies)
+        items = self._load(policies, ruleset_hash=ruleset_hash)
         match self._cloud:
             case Cloud.AWS:
                 items = list(self.prepare_policies(items))
@@ -340,7 +443,8 @@ class PoliciesLoader:
         return items
 
     def load_from_regions_to_rules(self, policies: list[PolicyDict],
-                                   mapping: dict[str, set[str]]
+                                   mapping: dict[str, set[str]],
+                                   ruleset_hash: str | None = None
                                    ) -> list[Policy]:
         """
         Expected mapping:
@@ -350,12 +454,13 @@ class PoliciesLoader:
         }
         :param policies:
         :param mapping:
+        :param ruleset_hash:
         :return:
         """
         rules = set(chain.from_iterable(mapping.values()))  # all rules
         if self._cloud != Cloud.AWS:
             # load all policies ignoring region and set global to all
-            items = self._load(policies)
+            items = self._load(policies, ruleset_hash=ruleset_hash)
             items = list(filter(lambda p: p.name in rules, items))
             for policy in items:
                 self.set_global_output(policy)
@@ -367,7 +472,8 @@ class PoliciesLoader:
         config = self._base_config()
         config.regions = [*mapping.keys(), AWS_DEFAULT_REGION]
         items = []
-        for policy in self.prepare_policies(self._load(policies, config)):
+        loaded = self._load(policies, config, ruleset_hash)
+        for policy in self.prepare_policies(loaded):
             if self.is_global(policy) and policy.name in rules:
                 items.append(policy)
             elif policy.name in (mapping.get(policy.options.region) or ()):
@@ -381,6 +487,8 @@ class Runner(ABC):
         tuple[PolicyErrorType, Optional[str], list[str]]
     ]
     cloud: Cloud | None = None
+    TIME_EXCEEDED_MESSAGE = ('Job time exceeded the maximum possible '
+                             'execution time')
 
     def __init__(self, policies: list[Policy]):
         self._policies = policies
@@ -393,6 +501,9 @@ class Runner(ABC):
         self._exception = None
 
         self._lock = threading.Lock()
+        # set by a worker process if all the consequent policies must be
+        # skipped, see start_processes
+        self._stop_event = None
 
     @classmethod
     def factory(cls, cloud: Cloud, policies: list[Policy]) -> 'Runner':
@@ -413,6 +524,38 @@ class Runner(ABC):
     def failed(self) -> FailedPolicies:
         return self._failed
 
+    @property
+    def time_exceeded(self) -> bool:
+        """
+        Whether some policies were skipped because the job time threshold
+        was reached
+        """
+        return (self._error_type is PolicyErrorType.SKIPPED and
+                self._message == self.TIME_EXCEEDED_MESSAGE)
+
+    def failed_in_time(self) -> FailedPolicies:
+        """
+        Failed policies except the ones that were skipped because of the
+        job time threshold
+        """
+        return {
+            key: value for key, value in self._failed.items()
+            if value[1] != self.TIME_EXCEEDED_MESSAGE
+        }
+
+    def order_longest_first(self, durations: PoliciesDurations) -> None:
+        """
+        Orders policies by their durations from the previous jobs, so
+        the longest ones are taken by workers first. Makes sense only for
+        concurrent and parallel modes
+        """
+        if not len(durations):
+            return
+        self._policies = durations.longest_first(
+            self._policies,
+            key=lambda p: (PoliciesLoader.get_policy_region(p), p.name)
+        )
+
     @_XRAY.capture('Run policies consistently')
     def start(self):
         self._is_ongoing = True
@@ -421,27 +564,122 @@ class Runner(ABC):
         self._is_ongoing = False
 
     @_XRAY.capture('Run policies concurrently ')
-    def start_threads(self):
+    def start_threads(
+        self, threads: int = DEFAULT_EXECUTOR_THREADS,
+        group_concurrency: int = DEFAULT_GROUP_CONCURRENCY,
+        max_group_concurrency: int = DEFAULT_MAX_GROUP_CONCURRENCY
+    ):
+        """
+        Runs policies in threads. Policies are grouped by region and cloud
+        service they query and each group has its own concurrency limit,
+        so one API is not flooded with requests by all the threads. The
+        limit of a group is halved when calls of that group are throttled.
+        Throttled calls are counted as they happen, before SDKs exhaust
+        their retries. The limit slowly grows back while policies succeed
+        :param threads: total number of threads
+        :param group_concurrency: initial limit of each group
+        :param max_group_concurrency: max limit of each group
+        """
         self._is_ongoing = True
-        with ThreadPoolExecutor() as executor:
-            future_policy = {
-                executor.submit(self._call_policy, policy): policy
-                for policy in self._policies
-            }
-            for future in as_completed(future_policy):
-                self._handle_errors(policy=future_policy[future],
-                                    future=future)
+        scheduler = AdaptiveScheduler(
+            workers=threads,
+            initial=group_concurrency,
+            maximum=max_group_concurrency
+        )
+        groups = {self._policy_group(p) for p in self._policies}
+        with ThrottlingCounter() as counter:
+            it = scheduler.run(self._policies, self._policy_group,
+                               self._call_policy)
+            for policy, future in it:
+                throttled = {}
+                for (region, service), at in counter.drain().items():
+                    if (region, service) not in groups:  # global services
+                        region = GLOBAL_REGION
+                    throttled[(region, service)] = at
+                if self._is_throttled(future):
+                    throttled.setdefault(self._policy_group(policy),
+                                         time.monotonic())
+                scheduler.feedback(future, throttled)
+                self._handle_errors(policy=policy, future=future)
+        _LOG.debug(f'Throttled calls: {counter.total}')
+        _LOG.debug(f'Final concurrency limits: {scheduler.limits}')
         self._is_ongoing = False
 
+    @_XRAY.capture('Run policies in parallel processes')
+    def start_processes(self, processes: int | None = None):
+        """
+        Runs policies in forked worker processes, so CPU-bound filtering
+        of different policies is not serialized by GIL. Workers are forked
+        after policies are loaded, so they inherit loaded policies and
+        imported Cloud Custodian resources. Only indexes of policies are
+        sent to workers. Each worker handles errors of its policies and
+        sends failed items back
+        :param processes: number of workers, number of CPUs by default
+        """
+        global _FORKED_RUNNER
+        if not self._policies:
+            return
+        processes = min(processes or os.cpu_count() or 1,
+                        len(self._policies))
+        ctx = multiprocessing.get_context('fork')
+        self._is_ongoing = True
+        self._stop_event = ctx.Event()
+        _FORKED_RUNNER = self
+        skipped = []
+        try:
+            with ctx.Pool(processes=processes) as pool:
+                it = pool.imap_unordered(
+                    _run_forked_policy, range(len(self._policies))
+                )
+                for index, failed, stopped in it:
+                    with self._lock:
+                        self._failed.update(failed)
+                    if stopped is None:
+                        continue
+                    if stopped is True:  # not executed because stopped
+                        skipped.append(self._policies[index])
+                    elif self._is_ongoing:
+                        self._is_ongoing = False
+                        self._error_type, self._message = stopped
+        finally:
+            _FORKED_RUNNER = None
+            self._stop_event = None
+        for policy in skipped:
+            self._add_failed(
+                region=PoliciesLoader.get_policy_region(policy),
+                policy=policy.name,
+                error_type=self._error_type,
+                message=self._message
+            )
+        self._is_ongoing = False
+
+    def _run_forked(self, index: int
+                    ) -> tuple[int, FailedPolicies, tuple | None]:
+        """
+        Executed inside a worker process. Returns index of the policy,
+        its failed items and the reason to stop if the consequent policies
+        must be skipped. True instead of the reason means that the policy
+        was not executed because another worker has stopped the job
+        """
+        if self._stop_event.is_set() and self._is_ongoing:
+            return index, {}, True
+        self._failed = {}  # only items of this policy are sent back
+        was_ongoing = self._is_ongoing
+        self._handle_errors(policy=self._policies[index])
+        stopped = None
+        if was_ongoing and not self._is_ongoing:
+            stopped = (self._error_type, self._message)
+            self._stop_event.set()
+        return index, self._failed, stopped
+
     def _call_policy(self, policy: Policy):
-        if TIME_THRESHOLD <= utc_datetime().timestamp():
+        if get_time_left() <= utc_datetime().timestamp():
             if self._is_ongoing:
                 _LOG.warning('Job time threshold has been exceeded. '
                              'All the consequent rules will be skipped.')
             self._is_ongoing = False
             self._error_type = PolicyErrorType.SKIPPED
-            self._message = ('Job time exceeded the maximum '
-                             'possible execution time')
+            self._message = self.TIME_EXCEEDED_MESSAGE
         if not self._is_ongoing:
             self._add_failed(
                 region=PoliciesLoader.get_policy_region(policy),
@@ -466,6 +704,22 @@ class Runner(ABC):
         with self._lock:
             self._failed[(region, policy)] = (error_type, message, tb)
 
+    @staticmethod
+    def _policy_group(policy: Policy) -> tuple[str, str]:
+        """
+        Region and cloud service the policy queries
+        """
+        rt = policy.resource_manager.resource_type
+        service = getattr(rt, 'service', None) or policy.resource_type
+        return PoliciesLoader.get_policy_region(policy), service
+
+    def _is_throttled(self, future: Future) -> bool:
+        """
+        Tells whether the policy of this completed future has failed
+        because cloud API throttled its requests
+        """
+        return False
+
     @abstractmethod
     def _handle_errors(self, policy: Policy, future: Future | None = None):
         ...
@@ -474,7 +728,18 @@ class Runner(ABC):
 class AWSRunner(Runner):
     cloud = Cloud.AWS
 
+    def _is_throttled(self, future: Future) -> bool:
+        from botocore.exceptions import ClientError
+
+        error = future.exception()
+        if not isinstance(error, ClientError):
+            return False
+        code = error.response.get('Error', {}).get('Code')
+        return code in THROTTLING_ERROR_CODES.get(self.cloud)
+
     def _handle_errors(self, policy: Policy, future: Future | None = None):
+        from botocore.exceptions import ClientError
+
         name, region = policy.name, PoliciesLoader.get_policy_region(policy)
         try:
             future.result() if future else self._call_policy(policy)
@@ -524,7 +789,15 @@ class AWSRunner(Runner):
 class AZURERunner(Runner):
     cloud = Cloud.AZURE
 
+    def _is_throttled(self, future: Future) -> bool:
+        # both msrestazure and azure-core errors have status code
+        error = future.exception()
+        return getattr(error, 'status_code', None) == \
+            HTTPStatus.TOO_MANY_REQUESTS
+
     def _handle_errors(self, policy: Policy, future: Future | None = None):
+        from msrestazure.azure_exceptions import CloudError
+
         name, region = policy.name, PoliciesLoader.get_policy_region(policy)
         try:
             future.result() if future else self._call_policy(policy)
@@ -565,7 +838,17 @@ class AZURERunner(Runner):
 class GCPRunner(Runner):
     cloud = Cloud.GOOGLE
 
+    def _is_throttled(self, future: Future) -> bool:
+        from googleapiclient.errors import HttpError
+
+        error = future.exception()
+        return isinstance(error, HttpError) and \
+            error.status_code == HTTPStatus.TOO_MANY_REQUESTS
+
     def _handle_errors(self, policy: Policy, future: Future | None = None):
+        from google.auth.exceptions import GoogleAuthError
+        from googleapiclient.errors import HttpError
+
         name, region = policy.name, PoliciesLoader.get_policy_region(policy)
         try:
             future.result() if future else self._call_policy(policy)
@@ -734,7 +1017,11 @@ def get_licensed_ruleset_dto_list(tenant: Tenant, job: Job) -> list[dict]:
 @_XRAY.capture('Upload to SIEM')
 def upload_to_siem(tenant: Tenant, collection: ShardsCollection,
                    job: AmbiguousJob, platform: Platform | None = None):
+    # SIEM clients and convertors are imported only if they are configured
     for dojo, configuration in SP.integration_service.get_dojo_adapters(tenant, True):
+        from services.clients.dojo_client import DojoV2Client
+        from services.report_convertors import ShardCollectionDojoConvertor
+
         convertor = ShardCollectionDojoConvertor.from_scan_type(
             configuration.scan_type
         )
@@ -765,6 +1052,13 @@ def upload_to_siem(tenant: Tenant, collection: ShardsCollection,
         )
         if not creds:
             continue
+        from services.chronicle_service import ChronicleConverterType
+        from services.clients.chronicle import ChronicleV2Client
+        from services.udm_generator import (
+            ShardCollectionUDMEntitiesConvertor,
+            ShardCollectionUDMEventsConvertor,
+        )
+
         client = ChronicleV2Client(
             url=chronicle.endpoint,
             credentials=creds.GOOGLE_APPLICATION_CREDENTIALS,
@@ -784,6 +1078,39 @@ def upload_to_siem(tenant: Tenant, collection: ShardsCollection,
                 )
 
 
+def fetch_latest(latest: ShardsCollection, collection: ShardsCollection
+                 ) -> None:
+    _LOG.debug('Pulling latest state')
+    latest.fetch_by_parts(collection.iter_parts())
+    latest.fetch_meta()
+
+
+@_XRAY.capture('Upload and prefetch')
+def upload_and_prefetch(tenant: Tenant, collection: ShardsCollection,
+                        latest: ShardsCollection, job: AmbiguousJob,
+                        platform: Platform | None = None) -> None:
+    """
+    Pushes the collection to SIEM, writes the job report and fetches the
+    parts of the latest state that are going to be updated. These stages
+    do not depend on each other and mostly wait for network, so they run
+    concurrently. The collection is only read by them. If some stages
+    fail, the first exception in order SIEM, job report, latest is raised
+    after all of them have finished, so the latest state is not updated
+    """
+    _LOG.info('Going to upload to SIEM, write job report and pull latest '
+              'state')
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = (
+            executor.submit(upload_to_siem, tenant=tenant,
+                            collection=collection, job=job,
+                            platform=platform),
+            executor.submit(collection.write_all),  # writes job report
+            executor.submit(fetch_latest, latest, collection)
+        )
+    for future in futures:
+        future.result()
+
+
 @_XRAY.capture('Get credentials')
 def get_credentials(tenant: Tenant,
                     batch_results: BatchResults | None = None) -> dict:
@@ -855,7 +1182,7 @@ def get_credentials(tenant: Tenant,
             if aid == tenant.project:
                 _LOG.info('Instance profile credentials match to tenant id')
                 return {}
-        except (Exception, ClientError) as e:
+        except Exception as e:
             _LOG.warning(f'No instance credentials found: {e}')
 
     if credentials:
@@ -989,36 +1316,59 @@ def get_rules_to_exclude(tenant: Tenant) -> set[str]:
 @_XRAY.capture('Batch results job')
 def batch_results_job(batch_results: BatchResults):
     _XRAY.put_annotation('batch_results_id', batch_results.id)
+    _PROFILER.put_tag('batch_results_id', batch_results.id)
+    _PROFILER.put_tag('tenant', batch_results.tenant_name)
 
     temp_dir = tempfile.TemporaryDirectory()
     work_dir = Path(temp_dir.name)
 
     tenant: Tenant = SP.modular_client.tenant_service().get(batch_results.tenant_name)
     cloud = Cloud[tenant.cloud.upper()]
+    _PROFILER.put_tag('cloud', cloud.value)
     credentials = get_credentials(tenant, batch_results)
 
+    ruleset_path = BSP.policies_service.ensure_event_driven_ruleset(cloud)
     policies = BSP.policies_service.separate_ruleset(
-        from_=BSP.policies_service.ensure_event_driven_ruleset(cloud),
+        from_=ruleset_path,
         exclude=get_rules_to_exclude(tenant),
         keep=set(
             chain.from_iterable(batch_results.regions_to_rules().values())
         )
     )
+    resources_cache = ResourcesCache()
     loader = PoliciesLoader(
         cloud=cloud,
         output_dir=work_dir,
-        regions=BSP.environment_service.target_regions()
+        regions=BSP.environment_service.target_regions(),
+        resources_cache=resources_cache,
+        compiled_cache=CompiledPoliciesCache(
+            directory=BSP.environment_service.policies_cache_dir(),
+            client=SP.s3,
+            bucket=SP.environment_service.get_rulesets_bucket_name()
+        )
     )
-    with EnvironmentContext(credentials, reset_all=False):
+    with EnvironmentContext(credentials, reset_all=False), resources_cache:
         runner = Runner.factory(cloud, loader.load_from_regions_to_rules(
             policies,
-            batch_results.regions_to_rules()
+            batch_results.regions_to_rules(),
+            # the policies are a part of the event-driven ruleset, so what
+            # is learnt about them is kept for the whole ruleset
+            ruleset_hash=BSP.policies_service.ruleset_hash(ruleset_path)
         ))
         match BSP.environment_service.executor_mode():
             case ExecutorMode.CONSISTENT:
                 runner.start()
             case ExecutorMode.CONCURRENT:
-                runner.start_threads()
+                env = BSP.environment_service
+                runner.start_threads(
+                    threads=env.executor_threads(),
+                    group_concurrency=env.executor_group_concurrency(),
+                    max_group_concurrency=env.executor_max_group_concurrency()
+                )
+            case ExecutorMode.PARALLEL_PROCESSES:
+                runner.start_processes(
+                    BSP.environment_service.executor_processes()
+                )
 
     result = JobResult(work_dir, cloud)
     keys_builder = TenantReportsBucketKeysBuilder(tenant)
@@ -1027,38 +1377,28 @@ def batch_results_job(batch_results: BatchResults):
     meta = result.rules_meta()
     collection.meta = meta
 
-    _LOG.info('Going to upload to SIEM')
-    upload_to_siem(
-        tenant=tenant,
-        collection=collection,
-        job=AmbiguousJob(batch_results),
-    )
-
     collection.io = ShardsS3IO(
         bucket=SP.environment_service.default_reports_bucket_name(),
         key=keys_builder.ed_job_result(batch_results),
         client=SP.s3
     )
-    _LOG.debug('Writing job report')
-    collection.write_all()  # writes job report
-
-    latest = ShardsCollectionFactory.from_cloud(cloud)
-    latest.io = ShardsS3IO(
-        bucket=SP.environment_service.default_reports_bucket_name(),
+    latest = ShardsCollectionFactory.from_s3_key(
+        cloud=cloud,
         key=keys_builder.latest_key(),
+        bucket=SP.environment_service.default_reports_bucket_name(),
         client=SP.s3
     )
-    _LOG.debug('Pulling latest state')
-    latest.fetch_by_indexes(collection.shards.keys())
-    latest.fetch_meta()
+    upload_and_prefetch(tenant=tenant, collection=collection, latest=latest,
+                        job=AmbiguousJob(batch_results))
 
     difference = collection - latest
 
     _LOG.debug('Writing latest state')
     latest.update(collection)
     latest.update_meta(meta)
-    latest.write_all()
-    latest.write_meta()
+    skip_unchanged = BSP.env.skip_unchanged_shards()
+    latest.write_all(skip_unchanged=skip_unchanged)
+    latest.write_meta(skip_unchanged=skip_unchanged)
 
     _LOG.debug('Writing difference')
     difference.io = ShardsS3IO(
@@ -1074,36 +1414,112 @@ def batch_results_job(batch_results: BatchResults):
         key=StatisticsBucketKeysBuilder.job_statistics(batch_results),
         obj=result.statistics(tenant, runner.failed)
     )
+    result.close()
     temp_dir.cleanup()
 
 
+def process_batch_results(br_uuid: str) -> None:
+    """
+    Processes one batch results item and saves its status
+    """
+    _LOG.info(f'Processing batch results with id {br_uuid}')
+    actions = []
+    batch_results = BatchResults.get_nullable(br_uuid)
+    if not batch_results:
+        _LOG.warning('Somehow batch results item does not exist. Skipping')
+        return
+    if batch_results.status == JobState.SUCCEEDED.value:
+        _LOG.info('Batch results already succeeded. Skipping')
+        return
+    try:
+        _LOG.info(f'Starting job for batch result')
+        batch_results_job(batch_results)
+        _LOG.info(f'Job for batch result {br_uuid} has finished')
+        actions.append(BatchResults.status.set(JobState.SUCCEEDED.value))
+    except ExecutorException as e:
+        _LOG.exception(f'Executor exception {e.error} occurred')
+        actions.append(BatchResults.status.set(JobState.FAILED.value))
+        actions.append(BatchResults.reason.set(traceback.format_exc()))
+    except Exception:
+        _LOG.exception('Unexpected exception occurred')
+        actions.append(BatchResults.status.set(JobState.FAILED.value))
+        actions.append(BatchResults.reason.set(traceback.format_exc()))
+    actions.append(BatchResults.stopped_at.set(utc_iso()))
+    _LOG.info('Saving batch results item')
+    batch_results.update(actions=actions)
+
+
+def fail_batch_results(br_uuid: str, reason: str) -> None:
+    """
+    Marks the batch results item as failed unless it has succeeded
+    """
+    batch_results = BatchResults.get_nullable(br_uuid)
+    if not batch_results or batch_results.status in (
+            JobState.SUCCEEDED.value, JobState.FAILED.value):
+        return
+    _LOG.warning(f'Batch results {br_uuid} failed: {reason}')
+    batch_results.update(actions=[
+        BatchResults.status.set(JobState.FAILED.value),
+        BatchResults.reason.set(reason),
+        BatchResults.stopped_at.set(utc_iso())
+    ])
+
+
+def process_spawned_batch_results(br_uuid: str, threshold: float) -> None:
+    """
+    Target of a process that is spawned to process one batch results item.
+    It gets the time threshold of the job and writes its own profile
+    """
+    global _TIME_THRESHOLD
+    _TIME_THRESHOLD = threshold
+    install_cloud_api_cassette()
+    if BSP.env.profiler_enabled():
+        _PROFILER.start(BSP.env.profiler_interval())
+        _PROFILER.put_tag('batch_job_id', BSP.env.batch_job_id())
+    try:
+        process_batch_results(br_uuid)
+    finally:
+        if _PROFILER.enabled:
+            upload_profile(batch_results_id=br_uuid)
+
+
 def multi_account_event_driven_job() -> int:
-    for br_uuid in BSP.environment_service.batch_results_ids():
-        _LOG.info(f'Processing batch results with id {br_uuid}')
-        actions = []
-        batch_results = BatchResults.get_nullable(br_uuid)
-        if not batch_results:
-            _LOG.warning('Somehow batch results item does not exist. Skipping')
-            continue
-        if batch_results.status == JobState.SUCCEEDED.value:
-            _LOG.info('Batch results already succeeded. Skipping')
+    """
+    Batch results of different tenants are independent. When more than one
+    process is allowed, each item is processed in its own process, so
+    credentials that are set to environment of one tenant cannot be seen
+    by another. Processes are spawned, not forked, because database and
+    SDK clients of this process are not fork-safe. Items that are not
+    started before the job time threshold are failed
+    """
+    pending = deque(BSP.environment_service.batch_results_ids())
+    processes = BSP.environment_service.event_driven_processes()
+    ctx = multiprocessing.get_context(BATCH_RESULTS_START_METHOD)
+    running: dict[int, tuple[multiprocessing.Process, str]] = {}
+    while pending or running:
+        while pending and len(running) < processes:
+            br_uuid = pending.popleft()
+            if get_time_left() <= utc_datetime().timestamp():
+                fail_batch_results(br_uuid, Runner.TIME_EXCEEDED_MESSAGE)
+                continue
+            if processes == 1:
+                process_batch_results(br_uuid)
+                continue
+            process = ctx.Process(target=process_spawned_batch_results,
+                                  args=(br_uuid, get_time_left()),
+                                  name=br_uuid)
+            process.start()
+            running[process.sentinel] = (process, br_uuid)
+        if not running:
             continue
-        try:
-            _LOG.info(f'Starting job for batch result')
-            batch_results_job(batch_results)
-            _LOG.info(f'Job for batch result {br_uuid} has finished')
-            actions.append(BatchResults.status.set(JobState.SUCCEEDED.value))
-        except ExecutorException as e:
-            _LOG.exception(f'Executor exception {e.error} occurred')
-            actions.append(BatchResults.status.set(JobState.FAILED.value))
-            actions.append(BatchResults.reason.set(traceback.format_exc()))
-        except Exception:
-            _LOG.exception('Unexpected exception occurred')
-            actions.append(BatchResults.status.set(JobState.FAILED.value))
-            actions.append(BatchResults.reason.set(traceback.format_exc()))
-        actions.append(BatchResults.stopped_at.set(utc_iso()))
-        _LOG.info('Saving batch results item')
-        batch_results.update(actions=actions)
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            process, br_uuid = running.pop(sentinel)
+            process.join()
+            if process.exitcode != 0:
+                fail_batch_results(
+                    br_uuid,
+                    f'Process exited with code {process.exitcode}'
+                )
     Path(CACHE_FILE).unlink(missing_ok=True)
     return 0
 
@@ -1131,9 +1547,10 @@ def single_account_standard_job() -> int:
     tenant = cast(Tenant, SP.modular_client.tenant_service().get(tenant_name))
 
     if job_id := BSP.env.job_id():
-        # custodian job id, present only for standard jobs
+        # custodian job id, present only for standard jobs and
+        # continuations of scheduled jobs
         job = cast(Job, SP.job_service.get_nullable(job_id))
-        if BSP.env.is_docker():
+        if BSP.env.is_docker() or BSP.env.is_scheduled():
             updater = JobUpdater(job)
         else:
             updater = NullJobUpdater(job)  # updated in caas-job-updater
@@ -1147,24 +1564,30 @@ def single_account_standard_job() -> int:
         job = updater.job
         BSP.env.override_environment({BatchJobEnv.CUSTODIAN_JOB_ID: job.id})
 
-    if BSP.env.is_scheduled():  # locking scanned regions
+    # continuation jobs keep the lock and timestamps of the first one
+    is_continuation = bool(BSP.env.checkpoint_key())
+    if BSP.env.is_scheduled() and not is_continuation:
+        # locking scanned regions
         TenantSettingJobLock(tenant_name).acquire(
             job_id=job.id,
             regions=BSP.env.target_regions() or {GLOBAL_REGION}
         )
         update_scheduled_job()
 
-    updater.created_at = utc_iso()
-    updater.started_at = utc_iso()
+    if not is_continuation:
+        updater.created_at = utc_iso()
+        updater.started_at = utc_iso()
     updater.status = JobState.RUNNING
     updater.update()
 
     temp_dir = tempfile.TemporaryDirectory()
 
+    continued = False
     try:
-        standard_job(job, tenant, Path(temp_dir.name))
-        updater.status = JobState.SUCCEEDED
-        updater.stopped_at = utc_iso()
+        continued = standard_job(job, tenant, Path(temp_dir.name))
+        if not continued:
+            updater.status = JobState.SUCCEEDED
+            updater.stopped_at = utc_iso()
         code = 0
     except ExecutorException as e:
         _LOG.exception(f'Executor exception {e.error} occurred')
@@ -1189,10 +1612,13 @@ def single_account_standard_job() -> int:
         code = 1
     finally:
         Path(CACHE_FILE).unlink(missing_ok=True)
-        TenantSettingJobLock(tenant_name).release(job.id)
+        if not continued:
+            TenantSettingJobLock(tenant_name).release(job.id)
         temp_dir.cleanup()
 
     updater.update()
+    if continued:
+        return code
 
     if BSP.env.is_docker() and BSP.env.is_licensed_job():
         _LOG.info('The job is licensed on premises. Updating in LM')
@@ -1207,8 +1633,58 @@ def single_account_standard_job() -> int:
     return code
 
 
+def submit_continuation(job: Job, checkpoint_key: str) -> str:
+    """
+    Submits a batch job that continues the current one from the given
+    checkpoint. The new batch job gets the same environment as the current
+    one. Number of the continuation is saved to the job before it's
+    submitted, so the state changes of the current batch job are not
+    reflected to the job anymore even if this process does not live long
+    enough to save the new batch job id
+    :return: id of the submitted batch job
+    """
+    current = SP.batch.get_job(BSP.env.batch_job_id()) or {}
+    continuation = BSP.env.continuation() + 1
+    environment = {
+        item['name']: item['value']
+        for item in current.get('container', {}).get('environment', ())
+    }
+    environment.update({
+        BatchJobEnv.CUSTODIAN_JOB_ID: job.id,
+        BatchJobEnv.CHECKPOINT_KEY: checkpoint_key,
+        BatchJobEnv.CONTINUATION: str(continuation)
+    })
+    params = dict(
+        job_name=current.get('jobName') or f'{job.tenant_name}-{job.id}',
+        job_queue=current.get('jobQueue'),
+        job_definition=current.get('jobDefinition'),
+        environment_variables=environment
+    )
+    if BSP.env.is_docker():
+        # started by the server, this process is about to exit
+        params['dispatch'] = False
+    updater = JobUpdater(job)
+    updater.continuation = continuation
+    updater.update()
+    try:
+        response = SP.batch.submit_job(**params)
+    except Exception:
+        # this batch job is still the one that owns the job
+        updater.continuation = BSP.env.continuation() or None
+        updater.update()
+        raise
+    updater.batch_job_id = response['jobId']
+    updater.update()
+    return response['jobId']
+
+
 @_XRAY.capture('Standard job')
-def standard_job(job: Job, tenant: Tenant, work_dir: Path):
+def standard_job(job: Job, tenant: Tenant, work_dir: Path) -> bool:
+    """
+    :return: True if the job has reached its lifetime and will be
+    continued by another batch job. Reports are written only by the last
+    batch job of the job
+    """
     cloud: Cloud  # not cloud but rather domain
     platform: Platform | None = None
     if pid := BSP.env.platform_id():
@@ -1228,6 +1704,9 @@ def standard_job(job: Job, tenant: Tenant, work_dir: Path):
     _XRAY.put_annotation('job_id', job.id)
     _XRAY.put_annotation('tenant_name', tenant.name)
     _XRAY.put_metadata('cloud', cloud.value)
+    _PROFILER.put_tag('job_id', job.id)
+    _PROFILER.put_tag('tenant', tenant.name)
+    _PROFILER.put_tag('cloud', cloud.value)
 
     licensed_urls = map(operator.itemgetter('s3_path'),
                         get_licensed_ruleset_dto_list(tenant, job))
@@ -1245,19 +1724,80 @@ def standard_job(job: Job, tenant: Tenant, work_dir: Path):
         exclude=get_rules_to_exclude(tenant)
     )
 
+    resources_cache = ResourcesCache()
     loader = PoliciesLoader(
         cloud=cloud,
         output_dir=work_dir,
-        regions=BSP.env.target_regions()
+        regions=BSP.env.target_regions(),
+        resources_cache=resources_cache,
+        compiled_cache=CompiledPoliciesCache(
+            directory=BSP.env.policies_cache_dir(),
+            client=SP.s3,
+            bucket=SP.environment_service.get_rulesets_bucket_name()
+        )
+    )
+
+    durations_key = StatisticsBucketKeysBuilder.policies_durations(
+        tenant, platform
+    )
+    durations = PoliciesDurations.load(
+        client=SP.s3,
+        bucket=SP.environment_service.get_statistics_bucket_name(),
+        key=durations_key
     )
 
-    with EnvironmentContext(credentials, reset_all=False):
-        runner = Runner.factory(cloud, loader.load_from_policies(policies))
+    checkpoint = JobCheckpoint(work_dir)
+    restored = {}
+    if restore_key := BSP.env.checkpoint_key():
+        _LOG.info('Restoring outputs of the previous attempts')
+        restored = checkpoint.restore(
+            client=SP.s3,
+            bucket=SP.environment_service.get_statistics_bucket_name(),
+            key=restore_key
+        )
+    completed = checkpoint.completed()
+
+    with EnvironmentContext(credentials, reset_all=False), resources_cache:
+        loaded = loader.load_from_policies(policies)
+        if completed:
+            _LOG.info(f'{len(completed)} policies were executed by the '
+                      f'previous attempts. Skipping them')
+            loaded = [
+                p for p in loaded if
+                (PoliciesLoader.get_policy_region(p), p.name) not in completed
+            ]
+        runner = Runner.factory(cloud, loaded)
+        runner.failed.update(restored)
         match BSP.environment_service.executor_mode():
             case ExecutorMode.CONSISTENT:
                 runner.start()
             case ExecutorMode.CONCURRENT:
-                runner.start_threads()
+                runner.order_longest_first(durations)
+                env = BSP.environment_service
+                runner.start_threads(
+                    threads=env.executor_threads(),
+                    group_concurrency=env.executor_group_concurrency(),
+                    max_group_concurrency=env.executor_max_group_concurrency()
+                )
+            case ExecutorMode.PARALLEL_PROCESSES:
+                runner.order_longest_first(durations)
+                runner.start_processes(
+                    BSP.environment_service.executor_processes()
+                )
+    checkpoint_key = StatisticsBucketKeysBuilder.job_checkpoint(job)
+    if runner.time_exceeded and BSP.env.can_continue():
+        _LOG.warning('Job has reached its lifetime. Saving checkpoint and '
+                     'submitting a continuation job')
+        checkpoint.save(
+            client=SP.s3,
+            bucket=SP.environment_service.get_statistics_bucket_name(),
+            key=checkpoint_key,
+            failed=runner.failed_in_time()
+        )
+        bid = submit_continuation(job, checkpoint_key)
+        _LOG.info(f'Continuation batch job {bid} was submitted')
+        return True
+
     result = JobResult(work_dir, cloud)
     if platform:
         keys_builder = PlatformReportsBucketKeysBuilder(platform)
@@ -1269,55 +1809,102 @@ def standard_job(job: Job, tenant: Tenant, work_dir: Path):
     meta = result.rules_meta()
     collection.meta = meta
 
-    _LOG.info('Going to upload to SIEM')
-    upload_to_siem(tenant=tenant, collection=collection,
-                   job=AmbiguousJob(job), platform=platform)
-
     collection.io = ShardsS3IO(
         bucket=SP.environment_service.default_reports_bucket_name(),
         key=keys_builder.job_result(job),
         client=SP.s3
     )
-
-    _LOG.debug('Writing job report')
-    collection.write_all()  # writes job report
-
-    latest = ShardsCollectionFactory.from_cloud(cloud)
-    latest.io = ShardsS3IO(
-        bucket=SP.environment_service.default_reports_bucket_name(),
+    latest = ShardsCollectionFactory.from_s3_key(
+        cloud=cloud,
         key=keys_builder.latest_key(),
+        bucket=SP.environment_service.default_reports_bucket_name(),
         client=SP.s3
     )
-
-    _LOG.debug('Pulling latest state')
-    latest.fetch_by_indexes(collection.shards.keys())
-    latest.fetch_meta()
+    upload_and_prefetch(tenant=tenant, collection=collection, latest=latest,
+                        job=AmbiguousJob(job), platform=platform)
 
     _LOG.debug('Writing latest state')
     latest.update(collection)
     latest.update_meta(meta)
-    latest.write_all()
-    latest.write_meta()
+    skip_unchanged = BSP.env.skip_unchanged_shards()
+    latest.write_all(skip_unchanged=skip_unchanged)
+    latest.write_meta(skip_unchanged=skip_unchanged)
 
     _LOG.info('Writing statistics')
+    statistics = result.statistics(tenant, runner.failed)
     SP.s3.gz_put_json(
         bucket=SP.environment_service.get_statistics_bucket_name(),
         key=StatisticsBucketKeysBuilder.job_statistics(job),
-        obj=result.statistics(tenant, runner.failed)
+        obj=statistics
     )
+    durations.update(statistics)
+    durations.save(
+        client=SP.s3,
+        bucket=SP.environment_service.get_statistics_bucket_name(),
+        key=durations_key
+    )
+    if restore_key:
+        SP.s3.delete_object(
+            bucket=SP.environment_service.get_statistics_bucket_name(),
+            key=restore_key
+        )
+    result.close()
     _LOG.info(f'Job \'{job.id}\' has ended')
+    return False
+
+
+def upload_profile(batch_results_id: str | None = None) -> None:
+    _PROFILER.stop()
+    _LOG.info(f'Writing profile of {_PROFILER.samples} samples to S3')
+    match BSP.env.profiler_format():
+        case ProfileFormat.COLLAPSED:
+            body, extension = _PROFILER.collapsed(), 'collapsed.txt'
+        case _:
+            body, extension = _PROFILER.speedscope(), 'speedscope.json'
+    # s3 metadata must be ascii and its total size is limited by 2KB
+    metadata = {
+        k.replace('_', '-'): v.encode('ascii', 'replace').decode()[:256]
+        for k, v in _PROFILER.tags.items()
+    }
+    try:
+        SP.s3.gz_put_object(
+            bucket=SP.environment_service.get_statistics_bucket_name(),
+            key=StatisticsBucketKeysBuilder.profile(
+                job_id=BSP.env.batch_job_id(),
+                extension=extension,
+                batch_results_id=batch_results_id
+            ),
+            body=body,
+            metadata=metadata
+        )
+    except Exception:  # the job itself has finished
+        _LOG.exception('Could not write profile to S3')
+
+
+def install_cloud_api_cassette() -> None:
+    if path := BSP.env.cloud_api_replay_dir():
+        _LOG.warning(f'Cloud API responses are replayed from {path}')
+        CloudApiCassette(path, replay=True).install()
+    elif path := BSP.env.cloud_api_record_dir():
+        _LOG.warning(f'Cloud API responses are recorded to {path}')
+        CloudApiCassette(path).install()
 
 
 def main(command: list[str] | None = None, environment: dict | None = None):
     env = environment or {}
     env.setdefault(ENV_AWS_DEFAULT_REGION, AWS_DEFAULT_REGION)
     BSP.environment_service.override_environment(env)
+    get_time_left()
 
-    buffer = io.BytesIO()
-    _XRAY.configure(emitter=BytesEmitter(buffer))  # noqa
+    install_cloud_api_cassette()
 
-    _XRAY.begin_segment('AWS Batch job')
-    sampled = _XRAY.is_sampled()
+    if BSP.env.profiler_enabled():
+        _LOG.info('Starting profiler')
+        _PROFILER.start(BSP.env.profiler_interval())
+        _PROFILER.put_tag('batch_job_id', BSP.env.batch_job_id())
+
+    buffer = io.BytesIO()
+    sampled = _XRAY.begin_segment('AWS Batch job', BytesEmitter(buffer))
     _LOG.info(f'Batch job is {"" if sampled else "NOT "}sampled')
     _XRAY.put_annotation('batch_job_id', BSP.env.batch_job_id())
 
@@ -1339,6 +1926,8 @@ def main(command: list[str] | None = None, environment: dict | None = None):
             key=StatisticsBucketKeysBuilder.xray_log(BSP.env.batch_job_id()),
             body=buffer
         )
+    if _PROFILER.enabled:
+        upload_profile()
     _LOG.info('Finished')
     sys.exit(code)
 
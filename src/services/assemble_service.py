@@ -37,6 +37,7 @@ class AssembleService:
                 str(self.environment_service.lm_token_lifetime_minutes()),
             'LOG_LEVEL': self.environment_service.batch_job_log_level(),
             BatchJobEnv.TENANT_NAME: tenant.name,
+            BatchJobEnv.CUSTOMER_NAME: tenant.customer_name,
             BatchJobEnv.PLATFORM_ID: platform_id,
             BatchJobEnv.CREDENTIALS_KEY: credentials_key,
             BatchJobEnv.JOB_TYPE: job_type.value if isinstance(job_type, BatchJobType) else job_type,  # noqa
@@ -1,17 +1,34 @@
 import dataclasses
+import json
 import os
+import signal
 import subprocess
 import sys
+import threading
+import time
 import uuid
 from pathlib import Path
 from typing import TypedDict
 
 from helpers import title_keys
-from helpers.constants import BatchJobEnv
+from helpers.constants import (
+    BatchJobEnv,
+    BatchJobType,
+    DEFAULT_EXECUTOR_MAX_JOBS,
+    DEFAULT_SYSTEM_CUSTOMER,
+)
 from helpers.log_helper import get_logger
 from helpers.time_helper import utc_iso, utc_datetime
 from services import SP
 from services.clients import Boto3ClientWrapper
+from services.clients.job_queue import (
+    EVENT_DRIVEN_PRIORITY,
+    JobQueue,
+    QueuedJob,
+    RUNNING,
+    STANDARD_PRIORITY,
+    pick_next,
+)
 from services.clients.sts import StsClient
 from services.environment_service import EnvironmentService
 
@@ -140,62 +157,452 @@ class BatchClient(Boto3ClientWrapper):
         return self.client.submit_job(**params)
 
 
+RUN_SCRIPT = (Path(__file__).parent.parent.parent / 'run.py').resolve()
+WARM_WORKER_SCRIPT = (
+    Path(__file__).parent.parent.parent / 'executor' / 'helpers' /
+    'warm_worker.py'
+).resolve()
+
+
+class _PooledProcess:
+    """
+    Job process that is forked by the warm worker. Mimics the part of
+    subprocess.Popen that is used by SubprocessBatchClient
+    """
+    __slots__ = ('pid', '_pool', '_job_id')
+
+    def __init__(self, pid: int, pool: 'WarmExecutorPool', job_id: str):
+        self.pid = pid
+        self._pool = pool
+        self._job_id = job_id
+
+    def poll(self) -> int | None:
+        return self._pool.exit_code(self._job_id, self.pid)
+
+    def kill(self) -> None:
+        if self.poll() is not None:
+            return  # the pid can belong to another process already
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class WarmExecutorPool:
+    """
+    Starts executor jobs by forking them from a long-living process that
+    has already imported Cloud Custodian and cloud SDKs. See warm_worker.py
+    """
+    def __init__(self, script: Path = RUN_SCRIPT, start_timeout: float = 30):
+        """
+        :param script: executor script that is run for each job
+        :param start_timeout: seconds to wait for a job process to start
+        """
+        self._script = script
+        self._start_timeout = start_timeout
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._worker: subprocess.Popen | None = None
+        self._pids: dict[str, int] = {}
+        self._exits: dict[str, int] = {}
+
+    @property
+    def alive(self) -> bool:
+        return self._worker is not None and self._worker.poll() is None
+
+    def _start(self) -> None:
+        _LOG.info('Starting warm executor worker')
+        r, w = os.pipe()
+        try:
+            self._worker = subprocess.Popen(
+                [sys.executable, WARM_WORKER_SCRIPT, self._script, str(w)],
+                stdin=subprocess.PIPE, pass_fds=(w,), shell=False
+            )
+        finally:
+            os.close(w)
+        threading.Thread(target=self._read, args=(r,), daemon=True,
+                         name='warm-worker-reader').start()
+
+    def _read(self, fd: int) -> None:
+        with os.fdopen(fd, 'r') as file:
+            for line in file:
+                item = json.loads(line)
+                with self._cond:
+                    if 'pid' in item:
+                        self._pids[item['id']] = item['pid']
+                    else:
+                        self._exits[item['id']] = item['exit']
+                    self._cond.notify_all()
+        with self._cond:
+            self._cond.notify_all()  # the worker is gone
+
+    def submit(self, job_id: str, env: dict) -> _PooledProcess:
+        """
+        Forks a new job process with the given environment.
+        Raises RuntimeError if the worker could not start it
+        """
+        with self._lock:
+            if not self.alive:
+                self._start()
+            try:
+                self._worker.stdin.write(
+                    json.dumps({'id': job_id, 'env': env}).encode() + b'\n'
+                )
+                self._worker.stdin.flush()
+            except OSError as e:
+                raise RuntimeError('Warm executor worker is gone') from e
+        with self._cond:
+            self._cond.wait_for(
+                lambda: job_id in self._pids or not self.alive,
+                timeout=self._start_timeout
+            )
+            pid = self._pids.pop(job_id, None)
+        if pid is None:
+            raise RuntimeError('Warm executor worker has not started the job')
+        return _PooledProcess(pid, self, job_id)
+
+    def exit_code(self, job_id: str, pid: int) -> int | None:
+        with self._cond:
+            if job_id in self._exits:
+                return self._exits[job_id]
+        if self.alive:
+            return None
+        # the worker is gone, so its jobs are reaped by init
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return -1
+        except PermissionError:
+            pass
+        return None
+
+    def forget(self, job_id: str) -> None:
+        with self._cond:
+            self._exits.pop(job_id, None)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._worker is not None:
+                self._worker.stdin.close()  # running jobs keep running
+                self._worker.wait()
+                self._worker = None
+
+
+class _OrphanProcess:
+    """
+    Job process that was started by another server process which is gone.
+    Its exit code cannot be known, so -1 is returned when it exits
+    """
+    __slots__ = ('pid',)
+
+    def __init__(self, pid: int | None):
+        self.pid = pid
+
+    def poll(self) -> int | None:
+        if self.pid is None:
+            return -1
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return -1
+        except PermissionError:
+            pass
+        return None
+
+    def kill(self) -> None:
+        _kill(self.pid)
+
+
+def _kill(pid: int | None) -> None:
+    if pid is None:
+        return
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def available_memory() -> int | None:
+    """
+    Memory in bytes that can be used by new processes without swapping.
+    None if it's unknown
+    """
+    try:
+        with open('/proc/meminfo') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
 @dataclasses.dataclass(slots=True, repr=False, frozen=True)
 class _Job:
     id: str
     name: str
-    process: subprocess.Popen
+    process: subprocess.Popen | _PooledProcess | _OrphanProcess
     started_at: int = dataclasses.field(
         default_factory=lambda: utc_datetime().timestamp() * 1e3
     )
 
     def serialize(self) -> BatchJob:
+        code = self.process.poll()
+        if code is None:
+            status = 'RUNNING'
+        elif code == 0:
+            status = 'SUCCEEDED'
+        else:
+            status = 'FAILED'
         return {
             'jobId': self.id,
             'startedAt': self.started_at,
-            'jobName': self.name
+            'jobName': self.name,
+            'status': status
         }
 
 
 class SubprocessBatchClient:
-    def __init__(self):
+    """
+    Runs executor jobs as local processes. Without a queue each job is
+    started immediately. With a queue submitted jobs wait until this host
+    has capacity: less than `max_jobs` are running and at least
+    `job_memory` bytes are available. See job_queue.py
+    """
+    def __init__(self, queue: JobQueue | None = None,
+                 pool: WarmExecutorPool | None = None,
+                 max_jobs: int = DEFAULT_EXECUTOR_MAX_JOBS,
+                 job_memory: int = 0, poll_interval: float = 5):
         self._jobs: dict[str, _Job] = {}  # job_id to Job
+        self._queue = queue
+        self._pool = pool
+        self._max_jobs = max_jobs
+        self._job_memory = job_memory
+        self._poll_interval = poll_interval
+
+        self._uid = uuid.uuid4().hex
+        self._lock = threading.Lock()  # guards self._jobs
+        self._dispatching = threading.Lock()
+        self._watcher_pid = None
 
     @classmethod
     def build(cls) -> 'SubprocessBatchClient':
-        return cls()
+        env = SP.environment_service
+        pool = None
+        if env.executor_warm_pool():
+            pool = WarmExecutorPool()
+        return cls(
+            queue=JobQueue.build(),
+            pool=pool,
+            max_jobs=env.executor_max_jobs(),
+            job_memory=env.executor_job_memory()
+        )
+
+    @property
+    def _owner(self) -> str:
+        # the client can be inherited by forked gunicorn workers
+        return f'{self._queue.host}:{os.getpid()}:{self._uid}'
+
+    def start(self) -> None:
+        """
+        Starts a thread that watches running jobs and starts queued ones.
+        It's started on first use anyway, but queued jobs left from the
+        previous run should not wait for it
+        """
+        if self._queue is None or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, daemon=True,
+                         name='batch-jobs-watcher').start()
+
+    def _watch(self) -> None:
+        while True:
+            try:
+                self.check()
+            except Exception:
+                _LOG.exception('Unexpected error watching local jobs')
+            time.sleep(self._poll_interval)
+
+    def _cleanup(self) -> list[tuple[str, int]]:
+        """
+        Forgets jobs which processes have exited. Returns their exit codes
+        """
+        finished = []
+        with self._lock:
+            for job_id, job in tuple(self._jobs.items()):
+                code = job.process.poll()
+                if code is None:
+                    continue
+                self._jobs.pop(job_id, None)
+                if isinstance(job.process, _PooledProcess):
+                    self._pool.forget(job_id)
+                finished.append((job_id, code))
+        return finished
+
+    def check(self) -> None:
+        """
+        Records exit codes of finished jobs, adopts jobs of dead server
+        processes and starts queued jobs if there is capacity
+        """
+        for job_id, code in self._cleanup():
+            self._queue.finish(job_id, code)
+        self._queue.heartbeat(self._owner)
+        for item in self._queue.adopt(self._owner):
+            _LOG.warning(f'Adopting job {item["_id"]} of a stopped '
+                         f'server process')
+            with self._lock:
+                self._jobs[item['_id']] = _Job(
+                    id=item['_id'],
+                    name=item.get('name'),
+                    process=_OrphanProcess(item.get('pid'))
+                )
+        self.dispatch()
+
+    def _has_capacity(self) -> bool:
+        running = len(self._queue.running())
+        if running >= self._max_jobs:
+            return False
+        if not running or not self._job_memory:
+            return True  # one job can always run
+        memory = available_memory()
+        return memory is None or memory >= self._job_memory
+
+    def dispatch(self) -> None:
+        """
+        Starts queued jobs while this host has capacity
+        """
+        owner = self._owner
+        with self._dispatching:
+            if not self._queue.acquire(owner):
+                return  # another process is dispatching right now
+            try:
+                while self._has_capacity():
+                    job = pick_next(self._queue.queued(),
+                                    self._queue.last_started())
+                    if not job:
+                        break
+                    item = self._queue.claim(job['_id'], owner)
+                    if item:
+                        self._run(item)
+            finally:
+                self._queue.release(owner)
+
+    def _run(self, item: QueuedJob) -> None:
+        job_id = item['_id']
+        try:
+            process = self._start(job_id, {**os.environ, **item['env']})
+        except OSError as e:
+            _LOG.exception(f'Cannot start job {job_id}')
+            self._queue.fail(job_id, f'Cannot start executor: {e}')
+            return
+        self._queue.set_pid(job_id, process.pid)
+        with self._lock:
+            self._jobs[job_id] = _Job(id=job_id, name=item.get('name'),
+                                      process=process)
+
+    def _start(self, job_id: str, env: dict
+               ) -> subprocess.Popen | _PooledProcess:
+        if self._pool:
+            try:
+                return self._pool.submit(job_id, env)
+            except RuntimeError:
+                _LOG.exception('Cannot start job using warm executor '
+                               'worker. Starting a new process')
+        return subprocess.Popen([sys.executable, RUN_SCRIPT], env=env,
+                                shell=False)
+
+    @staticmethod
+    def _serialize(item: QueuedJob) -> BatchJob:
+        job = {
+            'jobId': item['_id'],
+            'jobName': item.get('name'),
+            'status': item['status'],
+            'createdAt': int(item['submitted_at'] * 1e3),
+            'container': {'environment': [
+                {'name': k, 'value': v} for k, v in item['env'].items()
+            ]}
+        }
+        if 'started_at' in item:
+            job['startedAt'] = int(item['started_at'] * 1e3)
+        if 'stopped_at' in item:
+            job['stoppedAt'] = int(item['stopped_at'] * 1e3)
+        if 'reason' in item:
+            job['statusReason'] = item['reason']
+        if 'exit_code' in item:
+            job['container']['exitCode'] = item['exit_code']
+        return job
 
     def submit_job(self, environment_variables: dict = None,
-                   job_name: str = None, **kwargs
+                   job_name: str = None, dispatch: bool = True, **kwargs
                    ) -> BatchJob:
+        """
+        :param dispatch: whether to try starting the job right away. Jobs
+        submitted by an executor itself must be only queued, so that they
+        are started by the server process that watches the queue instead
+        of the short-living executor
+        """
         environment_variables = environment_variables or {}
-        # self.check_ability_to_start_job()
 
         # Popen raises TypeError in case there is an env where value is None
         job_id = str(uuid.uuid4())
         environment_variables[BatchJobEnv.JOB_ID] = job_id
         environment_variables[
             BatchJobEnv.SUBMITTED_AT] = utc_iso()  # for scheduled jobs
-        env = {**os.environ, **environment_variables}
-        process = subprocess.Popen([
-            sys.executable,
-            (Path(__file__).parent.parent.parent / 'run.py').resolve()
-        ], env=env, shell=False)
-        job = _Job(
-            id=job_id,
-            process=process,
-            name=job_name
-        )
-        self._jobs[job_id] = job  # MOVE TODO think how to gc
-        return job.serialize()
+        if self._queue is None:
+            self._cleanup()
+            env = {**os.environ, **environment_variables}
+            job = _Job(
+                id=job_id,
+                process=self._start(job_id, env),
+                name=job_name
+            )
+            self._jobs[job_id] = job
+            return job.serialize()
 
-    def terminate_job(self, job_id: str, **kwargs):
-        if job_id not in self._jobs:
+        if (environment_variables.get(BatchJobEnv.JOB_TYPE) ==
+                BatchJobType.EVENT_DRIVEN.value):
+            priority = EVENT_DRIVEN_PRIORITY
+        else:
+            priority = STANDARD_PRIORITY
+        customer = (environment_variables.get(BatchJobEnv.CUSTOMER_NAME) or
+                    environment_variables.get(BatchJobEnv.SYSTEM_CUSTOMER_NAME)
+                    or DEFAULT_SYSTEM_CUSTOMER)
+        item = self._queue.put(job_id, job_name, customer, priority,
+                               environment_variables)
+        if not dispatch:
+            return self._serialize(item)
+        self.start()
+        self.dispatch()
+        return self.get_job(job_id)
+
+    def terminate_job(self, job_id: str, reason: str = 'Terminating job.',
+                      **kwargs):
+        if self._queue is None:
+            if job_id not in self._jobs:
+                return
+            job = self._jobs.pop(job_id)
+            job.process.kill()
             return
-        job = self._jobs.pop(job_id)
-        job.process.kill()
 
-    def get_job(self, job_id: str) -> BatchJob | None:
-        job = self._jobs.get(job_id)
+        with self._dispatching:  # so that the job is not being started
+            item = self._queue.get(job_id)
+            if not item or not self._queue.fail(job_id, reason):
+                return  # already finished
+            with self._lock:
+                job = self._jobs.pop(job_id, None)
         if job:
-            return job.serialize()
+            job.process.kill()
+            if isinstance(job.process, _PooledProcess):
+                self._pool.forget(job_id)
+        elif item['status'] == RUNNING and item.get('host') == self._queue.host:
+            _kill(item.get('pid'))  # started by another server process
+
+    def get_job(self, job_id: str) -> BatchJob | None:
+        if self._queue is None:
+            job = self._jobs.get(job_id)
+            if job:
+                return job.serialize()
+            return
+        item = self._queue.get(job_id)
+        if item:
+            return self._serialize(item)
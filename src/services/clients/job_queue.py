@@ -0,0 +1,217 @@
+"""
+Queue of on-prem executor jobs persisted in MongoDB. SubprocessBatchClient
+puts every submitted job here and starts the queued ones only when the host
+has capacity, so a burst of jobs cannot start dozens of executors at once.
+Queued jobs survive restarts of the server.
+"""
+import os
+import socket
+import time
+from datetime import timedelta
+from typing import TypedDict, cast
+
+from pymongo import ASCENDING, MongoClient, ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from helpers.constants import CAASEnv
+from helpers.log_helper import get_logger
+from helpers.time_helper import utc_datetime
+
+_LOG = get_logger(__name__)
+
+JOB_QUEUE_COLLECTION_NAME = 'CaaSLocalJobQueue'
+LOCK_ID = 'dispatch-lock'
+# jobs of a server process that has not reported for so long are adopted
+HEARTBEAT_TIMEOUT = 60
+FINISHED_JOBS_TTL = timedelta(days=7)
+
+# the same statuses as AWS Batch uses
+QUEUED = 'RUNNABLE'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+
+# lower goes first
+EVENT_DRIVEN_PRIORITY = 0
+STANDARD_PRIORITY = 1
+
+
+class QueuedJob(TypedDict, total=False):
+    _id: str  # batch job id
+    name: str
+    customer: str
+    priority: int
+    status: str
+    env: dict[str, str]
+    submitted_at: float
+    started_at: float
+    stopped_at: float
+    host: str
+    owner: str  # server process that started the job
+    heartbeat: float
+    pid: int
+    exit_code: int
+    reason: str
+
+
+def pick_next(queued: list[QueuedJob], last_started: dict[str, float]
+              ) -> QueuedJob | None:
+    """
+    Chooses the job to start. Jobs with higher priority go first. Among
+    them customers take turns: the customer whose job was started longest
+    ago goes first, so one customer cannot hold the queue with a burst of
+    jobs. Jobs of one customer are started in submission order
+    :param queued: queued jobs sorted by submission time
+    :param last_started: customer to the time its last job was started
+    """
+    if not queued:
+        return
+    priority = min(job['priority'] for job in queued)
+    first = {}
+    for job in queued:
+        if job['priority'] == priority:
+            first.setdefault(job['customer'], job)
+    return min(first.values(), key=lambda job: (
+        last_started.get(job['customer'], 0.), job['submitted_at']
+    ))
+
+
+class JobQueue:
+    """
+    Only the process holding the dispatch lock starts jobs. The lock is
+    a lease so the queue is not blocked forever if that process dies
+    """
+    __slots__ = '_collection', 'host'
+
+    def __init__(self, collection: Collection, host: str | None = None):
+        self._collection = collection
+        self.host = host or socket.gethostname()
+
+    @classmethod
+    def build(cls) -> 'JobQueue':
+        from models import MONGO_CLIENT
+        collection = cast(MongoClient, MONGO_CLIENT).get_database(
+            os.getenv(CAASEnv.MONGO_DATABASE)
+        ).get_collection(JOB_QUEUE_COLLECTION_NAME)
+        collection.create_index([('status', ASCENDING),
+                                 ('submitted_at', ASCENDING)])
+        collection.create_index('expire_at', expireAfterSeconds=0)
+        return cls(collection)
+
+    def put(self, job_id: str, name: str | None, customer: str,
+            priority: int, env: dict[str, str]) -> QueuedJob:
+        item = {
+            '_id': job_id,
+            'name': name,
+            'customer': customer,
+            'priority': priority,
+            'status': QUEUED,
+            'env': env,
+            'submitted_at': time.time()
+        }
+        self._collection.insert_one(item)
+        return cast(QueuedJob, item)
+
+    def get(self, job_id: str) -> QueuedJob | None:
+        return self._collection.find_one({'_id': job_id})
+
+    def queued(self) -> list[QueuedJob]:
+        return list(self._collection.find(
+            {'status': QUEUED},
+            ('customer', 'priority', 'submitted_at'),
+            sort=[('submitted_at', ASCENDING)]
+        ))
+
+    def running(self) -> list[QueuedJob]:
+        """
+        Jobs running on this host
+        """
+        return list(self._collection.find(
+            {'status': RUNNING, 'host': self.host},
+            ('pid', 'started_at')
+        ))
+
+    def last_started(self) -> dict[str, float]:
+        cursor = self._collection.aggregate([
+            {'$match': {'started_at': {'$exists': True}}},
+            {'$group': {'_id': '$customer', 'last': {'$max': '$started_at'}}}
+        ])
+        return {item['_id']: item['last'] for item in cursor}
+
+    def claim(self, job_id: str, owner: str) -> QueuedJob | None:
+        """
+        Marks a queued job as running on this host. Returns None if the
+        job is not queued anymore
+        """
+        now = time.time()
+        return self._collection.find_one_and_update(
+            {'_id': job_id, 'status': QUEUED},
+            {'$set': {'status': RUNNING, 'host': self.host, 'owner': owner,
+                      'started_at': now, 'heartbeat': now}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def heartbeat(self, owner: str) -> None:
+        self._collection.update_many(
+            {'status': RUNNING, 'owner': owner},
+            {'$set': {'heartbeat': time.time()}}
+        )
+
+    def adopt(self, owner: str) -> list[QueuedJob]:
+        """
+        Takes running jobs of this host whose owners have stopped
+        sending heartbeats, e.g. because the server was restarted
+        """
+        adopted = []
+        while item := self._collection.find_one_and_update(
+                {'status': RUNNING, 'host': self.host,
+                 'owner': {'$ne': owner},
+                 'heartbeat': {'$lt': time.time() - HEARTBEAT_TIMEOUT}},
+                {'$set': {'owner': owner, 'heartbeat': time.time()}},
+                ('name', 'pid'),
+                return_document=ReturnDocument.AFTER):
+            adopted.append(item)
+        return adopted
+
+    def set_pid(self, job_id: str, pid: int) -> None:
+        self._collection.update_one({'_id': job_id}, {'$set': {'pid': pid}})
+
+    def _stop(self, job_id: str, statuses: list[str], status: str,
+              **fields) -> bool:
+        result = self._collection.update_one(
+            {'_id': job_id, 'status': {'$in': statuses}},
+            {'$set': {'status': status, 'stopped_at': time.time(),
+                      'expire_at': utc_datetime() + FINISHED_JOBS_TTL,
+                      **fields}}
+        )
+        return result.modified_count == 1
+
+    def finish(self, job_id: str, exit_code: int) -> bool:
+        return self._stop(
+            job_id, [RUNNING], SUCCEEDED if exit_code == 0 else FAILED,
+            exit_code=exit_code
+        )
+
+    def fail(self, job_id: str, reason: str) -> bool:
+        """
+        Fails a queued or running job. Returns False if the job has
+        already finished
+        """
+        return self._stop(job_id, [QUEUED, RUNNING], FAILED, reason=reason)
+
+    def acquire(self, owner: str, lease: float = 30) -> bool:
+        now = time.time()
+        try:
+            self._collection.find_one_and_update(
+                {'_id': LOCK_ID,
+                 '$or': [{'until': {'$lt': now}}, {'owner': owner}]},
+                {'$set': {'owner': owner, 'until': now + lease}},
+                upsert=True
+            )
+        except DuplicateKeyError:  # the lock is held by someone else
+            return False
+        return True
+
+    def release(self, owner: str) -> None:
+        self._collection.delete_one({'_id': LOCK_ID, 'owner': owner})
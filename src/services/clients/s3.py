@@ -1,4 +1,3 @@
-import gzip
 import io
 import mimetypes
 import os
@@ -13,6 +12,7 @@ from botocore.exceptions import ClientError
 from modular_sdk.services.aws_creds_provider import ModularAssumeRoleClient
 from urllib3.util import Url, parse_url
 
+from helpers.codecs import Codec, GZIP
 from helpers.constants import CAASEnv
 from helpers.log_helper import get_logger
 from services.clients import (Boto3ClientWrapperFactory, Boto3ClientFactory,
@@ -93,7 +93,9 @@ class S3Client(Boto3ClientWrapper):
     """
     Most methods have their gz equivalent with prefix gz_. Such methods
     add .gz to bucket key, compress/decompress content (if the method
-    interacts with content) and add gzip ContentEncoding to metadata
+    interacts with content) and add gzip ContentEncoding to metadata.
+    Another codec can be given to gz_ methods, then its extension and
+    encoding are used instead of gzip ones
     """
     service_name = 's3'
     s3_not_available = re.compile(r'[^a-zA-Z0-9!-_.*()]')
@@ -111,10 +113,8 @@ class S3Client(Boto3ClientWrapper):
         return re.sub(cls.s3_not_available, '-', key)
 
     @staticmethod
-    def _gz_key(key: str) -> str:
-        if not key.endswith('.gz'):
-            key = key.strip('.') + '.gz'
-        return key
+    def _gz_key(key: str, codec: Codec = GZIP) -> str:
+        return codec.key(key)
 
     @classmethod
     def factory(cls) -> S3ClientWrapperFactory:
@@ -139,7 +139,8 @@ class S3Client(Boto3ClientWrapper):
         return ct, ce
 
     def put_object(self, bucket: str, key: str, body: bytes | BinaryIO,
-                   content_type: str = None, content_encoding: str = None):
+                   content_type: str = None, content_encoding: str = None,
+                   metadata: dict[str, str] | None = None):
         """
         Uploads the provided stream of bytes or raw bytes.
         :param bucket:
@@ -147,6 +148,7 @@ class S3Client(Boto3ClientWrapper):
         :param body:
         :param content_type:
         :param content_encoding:
+        :param metadata: user-defined object metadata
         :return:
         """
         ct, ce = self._resolve_content_type(key, content_type,
@@ -156,6 +158,8 @@ class S3Client(Boto3ClientWrapper):
             params.update(ContentType=ct)
         if ce:
             params.update(ContentEncoding=ce)
+        if metadata:
+            params.update(Metadata=metadata)
         if isinstance(body, bytes):
             body = io.BytesIO(body)
         return self.resource.Bucket(bucket).upload_fileobj(
@@ -164,7 +168,9 @@ class S3Client(Boto3ClientWrapper):
 
     def gz_put_object(self, bucket: str, key: str, body: bytes | BinaryIO,
                       gz_buffer: BinaryIO = None, content_type: str = None,
-                      content_encoding: str = None):
+                      content_encoding: str = None,
+                      metadata: dict[str, str] | None = None,
+                      codec: Codec = GZIP):
         """
         Uploads the file adding .gz to the file extension and compressing the
         body
@@ -175,18 +181,19 @@ class S3Client(Boto3ClientWrapper):
         Otherwise - in memory. Argument can be used for large files
         :param content_type:
         :param content_encoding:
+        :param metadata: user-defined object metadata
+        :param codec:
         :return:
         """
         if not gz_buffer:
             gz_buffer = io.BytesIO()
-        with gzip.GzipFile(fileobj=gz_buffer, mode='wb') as gz:
-            if isinstance(body, bytes):
-                gz.write(body)
-            else:
-                shutil.copyfileobj(body, gz)
+        if isinstance(body, bytes):
+            body = io.BytesIO(body)
+        codec.compress_stream(body, gz_buffer)
         gz_buffer.seek(0)
-        return self.put_object(bucket, self._gz_key(key), gz_buffer,
-                               content_type, content_encoding)
+        return self.put_object(bucket, self._gz_key(key, codec), gz_buffer,
+                               content_type, content_encoding or codec.name,
+                               metadata)
 
     def get_object(self, bucket: str, key: str,
                    buffer: BinaryIO = None) -> BinaryIO | None:
@@ -213,9 +220,79 @@ class S3Client(Boto3ClientWrapper):
         buffer.seek(0)
         return buffer
 
+    def get_object_range(self, bucket: str, key: str,
+                         start: int | None = None,
+                         end: int | None = None) -> bytes | None:
+        """
+        Downloads only the given range of bytes of an object using
+        ranged GET. Both ends are inclusive like in HTTP Range header.
+        If only `end` is given, the last `end` bytes are returned
+        :param bucket:
+        :param key:
+        :param start: first byte offset
+        :param end: last byte offset or suffix length if start is not given
+        :return: None in case the key does not exist
+        """
+        if start is None and end is None:
+            raise ValueError('start or end must be provided')
+        if start is None:
+            rng = f'bytes=-{end}'
+        elif end is None:
+            rng = f'bytes={start}-'
+        else:
+            rng = f'bytes={start}-{end}'
+        try:
+            resp = self.client.get_object(Bucket=bucket, Key=key, Range=rng)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('NoSuchKey', '404'):
+                return
+            if code == 'InvalidRange':  # empty object
+                return b''
+            _LOG.exception(f'Unexpected error occurred in '
+                           f'get_object_range: s3://{bucket}/{key}')
+            raise e
+        return resp['Body'].read()
+
+    def get_object_if_changed(self, bucket: str, key: str,
+                              etag: str | None = None,
+                              buffer: BinaryIO = None
+                              ) -> tuple[BinaryIO | None, str | None]:
+        """
+        Conditional GET. Downloads the object only if its current ETag
+        differs from the given one
+        :param bucket:
+        :param key:
+        :param etag: ETag of the version that the caller already has
+        :param buffer:
+        :return: body and current ETag. Body is None if the object is not
+        modified. Both are None if the object does not exist
+        """
+        params = dict(Bucket=bucket, Key=key)
+        if etag:
+            params.update(IfNoneMatch=etag)
+        try:
+            resp = self.client.get_object(**params)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in ('NoSuchKey', '404'):
+                return None, None
+            if code in ('304', 'NotModified'):
+                return None, etag
+            _LOG.exception(f'Unexpected error occurred in '
+                           f'get_object_if_changed: s3://{bucket}/{key}')
+            raise e
+        if not buffer:
+            buffer = io.BytesIO()
+        with resp['Body'] as body:
+            shutil.copyfileobj(body, buffer)
+        buffer.seek(0)
+        return buffer, resp['ETag']
+
     def gz_get_object(self, bucket: str, key: str,
                       buffer: BinaryIO = None,
-                      gz_buffer: BinaryIO = None) -> BinaryIO | None:
+                      gz_buffer: BinaryIO = None,
+                      codec: Codec = GZIP) -> BinaryIO | None:
         """
         :param bucket:
         :param key:
@@ -223,21 +300,61 @@ class S3Client(Boto3ClientWrapper):
         :param gz_buffer: can be optionally provided to use as a buffer for
         compression. You can provide some temp file in case the size of body
         is expected to be large
+        :param codec:
         :return:
         """
         if not gz_buffer:
             gz_buffer = io.BytesIO()
-        stream = self.get_object(bucket, self._gz_key(key), gz_buffer)
+        stream = self.get_object(bucket, self._gz_key(key, codec), gz_buffer)
         if not stream:
             return
         gz_buffer.seek(0)
         if not buffer:
             buffer = io.BytesIO()
-        with gzip.GzipFile(fileobj=gz_buffer, mode='rb') as gz:
-            shutil.copyfileobj(gz, buffer)
+        codec.decompress_stream(gz_buffer, buffer)
         buffer.seek(0)
         return buffer
 
+    def get_object_stream(self, bucket: str, key: str) -> BinaryIO | None:
+        """
+        Returns not read body of the object, so it can be consumed
+        chunk by chunk. The caller is responsible for closing it.
+        In case the key does not exist, None is returned
+        :param bucket:
+        :param key:
+        :return:
+        """
+        try:
+            resp = self.client.get_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return
+            _LOG.exception(f'Unexpected error occurred in '
+                           f'get_object_stream: s3://{bucket}/{key}')
+            raise e
+        return resp['Body']
+
+    @staticmethod
+    def _iter_gz_lines(body: BinaryIO, codec: Codec = GZIP
+                       ) -> Generator[bytes, None, None]:
+        with body, codec.reader(body) as reader:
+            yield from reader
+
+    def gz_iter_lines(self, bucket: str, key: str, codec: Codec = GZIP
+                      ) -> Generator[bytes, None, None] | None:
+        """
+        Decompresses the object on the fly while downloading it and yields
+        its lines. Neither compressed nor decompressed content is kept in
+        memory as a whole. In case the key does not exist, None is returned
+        :param bucket:
+        :param key:
+        :return:
+        """
+        body = self.get_object_stream(bucket, self._gz_key(key, codec))
+        if body is None:
+            return
+        return self._iter_gz_lines(body, codec)
+
     def put_json(self, bucket: str, key: str, obj: Json):
         return self.put_object(
             bucket=bucket,
@@ -246,7 +363,9 @@ class S3Client(Boto3ClientWrapper):
             content_type='application/json'
         )
 
-    def gz_put_json(self, bucket: str, key: str, obj: Json):
+    def gz_put_json(self, bucket: str, key: str, obj: Json,
+                    metadata: dict[str, str] | None = None,
+                    codec: Codec = GZIP):
         # ignoring key, cause you specifically used this method.
         # So it must be json and gzip
         return self.gz_put_object(
@@ -254,7 +373,9 @@ class S3Client(Boto3ClientWrapper):
             key=key,
             body=self._enc.encode(obj),
             content_type='application/json',
-            content_encoding='gzip'
+            content_encoding=codec.name,
+            metadata=metadata,
+            codec=codec
         )
 
     def get_json(self, bucket: str, key: str) -> Json:
@@ -265,8 +386,9 @@ class S3Client(Boto3ClientWrapper):
         body.close()
         return result
 
-    def gz_get_json(self, bucket: str, key: str) -> Json:
-        body = self.gz_get_object(bucket, key)
+    def gz_get_json(self, bucket: str, key: str,
+                    codec: Codec = GZIP) -> Json:
+        body = self.gz_get_object(bucket, key, codec=codec)
         if not body:
             return {}
         result = self._dec.decode(cast(io.BytesIO, body).getvalue())
@@ -276,8 +398,9 @@ class S3Client(Boto3ClientWrapper):
     def delete_object(self, bucket: str, key: str):
         self.client.delete_object(Bucket=bucket, Key=key)
 
-    def gz_delete_object(self, bucket: str, key: str):
-        self.delete_object(bucket, self._gz_key(key))
+    def gz_delete_object(self, bucket: str, key: str,
+                         codec: Codec = GZIP):
+        self.delete_object(bucket, self._gz_key(key, codec))
 
     def object_meta(self, bucket: str, key: str):
         obj = self.resource.Object(bucket, key)
@@ -289,12 +412,31 @@ class S3Client(Boto3ClientWrapper):
                 return
             raise e
 
+    def object_metadata(self, bucket: str, key: str
+                        ) -> dict[str, str] | None:
+        """
+        Returns user-defined metadata of the object making a HEAD request.
+        None is returned in case the object does not exist
+        :param bucket:
+        :param key:
+        :return:
+        """
+        obj = self.object_meta(bucket, key)
+        if obj is None:
+            return
+        return obj.metadata or {}
+
+    def gz_object_metadata(self, bucket: str, key: str,
+                           codec: Codec = GZIP) -> dict[str, str] | None:
+        return self.object_metadata(bucket, self._gz_key(key, codec))
+
     def object_exists(self, bucket: str, key: str) -> bool:
         # or better use list_objects with limit 1
         return bool(self.object_meta(bucket, key))
 
-    def gz_object_exists(self, bucket: str, key: str) -> bool:
-        return self.object_exists(bucket, self._gz_key(key))
+    def gz_object_exists(self, bucket: str, key: str,
+                         codec: Codec = GZIP) -> bool:
+        return self.object_exists(bucket, self._gz_key(key, codec))
 
     def list_objects(self, bucket: str, prefix: Optional[str] = None,
                      page_size: Optional[int] = None,
@@ -447,11 +589,16 @@ class ModularAssumeRoleS3Service(S3Client):
     # the implementation in S3Client uses s3 resource to handle multipart
     # upload if necessary. Currently, we can access only client here, so
     # this implementation
-    def put_object(self, bucket: str, key: str, body: bytes | BinaryIO):
-        ct, ce = mimetypes.guess_type(key)
+    def put_object(self, bucket: str, key: str, body: bytes | BinaryIO,
+                   content_type: str = None, content_encoding: str = None,
+                   metadata: dict[str, str] | None = None):
+        ct, ce = self._resolve_content_type(key, content_type,
+                                            content_encoding)
         params = dict(Bucket=bucket, Key=key, Body=body)
         if ct:
             params.update(ContentType=ct)
         if ce:
             params.update(ContentEncoding=ce)
+        if metadata:
+            params.update(Metadata=metadata)
         return self.client.put_object(**params)
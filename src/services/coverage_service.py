@@ -1,11 +1,12 @@
 from enum import Enum
 from statistics import mean
+from typing import Iterable
 
 from helpers.constants import GLOBAL_REGION, Cloud
 from helpers.log_helper import get_logger
 from helpers.reports import Standard
 from services.mappings_collector import LazyLoadedMappingsCollector
-from services.sharding import ShardsCollection
+from services.sharding import BaseShardPart, ShardsCollection
 
 
 class CoverageKey(str, Enum):
@@ -107,20 +108,28 @@ class CoverageService:
         :param collection:
         :return: Points
         """
-        remapped = {}  # policy to its parts
-        for part in collection.iter_parts():
-            remapped.setdefault(part.policy, []).append(part)
+        return self.points_from_parts(collection.iter_parts())
+
+    def points_from_parts(self, parts: Iterable[BaseShardPart]
+                          ) -> RegionPoints:
+        """
+        The same as points_from_collection but parts are iterated only
+        once and not kept, so stored parts can be given without fetching
+        :param parts:
+        :return: Points
+        """
+        standards = {}  # policy to its standards
         points = {}
-        for policy, parts in remapped.items():
-            standards = Standard.deserialize(
-                self._mappings_collector.standard.get(policy) or {}
-            )
-            for part in parts:
-                points.setdefault(part.location, {})
-                for standard in standards:
-                    points[part.location].setdefault(standard, set())
-                    if not part.resources:
-                        points[part.location][standard].update(standard.points)
+        for part in parts:
+            if part.policy not in standards:
+                standards[part.policy] = Standard.deserialize(
+                    self._mappings_collector.standard.get(part.policy) or {}
+                )
+            points.setdefault(part.location, {})
+            for standard in standards[part.policy]:
+                points[part.location].setdefault(standard, set())
+                if not part.resources:
+                    points[part.location][standard].update(standard.points)
         return points
 
     def standards_coverage(self, cloud: Cloud) -> dict:
@@ -187,7 +196,11 @@ class CoverageService:
 
     def coverage_from_collection(self, collection: ShardsCollection,
                                  cloud: Cloud) -> dict:
-        points = self.points_from_collection(collection)
+        return self.coverage_from_parts(collection.iter_parts(), cloud)
+
+    def coverage_from_parts(self, parts: Iterable[BaseShardPart],
+                            cloud: Cloud) -> dict:
+        points = self.points_from_parts(parts)
         if cloud == Cloud.AWS:
             points = self.distribute_global(points)
         if cloud == Cloud.AZURE:
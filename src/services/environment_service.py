@@ -5,6 +5,8 @@ from typing import Mapping
 from helpers.constants import (
     CAASEnv,
     DEFAULT_EVENTS_TTL_HOURS,
+    DEFAULT_EXECUTOR_JOB_MEMORY_MB,
+    DEFAULT_EXECUTOR_MAX_JOBS,
     DEFAULT_INNER_CACHE_TTL_SECONDS,
     DEFAULT_LM_TOKEN_LIFETIME_MINUTES,
     DEFAULT_METRICS_BUCKET_NAME,
@@ -13,6 +15,8 @@ from helpers.constants import (
     DEFAULT_RECOMMENDATION_BUCKET_NAME,
     DEFAULT_REPORTS_BUCKET_NAME,
     DEFAULT_RULESETS_BUCKET_NAME,
+    DEFAULT_SHARDS_CACHE_MAX_SIZE_MB,
+    DEFAULT_SHARDS_IO_WORKERS,
     DEFAULT_STATISTICS_BUCKET_NAME,
     DOCKER_SERVICE_MODE,
     ENV_TRUE,
@@ -145,6 +149,35 @@ class EnvironmentService:
             self._environment.get(CAASEnv.SKIP_CLOUD_IDENTIFIER_VALIDATION))
         return from_env.lower() in ENV_TRUE
 
+    def executor_warm_pool(self) -> bool:
+        """
+        On-prem only. Whether executor jobs are forked from a process that
+        has already imported Cloud Custodian instead of starting python
+        for each job
+        """
+        from_env = str(self._environment.get(CAASEnv.EXECUTOR_WARM_POOL))
+        return from_env.lower() in ENV_TRUE
+
+    def executor_max_jobs(self) -> int:
+        """
+        On-prem only. Max number of executor jobs that run on this host at
+        the same time. Others wait in the queue
+        """
+        from_env = str(self._environment.get(CAASEnv.EXECUTOR_MAX_JOBS))
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return DEFAULT_EXECUTOR_MAX_JOBS
+
+    def executor_job_memory(self) -> int:
+        """
+        On-prem only. Memory in bytes that must be available on the host
+        to start one more executor job. 0 disables the check
+        """
+        from_env = str(self._environment.get(CAASEnv.EXECUTOR_JOB_MEMORY_MB))
+        if from_env.isdigit():
+            return int(from_env) * 1024 * 1024
+        return DEFAULT_EXECUTOR_JOB_MEMORY_MB * 1024 * 1024
+
     def is_docker(self) -> bool:
         return (self._environment.get(CAASEnv.SERVICE_MODE) ==
                 DOCKER_SERVICE_MODE)
@@ -261,6 +294,54 @@ class EnvironmentService:
             return int(from_env)
         return DEFAULT_INNER_CACHE_TTL_SECONDS
 
+    def shards_io_workers(self) -> int:
+        """
+        Max number of shards that are downloaded or uploaded concurrently.
+        1 means that shards are processed one by one
+        :return:
+        """
+        from_env = str(self._environment.get(CAASEnv.SHARDS_IO_WORKERS))
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env)
+        return DEFAULT_SHARDS_IO_WORKERS
+
+    def shards_cache_dir(self) -> str | None:
+        """
+        Directory where downloaded shards are cached. Makes sense for
+        long-living processes (on-prem API). None means no cache
+        :return:
+        """
+        return self._environment.get(CAASEnv.SHARDS_CACHE_DIR) or None
+
+    def shards_cache_max_size(self) -> int:
+        """
+        Max size of shards cache in bytes
+        :return:
+        """
+        from_env = str(self._environment.get(
+            CAASEnv.SHARDS_CACHE_MAX_SIZE_MB))
+        if from_env.isdigit() and int(from_env) > 0:
+            return int(from_env) * 1024 * 1024
+        return DEFAULT_SHARDS_CACHE_MAX_SIZE_MB * 1024 * 1024
+
+    def shards_version(self) -> int | None:
+        """
+        Version of sharding config that latest state must be kept in.
+        None means that latest is kept in the format it was created with
+        :return:
+        """
+        from_env = str(self._environment.get(CAASEnv.SHARDS_VERSION))
+        if from_env in ('1', '2', '3'):
+            return int(from_env)
+        return
+
+    def shards_codec(self) -> str | None:
+        """
+        Codec of latest shards. Is used together with shards version
+        :return:
+        """
+        return self._environment.get(CAASEnv.SHARDS_CODEC) or None
+
     def lm_token_lifetime_minutes(self):
         try:
             return int(self._environment.get(
@@ -248,6 +248,15 @@ class JobUpdater:
     def definition(self, definition: str):
         self._actions.append(Job.definition.set(definition))
 
+    def batch_job_id(self, batch_job_id: str):
+        self._actions.append(Job.batch_job_id.set(batch_job_id))
+
+    def continuation(self, continuation: int | None):
+        if continuation is None:
+            self._actions.append(Job.continuation.remove())
+        else:
+            self._actions.append(Job.continuation.set(continuation))
+
     status = property(None, status)
     reason = property(None, reason)
     created_at = property(None, created_at)
@@ -255,3 +264,5 @@ class JobUpdater:
     stopped_at = property(None, stopped_at)
     queue = property(None, queue)
     definition = property(None, definition)
+    batch_job_id = property(None, batch_job_id)
+    continuation = property(None, continuation)
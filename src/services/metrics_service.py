@@ -74,12 +74,27 @@ class MetricsService:
             if region in regions:
                 yield rule, region, dto, ts
 
+    def resource_type_policies(self, meta: dict, resource_type: str
+                               ) -> set[str]:
+        """
+        Returns policies from the given meta that check the given
+        resource type. Can be used to fetch only their shard parts
+        :param meta:
+        :param resource_type: with or without cloud prefix
+        :return:
+        """
+        rt = self.adjust_resource_type(resource_type)
+        return {
+            rule for rule, data in meta.items()
+            if self.adjust_resource_type(data.get('resource') or '') == rt
+        }
+
     def allow_only_resource_type(self, it: ResourcesGenerator, meta: dict,
                                  resource_type: str
                                  ) -> ResourcesGenerator:
+        policies = self.resource_type_policies(meta, resource_type)
         for rule, region, dto, ts in it:
-            rt = self.adjust_resource_type(meta.get(rule, {}).get('resource'))
-            if rt == self.adjust_resource_type(resource_type):
+            if rule in policies:
                 yield rule, region, dto, ts
 
     @staticmethod
@@ -155,10 +170,20 @@ class MetricsService:
             yield rule, region, filtered, ts
 
     def create_resources_generator(self, collection: ShardsCollection,
-                                   active_regions: Union[set, list]
+                                   active_regions: Union[set, list],
+                                   parts: Iterable[BaseShardPart] | None = None
                                    ) -> ResourcesGenerator:
+        """
+        :param collection: its meta is used
+        :param active_regions:
+        :param parts: parts of the collection, for example stored ones that
+        are not fetched. Fetched parts of the collection by default
+        :return:
+        """
+        if parts is None:
+            parts = collection.iter_parts()
         # just iterate over resources
-        resources = self.iter_resources(collection.iter_parts())
+        resources = self.iter_resources(parts)
 
         # modify dto for some exceptional rules, see generator's description
         resources = self.custom_modify(resources, collection.meta)
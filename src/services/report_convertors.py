@@ -4,7 +4,7 @@ import csv
 from datetime import datetime, timezone
 from functools import partial
 import io
-from typing import Literal, TYPE_CHECKING, TypedDict
+from typing import Iterable, Literal, TYPE_CHECKING, TypedDict
 from typing_extensions import NotRequired
 
 from xlsxwriter.workbook import Workbook
@@ -17,7 +17,7 @@ from services import SP
 from services.xlsx_writer import CellContent, Table, XlsxRowsWriter
 
 if TYPE_CHECKING:
-    from services.sharding import ShardsCollection
+    from services.sharding import BaseShardPart, ShardsCollection
 
 
 class ShardCollectionConvertor(ABC):
@@ -339,6 +339,14 @@ class ShardsCollectionDigestConvertor(ShardCollectionConvertor):
         violating_resources: int
 
     def convert(self, collection: 'ShardsCollection') -> DigestsReport:
+        return self.convert_parts(collection.iter_parts())
+
+    def convert_parts(self, parts: Iterable['BaseShardPart']
+                      ) -> DigestsReport:
+        """
+        Parts are iterated only once, so stored parts of a collection can
+        be given without fetching them
+        """
         total_checks = 0
         successful_checks = 0
         total_resources = set()
@@ -347,7 +355,7 @@ class ShardsCollectionDigestConvertor(ShardCollectionConvertor):
         }
         failed_by_severity = {}
         severity = self.mc.severity
-        for part in collection.iter_parts():
+        for part in parts:
             total_checks += 1
             if part.resources:
                 failed_checks['total'] += 1
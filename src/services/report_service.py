@@ -142,23 +142,21 @@ class ReportService:
         return collection
 
     def tenant_latest_collection(self, tenant: Tenant) -> ShardsCollection:
-        collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
+        return ShardsCollectionFactory.from_s3_key(
+            cloud=Cloud[tenant.cloud.upper()],
             key=TenantReportsBucketKeysBuilder(tenant).latest_key(),
+            bucket=self.environment_service.default_reports_bucket_name(),
             client=self.s3_client
         )
-        return collection
 
     def platform_latest_collection(self, platform: Platform
                                    ) -> ShardsCollection:
-        collection = ShardsCollectionFactory.from_cloud(Cloud.KUBERNETES)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
+        return ShardsCollectionFactory.from_s3_key(
+            cloud=Cloud.KUBERNETES,
             key=PlatformReportsBucketKeysBuilder(platform).latest_key(),
+            bucket=self.environment_service.default_reports_bucket_name(),
             client=self.s3_client
         )
-        return collection
 
     def platform_job_collection(self, platform: Platform, job: Job
                                 ) -> ShardsCollection:
@@ -175,13 +173,12 @@ class ReportService:
         key = TenantReportsBucketKeysBuilder(tenant).nearest_snapshot_key(date)
         if not key:
             return
-        collection = ShardsCollectionFactory.from_tenant(tenant)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
+        return ShardsCollectionFactory.from_snapshot_key(
+            cloud=Cloud[tenant.cloud.upper()],
             key=key,
+            bucket=self.environment_service.default_reports_bucket_name(),
             client=self.s3_client
         )
-        return collection
 
     def platform_snapshot_collection(self, platform: Platform, date: datetime
                                      ) -> ShardsCollection | None:
@@ -190,13 +187,12 @@ class ReportService:
         )
         if not key:
             return
-        collection = ShardsCollectionFactory.from_cloud(Cloud.KUBERNETES)
-        collection.io = ShardsS3IO(
-            bucket=self.environment_service.default_reports_bucket_name(),
+        return ShardsCollectionFactory.from_snapshot_key(
+            cloud=Cloud.KUBERNETES,
             key=key,
+            bucket=self.environment_service.default_reports_bucket_name(),
             client=self.s3_client
         )
-        return collection
 
     def fetch_meta(self, tp: Tenant | Platform) -> dict:
         if isinstance(tp, Tenant):
@@ -1,8 +1,9 @@
+import bisect
 import tempfile
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone, date
 from pathlib import PurePosixPath
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 
 from helpers import urljoin
 from helpers.constants import Cloud
@@ -13,6 +14,7 @@ from services import SP
 
 if TYPE_CHECKING:
     from modular_sdk.models.tenant import Tenant
+    from services.clients.s3 import S3Client
     from services.platform_service import Platform
 
 
@@ -22,7 +24,9 @@ class ReportsBucketKeysBuilder(ABC):
     raw/EPAM Systems/AWS/31231231231/latest/0.json.gz
     raw/EPAM Systems/AWS/31231231231/latest/1.json.gz
 
-    raw/EPAM Systems/AWS/31231231231/snapshots/2023-12-10-14/
+    raw/EPAM Systems/AWS/31231231231/snapshots/2023-12-10-14/manifest.json.gz
+    raw/EPAM Systems/AWS/31231231231/snapshots/index.json.gz
+    raw/EPAM Systems/AWS/31231231231/blobs/9b2cf535f27731c974343645a3985328.json.gz
 
     raw/EPAM Systems/AWS/31231231231/jobs/standard/2023-12-10-14/b00649c9-2657-4ade-bd6b-f0f5924f6a50/result/  #  noqa
 
@@ -34,6 +38,7 @@ class ReportsBucketKeysBuilder(ABC):
     prefix = 'raw/'
     on_demand = 'on-demand/'  # any on-flight generated reports
     snapshots = 'snapshots/'
+    blobs = 'blobs/'  # content-addressed objects that snapshots refer to
     latest = 'latest/'
     jobs = 'jobs/'
     standard = 'standard/'
@@ -120,25 +125,15 @@ class ReportsBucketKeysBuilder(ABC):
         """
         Returns the nearest to given date existing snapshot key
         """
-        prefixes = SP.s3.common_prefixes(
-            bucket=SP.environment_service.default_reports_bucket_name(),
-            delimiter='/',
-            prefix=self.snapshots_folder()
-        )
-        to_check = self.urljoin(
-            self.snapshots_folder(),
-            self.datetime(date)
-        )
-        lower = None
-        for prefix in prefixes:
-            if prefix <= to_check:
-                lower = prefix
-            elif not lower:
-                lower = prefix
-                break
-            else:
-                break
-        return lower
+        bucket = SP.environment_service.default_reports_bucket_name()
+        folder = self.snapshots_folder()
+        index = SnapshotsIndex.load(SP.s3, bucket, folder)
+        if index is None:  # snapshots were not indexed yet
+            index = SnapshotsIndex.from_prefixes(SP.s3, bucket, folder)
+        nearest = index.nearest(self.datetime(date).rstrip('/'))
+        if not nearest:
+            return
+        return self.urljoin(folder, nearest)
 
     @staticmethod
     def _random_filename() -> str:
@@ -158,6 +153,75 @@ class ReportsBucketKeysBuilder(ABC):
         return cls.on_demand + cls._random_filename()
 
 
+class SnapshotsIndex:
+    """
+    Sorted dates of all snapshots of one tenant or platform. Allows to find
+    the nearest snapshot without listing the snapshots folder. Dates have
+    the same format as folders of snapshots: 2023-12-10-14
+    """
+    filename = 'index.json'
+
+    __slots__ = ('_dates',)
+
+    def __init__(self, dates: Iterable[str] = ()):
+        self._dates = sorted(set(dates))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._dates)
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    @property
+    def last(self) -> str | None:
+        return self._dates[-1] if self._dates else None
+
+    @classmethod
+    def load(cls, client: 'S3Client', bucket: str, folder: str
+             ) -> Optional['SnapshotsIndex']:
+        item = client.gz_get_json(bucket, urljoin(folder, cls.filename))
+        if not item:
+            return
+        return cls(item.get('dates') or ())
+
+    @classmethod
+    def from_prefixes(cls, client: 'S3Client', bucket: str, folder: str
+                      ) -> 'SnapshotsIndex':
+        """
+        Builds the index by listing the snapshots folder
+        """
+        prefixes = client.common_prefixes(
+            bucket=bucket,
+            delimiter='/',
+            prefix=folder
+        )
+        return cls(PurePosixPath(prefix).name for prefix in prefixes)
+
+    def save(self, client: 'S3Client', bucket: str, folder: str):
+        client.gz_put_json(
+            bucket=bucket,
+            key=urljoin(folder, self.filename),
+            obj={'dates': self._dates}
+        )
+
+    def add(self, date: str) -> bool:
+        i = bisect.bisect_left(self._dates, date)
+        if i < len(self._dates) and self._dates[i] == date:
+            return False
+        self._dates.insert(i, date)
+        return True
+
+    def nearest(self, date: str) -> str | None:
+        """
+        Returns the latest date that is not after the given one. If all
+        the dates are after the given one, the first one is returned
+        """
+        if not self._dates:
+            return
+        i = bisect.bisect_right(self._dates, date)
+        return self._dates[i - 1] if i else self._dates[0]
+
+
 class TenantReportsBucketKeysBuilder(ReportsBucketKeysBuilder):
     def __init__(self, tenant: 'Tenant'):
         self._tenant = tenant
@@ -296,6 +360,8 @@ class StatisticsBucketKeysBuilder:
     _tenant_statistics = 'tenant-statistics/'
     _rules = 'rules/'
     _diagnostic = 'diagnostic/'
+    _durations = 'durations/'
+    _checkpoints = 'checkpoints/'
 
     @classmethod
     def job_statistics(cls, job: Job | BatchResults) -> str:
@@ -313,6 +379,32 @@ class StatisticsBucketKeysBuilder:
             cls._statistics_file
         )
 
+    @classmethod
+    def job_checkpoint(cls, job: Job) -> str:
+        """
+        Outputs of a standard job that must be continued by another batch
+        job because it has reached its lifetime
+        """
+        return urljoin(
+            cls._statistics,
+            cls._checkpoints,
+            f'{job.id}.tar.gz'
+        )
+
+    @classmethod
+    def policies_durations(cls, tenant: 'Tenant',
+                           platform: Optional['Platform'] = None) -> str:
+        """
+        Durations of policies that are collected from the previous
+        standard jobs of the tenant or platform
+        """
+        return urljoin(
+            cls._statistics,
+            cls._durations,
+            tenant.customer_name,
+            f'{platform.id if platform else tenant.name}.json'
+        )
+
     @classmethod
     def report_statistics(cls, now: date, customer: str) -> str:
         return urljoin(
@@ -362,3 +454,24 @@ class StatisticsBucketKeysBuilder:
             now.day,
             f'{job_id}.log'
         )
+
+    @classmethod
+    def profile(cls, job_id: str, extension: str,
+                batch_results_id: str | None = None) -> str:
+        """
+        Profile of the executor job. It's kept next to its xray log.
+        Event-driven jobs that fork processes write one profile per
+        batch results item
+        """
+        now = utc_datetime()
+        name = job_id
+        if batch_results_id:
+            name = f'{job_id}.{batch_results_id}'
+        return urljoin(
+            'xray',
+            'executor',
+            now.year,
+            now.month,
+            now.day,
+            f'{name}.profile.{extension}'
+        )
@@ -46,6 +46,7 @@ if TYPE_CHECKING:
     from services.rbac_service import RoleService, PolicyService
     from services.clients.step_function import ScriptClient, StepFunctionClient
     from services.chronicle_service import ChronicleInstanceService
+    from services.sharding import ShardsDiskCache
 
 
 _LOG = get_logger(__name__)
@@ -68,6 +69,15 @@ class ServiceProvider(metaclass=SingletonMeta):
             return S3Client.factory().build_minio()
         return S3Client.factory().build_s3(env.aws_region())
 
+    @cached_property
+    def shards_cache(self) -> Union['ShardsDiskCache', None]:
+        from services.sharding import ShardsDiskCache
+        env = self.environment_service
+        directory = env.shards_cache_dir()
+        if not directory:
+            return
+        return ShardsDiskCache(directory, env.shards_cache_max_size())
+
     @cached_property
     def ssm(self) -> 'CachedSSMClient':
         from services.clients.ssm import VaultSSMClient, SSMClient, CachedSSMClient
@@ -1,31 +1,50 @@
 from abc import ABC, abstractmethod
-from collections import ChainMap, defaultdict
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
-from pathlib import PurePosixPath
-import pickle
+import mmap
+import os
+from pathlib import Path, PurePosixPath
+import struct
 import tempfile
+import threading
 import time
+import zlib
 from typing import (
     BinaryIO,
+    Callable,
     Generator,
     Iterable,
     Iterator,
     Literal,
     TYPE_CHECKING,
+    TypeVar,
     TypedDict,
     cast,
 )
 
 import msgspec
 
-from helpers import hashable, urljoin
+from helpers import urljoin
+from helpers.codecs import Codec, GZIP, build_codec
 from helpers.constants import Cloud, GLOBAL_REGION
+from helpers.log_helper import get_logger
 from services import SP
 from services.clients.s3 import S3Client
 
 if TYPE_CHECKING:
     from modular_sdk.models.tenant import Tenant
 
+_LOG = get_logger(__name__)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# name of S3 object user-defined metadata key that keeps content digest
+DIGEST_METADATA_KEY = 'digest'
+MANIFEST_FILENAME = 'manifest.json'  # snapshot manifest
+
 # do not change the order, just append new regions. This collection is only
 # for shards distributor
 AWS_REGIONS = (
@@ -43,10 +62,33 @@ AWS_REGIONS = (
 class ShardPartDict(TypedDict):
     p: str  # policy name
     l: str  # region
-    r: list[dict]  # resources
+    r: list[dict] | msgspec.Raw  # resources
     t: float  # timestamp
 
 
+class ShardIndexEntry(msgspec.Struct, frozen=True):
+    """
+    One record of v3 shard footer index. Points to a separately compressed
+    block with one shard part inside the shard file
+    """
+    policy: str = msgspec.field(name='p')
+    location: str = msgspec.field(name='l')
+    timestamp: float = msgspec.field(name='t')
+    offset: int = msgspec.field(name='o')
+    size: int = msgspec.field(name='s')
+    count: int = msgspec.field(name='n')  # number of resources
+
+
+def _part_matches(part: 'BaseShardPart | ShardIndexEntry',
+                  policies: set[str] | None = None,
+                  locations: set[str] | None = None) -> bool:
+    if policies and part.policy not in policies:
+        return False
+    if locations and part.location not in locations:
+        return False
+    return True
+
+
 class BaseShardPart:
     """
     Keeps a list of resources and some attributes that define the belonging
@@ -83,46 +125,136 @@ class ShardPart(msgspec.Struct, BaseShardPart, frozen=True):
     resources: list[dict] = msgspec.field(default_factory=list, name='r')
 
 
-class LazyPickleShardPart(BaseShardPart):
-    __slots__ = 'policy', 'location', '_resources', 'timestamp', 'filepath'
+class SpillStore:
+    """
+    Append-only arena backed by one anonymous temporary file. Shard parts
+    spill their serialized resources here and read them back through a
+    memory map, so we keep one file descriptor per job instead of one
+    temporary file per policy. The file is unlinked right after creation
+    so nothing is left on disk even if the process is killed
+    """
+    __slots__ = '_file', '_mm', '_size', '_lock'
+
+    def __init__(self, directory: str | None = None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._mm: mmap.mmap | None = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'SpillStore':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, data: bytes) -> tuple[int, int]:
+        """
+        Appends the given bytes to the arena
+        :param data:
+        :return: offset and size of the written block
+        """
+        with self._lock:
+            offset = self._size
+            self._file.write(data)
+            self._size += len(data)
+        return offset, len(data)
 
-    def __init__(self, filepath: str, policy: str,
-                 location: str = GLOBAL_REGION,
+    def view(self, offset: int, size: int) -> memoryview:
+        """
+        Returns a zero-copy view of a block previously written with put().
+        The map is recreated when the arena has grown. The old map is not
+        closed explicitly because some views may still reference it. It
+        will be released when the last view is gone
+        """
+        if size == 0:
+            return memoryview(b'')
+        with self._lock:
+            if self._mm is None or len(self._mm) < offset + size:
+                self._file.flush()
+                self._mm = mmap.mmap(self._file.fileno(), self._size,
+                                     access=mmap.ACCESS_READ)
+            return memoryview(self._mm)[offset:offset + size]
+
+    def close(self) -> None:
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:  # some views are still alive
+                pass
+            self._mm = None
+        self._file.close()
+
+
+class SpilledShardPart(BaseShardPart):
+    """
+    Shard part that keeps its resources serialized inside a SpillStore and
+    decodes them only when they are accessed
+    """
+    __slots__ = ('policy', 'location', 'timestamp', '_store', '_offset',
+                 '_size', '_resources')
+
+    def __init__(self, store: SpillStore, offset: int, size: int,
+                 policy: str, location: str = GLOBAL_REGION,
                  timestamp: float | None = None):
         self.policy: str = policy
         self.location: str = location
         self.timestamp: float = timestamp or time.time()
+        self._store = store
+        self._offset = offset
+        self._size = size
         self._resources: list[dict] | None = None
-        self.filepath: str = filepath
 
     @classmethod
-    def from_resources(cls, resources: list[dict], policy: str,
-                       location: str = GLOBAL_REGION):
+    def from_resources(cls, store: SpillStore, resources: list[dict],
+                       policy: str, location: str = GLOBAL_REGION
+                       ) -> 'SpilledShardPart':
         """
         Creates shard part with given resources but immediately dumps them
-        to inner file storage
+        to the given store
+        :param store:
         :param resources:
         :param policy:
         :param location:
         :return:
         """
-        with tempfile.NamedTemporaryFile(delete=False) as fp:
-            pickle.dump(resources, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        offset, size = store.put(msgspec.json.encode(resources))
         return cls(
-            filepath=fp.name,
+            store=store,
+            offset=offset,
+            size=size,
             policy=policy,
             location=location
         )
 
     @property
     def resources(self) -> list[dict]:
-        if self._resources is None:
-            with open(self.filepath, 'rb') as fp:
-                self._resources = pickle.load(fp)
-        return self._resources
+        resources = self._resources
+        if resources is None:  # can be read by multiple threads
+            resources = self._resources = msgspec.json.decode(
+                self._store.view(self._offset, self._size),
+                type=list[dict]
+            )
+        return resources
 
     def drop(self) -> None:
-        self._resources = None  # not sure if it can help
+        self._resources = None
+
+    def serialize(self) -> ShardPartDict:
+        """
+        If resources were not loaded the spilled bytes are embedded into
+        the output as is, without decoding and encoding them again
+        """
+        if self._resources is not None:
+            return super().serialize()
+        return {
+            'p': self.policy,
+            'l': self.location,
+            'r': msgspec.Raw(self._store.view(self._offset, self._size)),
+            't': self.timestamp
+        }
 
 
 class Shard(Iterable[BaseShardPart]):
@@ -171,6 +303,58 @@ class Shard(Iterable[BaseShardPart]):
         for part in shard:
             self.put(part)
 
+    def digest(self) -> str:
+        """
+        Stable digest of the shard content. Depends only on policies,
+        locations and resources of the parts but not on the order of parts
+        and their timestamps. So a rescan that has found exactly the same
+        resources produces the same digest
+        :return:
+        """
+        encoder = msgspec.json.Encoder(order='sorted')
+        h = hashlib.blake2b(digest_size=16)
+        for key in sorted(self._data):
+            part = self._data[key]
+            h.update(encoder.encode(
+                (part.policy, part.location, part.resources)
+            ))
+        return h.hexdigest()
+
+
+_SORTED_ENCODER = msgspec.json.Encoder(order='sorted')
+
+
+def resource_digest(resource: dict) -> bytes:
+    """
+    Canonical digest of one resource. Does not depend on the order of
+    dict keys
+    :param resource:
+    :return:
+    """
+    return hashlib.blake2b(_SORTED_ENCODER.encode(resource),
+                           digest_size=16).digest()
+
+
+def resources_digests(resources: Iterable[dict]) -> dict[bytes, dict]:
+    """
+    Maps resources by their digests keeping the order. Duplicates collapse
+    into one item
+    :param resources:
+    :return:
+    """
+    return {resource_digest(res): res for res in resources}
+
+
+def meta_digest(meta: dict) -> str:
+    """
+    Stable digest of rules meta
+    :param meta:
+    :return:
+    """
+    return hashlib.blake2b(
+        msgspec.json.encode(meta, order='sorted'), digest_size=16
+    ).hexdigest()
+
 
 class ShardDataDistributor(ABC):
     """
@@ -179,6 +363,7 @@ class ShardDataDistributor(ABC):
     a shard.
     This class knows how and based on what attributes to distribute
     """
+    name: str  # is used to keep distributor in sharding config
 
     def __init__(self, n: int = 1):
         self._n = n
@@ -215,6 +400,17 @@ class ShardDataDistributor(ABC):
         """
         return self.distribute(**self.key(part))
 
+    def shards_for(self, policies: set[str] | None = None,
+                   locations: set[str] | None = None) -> set[int]:
+        """
+        Returns numbers of shards that can contain parts of the given
+        policies and locations. All the shards by default
+        :param policies:
+        :param locations:
+        :return:
+        """
+        return set(range(self._n))
+
 
 class SingleShardDistributor(ShardDataDistributor):
     """
@@ -223,6 +419,7 @@ class SingleShardDistributor(ShardDataDistributor):
     probably won't be efficient to distribute those by regions, because we
     will spend more money on S3 requests than could save on traffic
     """
+    name = 'single'
 
     def key(self, part: BaseShardPart) -> dict:
         return {}
@@ -230,6 +427,10 @@ class SingleShardDistributor(ShardDataDistributor):
     def distribute(self, **kwargs) -> int:
         return 0
 
+    def shards_for(self, policies: set[str] | None = None,
+                   locations: set[str] | None = None) -> set[int]:
+        return {0}
+
 
 class AWSRegionDistributor(ShardDataDistributor):
     """
@@ -239,6 +440,7 @@ class AWSRegionDistributor(ShardDataDistributor):
     consistent must update it each time. So in order not to download the
     whole data from S3 each time - we can make this distribution.
     """
+    name = 'aws_region'
     regions = {r: i for i, r in enumerate([GLOBAL_REGION, *AWS_REGIONS])}
 
     def key(self, part: BaseShardPart) -> dict:
@@ -255,6 +457,176 @@ class AWSRegionDistributor(ShardDataDistributor):
             index = len(self.regions)
         return index % self._n
 
+    def shards_for(self, policies: set[str] | None = None,
+                   locations: set[str] | None = None) -> set[int]:
+        if not locations:
+            return super().shards_for(policies, locations)
+        return {self.distribute(region=location) for location in locations}
+
+
+class PolicyHashDistributor(ShardDataDistributor):
+    """
+    Distributes parts by a stable hash of policy name. Parts of one policy
+    from all the locations always get to the same shard. Can be used for
+    tenants that have too many findings within one region to keep them
+    in one shard
+    """
+    name = 'policy_hash'
+
+    def key(self, part: BaseShardPart) -> dict:
+        return dict(policy=part.policy)
+
+    def distribute(self, policy: str) -> int:
+        return zlib.crc32(policy.encode()) % self._n
+
+    def shards_for(self, policies: set[str] | None = None,
+                   locations: set[str] | None = None) -> set[int]:
+        if not policies:
+            return super().shards_for(policies, locations)
+        return {self.distribute(policy=policy) for policy in policies}
+
+
+class ShardsDiskCache:
+    """
+    Bounded LRU cache of downloaded shards on local disk. Each entry keeps
+    ETag of the S3 object it was built from and decoded parts in msgpack,
+    so a valid entry is loaded without decompression and JSON parsing.
+    Entries are replaced atomically, so the directory can be shared by
+    multiple processes (gunicorn workers)
+    """
+    __slots__ = '_dir', '_max_size', '_size', '_lock'
+
+    header = struct.Struct('>H')  # etag length
+    suffix = '.shard'
+
+    _encoder = msgspec.msgpack.Encoder()
+    _decoder = msgspec.msgpack.Decoder(type=list[ShardPart])
+
+    def __init__(self, directory: str | Path, max_size: int):
+        """
+        :param directory:
+        :param max_size: max size of all entries in bytes
+        """
+        self._dir = Path(directory)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._size = sum(e.stat().st_size for e in self._entries())
+
+    def _entries(self) -> Iterator[os.DirEntry]:
+        with os.scandir(self._dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    yield entry
+
+    def _path(self, bucket: str, key: str) -> Path:
+        name = hashlib.blake2b(f'{bucket}/{key}'.encode(),
+                               digest_size=16).hexdigest()
+        return self._dir / (name + self.suffix)
+
+    def _read(self, path: Path) -> tuple[str, memoryview] | None:
+        try:
+            with open(path, 'rb') as fp:
+                data = memoryview(fp.read())
+        except FileNotFoundError:
+            return
+        if len(data) < self.header.size:
+            return
+        (length,) = self.header.unpack_from(data)
+        start = self.header.size
+        return bytes(data[start:start + length]).decode(), \
+            data[start + length:]
+
+    def etag(self, bucket: str, key: str) -> str | None:
+        """
+        ETag of the cached version of the object
+        """
+        path = self._path(bucket, key)
+        try:
+            with open(path, 'rb') as fp:
+                (length,) = self.header.unpack(fp.read(self.header.size))
+                return fp.read(length).decode()
+        except (FileNotFoundError, struct.error):
+            return
+
+    def get(self, bucket: str, key: str, etag: str
+            ) -> list[ShardPart] | None:
+        """
+        Returns cached parts in case the cached version has the given ETag
+        """
+        path = self._path(bucket, key)
+        item = self._read(path)
+        if item is None or item[0] != etag:
+            return
+        try:
+            os.utime(path)  # last access for LRU
+        except FileNotFoundError:
+            pass
+        return self._decoder.decode(item[1])
+
+    def put(self, bucket: str, key: str, etag: str,
+            parts: Iterable[BaseShardPart]) -> None:
+        raw_etag = etag.encode()
+        data = self._encoder.encode([
+            ShardPart(policy=p.policy, location=p.location,
+                      timestamp=p.timestamp, resources=p.resources)
+            for p in parts
+        ])
+        size = self.header.size + len(raw_etag) + len(data)
+        if size > self._max_size:
+            return
+        with tempfile.NamedTemporaryFile(dir=self._dir, delete=False,
+                                         suffix='.tmp') as fp:
+            fp.write(self.header.pack(len(raw_etag)))
+            fp.write(raw_etag)
+            fp.write(data)
+        path = self._path(bucket, key)
+        with self._lock:
+            try:
+                size -= path.stat().st_size  # overwritten entry
+            except FileNotFoundError:
+                pass
+            os.replace(fp.name, path)
+            self._size += size
+            if self._size > self._max_size:
+                self._evict()
+
+    def delete(self, bucket: str, key: str) -> None:
+        path = self._path(bucket, key)
+        with self._lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                return
+            self._size -= size
+
+    def _evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache takes no
+        more than 90% of its max size. Sizes are recalculated from disk
+        because other processes can use the same directory
+        """
+        entries = []
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        limit = self._max_size * 0.9
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
 
 class ShardsIO(ABC):
     """
@@ -271,9 +643,24 @@ class ShardsIO(ABC):
         :return:
         """
 
-    def write_many(self, pairs: Iterable[tuple[int, Shard]]):
+    def write_many(self, pairs: Iterable[tuple[int, Shard]],
+                   skip_unchanged: bool = False):
         for n, shard in pairs:
-            self.write(n, shard)
+            if skip_unchanged:
+                self.write_if_changed(n, shard)
+            else:
+                self.write(n, shard)
+
+    def write_if_changed(self, n: int, shard: Shard) -> bool:
+        """
+        Writes the shard only if its content differs from the stored one.
+        This implementation cannot tell, so it always writes
+        :param n:
+        :param shard:
+        :return: whether the shard was written
+        """
+        self.write(n, shard)
+        return True
 
     def read_raw_many(self, numbers: Iterable[int]
                       ) -> Iterator[list[BaseShardPart]]:
@@ -287,10 +674,55 @@ class ShardsIO(ABC):
         :return:
         """
 
+    def read_parts(self, n: int, policies: set[str] | None = None,
+                   locations: set[str] | None = None
+                   ) -> list[BaseShardPart] | None:
+        """
+        Reads only those parts of a specific shard that belong to the given
+        policies and locations. This implementation downloads the whole
+        shard and filters it. Formats with random access can do better
+        :param n:
+        :param policies:
+        :param locations:
+        :return:
+        """
+        parts = self.iter_raw(n)
+        if parts is None:
+            return
+        return [p for p in parts if _part_matches(p, policies, locations)]
+
+    def iter_raw(self, n: int) -> Iterator[BaseShardPart] | None:
+        """
+        Reads a specific shard yielding its parts one by one. Formats that
+        support streaming do not keep the whole shard in memory
+        :param n:
+        :return:
+        """
+        parts = self.read_raw(n)
+        if parts is None:
+            return
+        return iter(parts)
+
+    def read_parts_many(self, numbers: Iterable[int],
+                        policies: set[str] | None = None,
+                        locations: set[str] | None = None
+                        ) -> Iterator[list[BaseShardPart]]:
+        it = (self.read_parts(n, policies, locations) for n in numbers)
+        return filter(lambda x: x is not None, it)
+
     @abstractmethod
     def write_meta(self, meta: dict):
         ...
 
+    def write_meta_if_changed(self, meta: dict) -> bool:
+        """
+        The same as write_if_changed but for meta
+        :param meta:
+        :return: whether the meta was written
+        """
+        self.write_meta(meta)
+        return True
+
     @abstractmethod
     def read_meta(self) -> dict:
         ...
@@ -300,16 +732,68 @@ class ShardsS3IO(ShardsIO):
     """
     Writer V1
     """
-    __slots__ = '_bucket', '_root', '_client'
+    __slots__ = ('_bucket', '_root', '_client', '_workers', '_codec',
+                 '_cache', '_manifest')
 
-    def __init__(self, bucket: str, key: str, client: S3Client):
+    def __init__(self, bucket: str, key: str, client: S3Client,
+                 workers: int | None = None, codec: Codec = GZIP,
+                 cache: ShardsDiskCache | None = None,
+                 manifest: dict[str, str] | None = None):
         """
         :param bucket:
         :param key: root folder where to put shards
+        :param workers: max number of shards that are read or written
+        concurrently. Taken from environment by default
+        :param codec: compression of shards and meta
+        :param cache: local cache of downloaded shards. Taken from
+        environment by default. Can be disabled there
+        :param manifest: names of objects under the given key mapped to
+        real keys where those objects are kept. Snapshots use it to refer
+        to shared content-addressed blobs. Such io is for reading only
         """
         self._bucket = bucket
         self._root = key
         self._client = client
+        self._codec = codec
+        if cache is None:
+            cache = SP.shards_cache
+        self._cache = cache
+        self._manifest = manifest
+        if workers is None:
+            workers = SP.environment_service.shards_io_workers()
+        self._workers = workers
+
+    def _map(self, func: Callable[[T], R], items: Iterable[T]) -> list[R]:
+        """
+        Applies the function to each item using a bounded thread pool so
+        that network transfer, compression and decoding of different
+        shards overlap. Results are in the order of the given items
+        """
+        items = list(items)
+        if self._workers <= 1 or len(items) <= 1:
+            return list(map(func, items))
+        workers = min(self._workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+
+    def write_many(self, pairs: Iterable[tuple[int, Shard]],
+                   skip_unchanged: bool = False):
+        write = self.write_if_changed if skip_unchanged else self.write
+        self._map(lambda pair: write(*pair), pairs)
+
+    def read_raw_many(self, numbers: Iterable[int]
+                      ) -> Iterator[list[BaseShardPart]]:
+        it = self._map(self.read_raw, numbers)
+        return filter(lambda x: x is not None, it)
+
+    def read_parts_many(self, numbers: Iterable[int],
+                        policies: set[str] | None = None,
+                        locations: set[str] | None = None
+                        ) -> Iterator[list[BaseShardPart]]:
+        it = self._map(
+            lambda n: self.read_parts(n, policies, locations), numbers
+        )
+        return filter(lambda x: x is not None, it)
 
     @staticmethod
     def shard_to_filelike(shard: Shard) -> BinaryIO:
@@ -332,44 +816,163 @@ class ShardsS3IO(ShardsIO):
     def key(self) -> str:
         return self._root
 
+    @property
+    def codec(self) -> Codec:
+        return self._codec
+
     @key.setter
     def key(self, value: str):
         self._root = value
 
+    def _resolve(self, key: str, compressed: bool = True) -> str:
+        """
+        Returns the key where the object is really kept
+        :param key: key of the object under root
+        :param compressed: whether the client adds codec extension to key
+        """
+        if not self._manifest:
+            return key
+        name = PurePosixPath(self._codec.key(key) if compressed else key)
+        return self._manifest.get(name.name, key)
+
     def _key(self, n: int) -> str:
-        return str((PurePosixPath(self._root) / str(n)).with_suffix('.json'))
+        return self._resolve(
+            str((PurePosixPath(self._root) / str(n)).with_suffix('.json'))
+        )
 
-    def write(self, n: int, shard: Shard):
+    def _object_key(self, n: int) -> str:
+        """
+        Real S3 key of the shard including codec extension
+        """
+        return self._codec.key(self._key(n))
+
+    def _meta_key(self) -> str:
+        return self._resolve(str((PurePosixPath(self._root) / 'meta.json')))
+
+    def _write(self, n: int, shard: Shard, digest: str | None = None):
         self._client.gz_put_object(
             bucket=self._bucket,
             key=self._key(n),
             body=self.shard_to_filelike(shard),
+            metadata={DIGEST_METADATA_KEY: digest} if digest else None,
+            codec=self._codec
         )
 
+    def _stored_digest(self, n: int) -> str | None:
+        meta = self._client.gz_object_metadata(self._bucket, self._key(n),
+                                               codec=self._codec)
+        return (meta or {}).get(DIGEST_METADATA_KEY)
+
+    def write(self, n: int, shard: Shard):
+        self._write(n, shard)
+
+    def write_if_changed(self, n: int, shard: Shard) -> bool:
+        """
+        Keeps the digest of the shard in S3 object metadata and compares
+        it with the digest of the given shard before writing
+        """
+        digest = shard.digest()
+        if self._stored_digest(n) == digest:
+            _LOG.debug(f'Shard {n} in {self._root} is not changed. '
+                       f'Skipping writing')
+            return False
+        self._write(n, shard, digest)
+        return True
+
     def read_raw(self, n: int) -> list[BaseShardPart] | None:
+        if self._cache is not None:
+            return self._read_cached(n)
+        return self._read_raw(n)
+
+    def _read_raw(self, n: int) -> list[BaseShardPart] | None:
         obj = self._client.gz_get_object(
             bucket=self._bucket,
             key=self._key(n),
             gz_buffer=tempfile.TemporaryFile(),
+            codec=self._codec
         )
         if not obj:
             return
         return msgspec.json.decode(cast(io.BytesIO, obj).getvalue(),
                                    type=list[ShardPart])
 
+    def _decode_object(self, obj: BinaryIO) -> list[BaseShardPart]:
+        """
+        Decodes the whole downloaded shard object
+        """
+        buf = io.BytesIO()
+        self._codec.decompress_stream(obj, buf)
+        return msgspec.json.decode(buf.getbuffer(), type=list[ShardPart])
+
+    def _read_cached(self, n: int) -> list[BaseShardPart] | None:
+        """
+        Makes conditional GET with ETag of the cached version. The shard is
+        downloaded only if it was changed
+        """
+        key = self._object_key(n)
+        etag = self._cache.etag(self._bucket, key)
+        obj, current = self._client.get_object_if_changed(
+            self._bucket, key, etag, tempfile.TemporaryFile()
+        )
+        if current is None:  # does not exist
+            self._cache.delete(self._bucket, key)
+            return
+        if obj is None:
+            parts = self._cache.get(self._bucket, key, current)
+            if parts is not None:
+                return parts
+            # evicted in between by someone else
+            obj, current = self._client.get_object_if_changed(
+                self._bucket, key, None, tempfile.TemporaryFile()
+            )
+            if obj is None:
+                return
+        with obj:
+            parts = self._decode_object(obj)
+        self._cache.put(self._bucket, key, current, parts)
+        return parts
+
     def write_meta(self, meta: dict):
         self._client.gz_put_json(
             bucket=self._bucket,
-            key=str((PurePosixPath(self._root) / 'meta.json')),
-            obj=meta
+            key=self._meta_key(),
+            obj=meta,
+            codec=self._codec
+        )
+
+    def write_meta_if_changed(self, meta: dict) -> bool:
+        digest = meta_digest(meta)
+        stored = self._client.gz_object_metadata(self._bucket,
+                                                 self._meta_key(),
+                                                 codec=self._codec)
+        if (stored or {}).get(DIGEST_METADATA_KEY) == digest:
+            _LOG.debug(f'Meta in {self._root} is not changed. '
+                       f'Skipping writing')
+            return False
+        self._client.gz_put_json(
+            bucket=self._bucket,
+            key=self._meta_key(),
+            obj=meta,
+            metadata={DIGEST_METADATA_KEY: digest},
+            codec=self._codec
         )
+        return True
 
     def read_meta(self) -> dict:
         return self._client.gz_get_json(
             bucket=self._bucket,
-            key=str((PurePosixPath(self._root) / 'meta.json'))
+            key=self._meta_key(),
+            codec=self._codec
         ) or {}
 
+    def delete(self, n: int):
+        self._client.gz_delete_object(self._bucket, self._key(n),
+                                      codec=self._codec)
+
+    def delete_meta(self):
+        self._client.gz_delete_object(self._bucket, self._meta_key(),
+                                      codec=self._codec)
+
 
 class ShardsS3IOV2(ShardsS3IO):
     """
@@ -389,6 +992,224 @@ class ShardsS3IOV2(ShardsS3IO):
         buf.seek(0)
         return buf
 
+    _part_decoder = msgspec.json.Decoder(type=ShardPart)
+
+    def _iter_parts(self, lines: Iterable[bytes]
+                    ) -> Generator[ShardPart, None, None]:
+        for line in lines:
+            if line.strip():
+                yield self._part_decoder.decode(line)
+
+    def iter_raw(self, n: int) -> Iterator[BaseShardPart] | None:
+        """
+        Decompresses and decodes parts one by one while downloading the
+        shard. Memory is bounded by the largest part
+        """
+        if self._cache is not None:
+            parts = self._read_cached(n)
+            return None if parts is None else iter(parts)
+        lines = self._client.gz_iter_lines(self._bucket, self._key(n),
+                                           codec=self._codec)
+        if lines is None:
+            return
+        return self._iter_parts(lines)
+
+    def _read_raw(self, n: int) -> list[BaseShardPart] | None:
+        it = self.iter_raw(n)
+        if it is None:
+            return
+        return list(it)
+
+    def _decode_object(self, obj: BinaryIO) -> list[BaseShardPart]:
+        with self._codec.reader(obj) as reader:
+            return list(self._iter_parts(reader))
+
+
+class ShardsS3IOV3(ShardsS3IO):
+    """
+    Writer v3. Each shard part is compressed separately and written one
+    after another. Footer index with offsets of all the parts and a
+    fixed-size trailer are appended to the end of the file:
+    [part 0][part 1]...[part k-1][index][magic][index length]
+    This allows to download only necessary parts using ranged GETs
+    """
+    __slots__ = ()
+
+    magic = b'ECCSHRD3'
+    trailer = struct.Struct('>8sQ')
+    # the first ranged GET downloads this number of bytes from the end. In
+    # case the shard is small, it will contain the whole file
+    tail_size = 1 << 16
+    # parts that are closer to each other are downloaded by one request
+    max_gap = 1 << 13
+
+    _part_decoder = msgspec.json.Decoder(type=ShardPart)
+    _index_decoder = msgspec.json.Decoder(type=list[ShardIndexEntry])
+
+    def _key(self, n: int) -> str:
+        return self._resolve(
+            str((PurePosixPath(self._root) / str(n)).with_suffix('.bin')),
+            compressed=False
+        )
+
+    def _object_key(self, n: int) -> str:
+        return self._key(n)
+
+    def shard_to_filelike(self, shard: Shard) -> BinaryIO:
+        encoder = msgspec.json.Encoder()
+        buf = tempfile.TemporaryFile()
+        index = []
+        offset = 0
+        for part in shard:
+            block = self._codec.compress(encoder.encode(part.serialize()))
+            buf.write(block)
+            index.append(ShardIndexEntry(
+                policy=part.policy,
+                location=part.location,
+                timestamp=part.timestamp,
+                offset=offset,
+                size=len(block),
+                count=len(part.resources)
+            ))
+            offset += len(block)
+        raw_index = encoder.encode(index)
+        buf.write(raw_index)
+        buf.write(self.trailer.pack(self.magic, len(raw_index)))
+        buf.seek(0)
+        return buf
+
+    def _write(self, n: int, shard: Shard, digest: str | None = None):
+        self._client.put_object(
+            bucket=self._bucket,
+            key=self._key(n),
+            body=self.shard_to_filelike(shard),
+            content_type='application/octet-stream',
+            metadata={DIGEST_METADATA_KEY: digest} if digest else None
+        )
+
+    def _stored_digest(self, n: int) -> str | None:
+        meta = self._client.object_metadata(self._bucket, self._key(n))
+        return (meta or {}).get(DIGEST_METADATA_KEY)
+
+    def delete(self, n: int):
+        self._client.delete_object(self._bucket, self._key(n))
+
+    @classmethod
+    def _index_length(cls, data: bytes | memoryview) -> int:
+        if len(data) < cls.trailer.size:
+            raise ValueError('Shard file is too small to be valid v3 shard')
+        magic, length = cls.trailer.unpack(data[-cls.trailer.size:])
+        if magic != cls.magic:
+            raise ValueError('Shard file does not contain v3 trailer')
+        return length
+
+    @classmethod
+    def _parse_index(cls, data: bytes | memoryview, length: int
+                     ) -> list[ShardIndexEntry]:
+        end = len(data) - cls.trailer.size
+        return cls._index_decoder.decode(data[end - length:end])
+
+    def _decode_block(self, block: bytes | memoryview) -> ShardPart:
+        return self._part_decoder.decode(self._codec.decompress(block))
+
+    def _read_index(self, n: int
+                    ) -> tuple[list[ShardIndexEntry], bytes, int] | None:
+        """
+        Downloads the end of the shard file and parses its index. Returns
+        the index, downloaded tail and the offset of that tail in the file
+        so that parts that are already inside it are not downloaded again
+        """
+        key = self._key(n)
+        tail = self._client.get_object_range(self._bucket, key,
+                                             end=self.tail_size)
+        if tail is None:
+            return
+        length = self._index_length(tail)
+        needed = length + self.trailer.size
+        if len(tail) < needed:
+            tail = self._client.get_object_range(self._bucket, key,
+                                                 end=needed)
+        index = self._parse_index(tail, length)
+        data_end = max((e.offset + e.size for e in index), default=0)
+        return index, tail, data_end + needed - len(tail)
+
+    def read_index(self, n: int) -> list[ShardIndexEntry] | None:
+        """
+        Returns index of the shard without downloading the parts
+        :param n:
+        :return:
+        """
+        res = self._read_index(n)
+        if res is None:
+            return
+        return res[0]
+
+    def _ranges(self, entries: list[ShardIndexEntry]
+                ) -> Iterator[tuple[int, int, list[ShardIndexEntry]]]:
+        """
+        Groups entries sorted by offset into contiguous ranges
+        """
+        start, end, group = 0, 0, []
+        for entry in entries:
+            if group and entry.offset - end > self.max_gap:
+                yield start, end, group
+                group = []
+            if not group:
+                start = entry.offset
+            group.append(entry)
+            end = entry.offset + entry.size
+        if group:
+            yield start, end, group
+
+    def read_parts(self, n: int, policies: set[str] | None = None,
+                   locations: set[str] | None = None
+                   ) -> list[BaseShardPart] | None:
+        if self._cache is not None:  # whole shards are cached
+            return super().read_parts(n, policies, locations)
+        res = self._read_index(n)
+        if res is None:
+            return
+        index, tail, tail_start = res
+        view = memoryview(tail)
+        result = []
+        remote = []
+        for entry in index:
+            if not _part_matches(entry, policies, locations):
+                continue
+            if entry.offset >= tail_start:
+                start = entry.offset - tail_start
+                result.append(self._decode_block(
+                    view[start:start + entry.size]
+                ))
+            else:
+                remote.append(entry)
+        remote.sort(key=lambda e: e.offset)
+        for start, end, group in self._ranges(remote):
+            data = memoryview(self._client.get_object_range(
+                self._bucket, self._key(n), start, end - 1
+            ))
+            for entry in group:
+                offset = entry.offset - start
+                result.append(self._decode_block(
+                    data[offset:offset + entry.size]
+                ))
+        return result
+
+    def _read_raw(self, n: int) -> list[BaseShardPart] | None:
+        obj = self._client.get_object(
+            bucket=self._bucket,
+            key=self._key(n)
+        )
+        if not obj:
+            return
+        return self._decode_object(obj)
+
+    def _decode_object(self, obj: BinaryIO) -> list[BaseShardPart]:
+        view = memoryview(obj.read())
+        index = self._parse_index(view, self._index_length(view))
+        return [self._decode_block(view[e.offset:e.offset + e.size])
+                for e in index]
+
 
 class ShardsIterator(Iterator[tuple[int, Shard]]):
     def __init__(self, shards: dict, n: int):
@@ -450,30 +1271,73 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         for _, shard in other:
             self.put_parts(shard)
 
+    def diff(self, other: 'ShardsCollection'
+             ) -> tuple['ShardsCollection', 'ShardsCollection']:
+        """
+        Compares this collection with the other one part by part. Parts are
+        matched by policy and location. Returns two collections (both use
+        SingleShardDistributor): resources that exist only in this
+        collection and resources that exist only in the other one. Parts
+        that exist only in the other collection are not considered
+        removed because they just were not scanned this time
+        """
+        new = ShardsCollectionFactory.difference()
+        removed = ShardsCollectionFactory.difference()
+        for part, other_part in self._pairs(other):
+            if not other_part:  # definitely new
+                new.put_part(part)
+                continue
+            current = resources_digests(part.resources)
+            previous = resources_digests(other_part.resources)
+            new.put_part(ShardPart(
+                policy=part.policy,
+                location=part.location,
+                resources=[res for d, res in current.items()
+                           if d not in previous]
+            ))
+            gone = [res for d, res in previous.items() if d not in current]
+            if gone:
+                removed.put_part(ShardPart(
+                    policy=part.policy,
+                    location=part.location,
+                    resources=gone
+                ))
+        return new, removed
+
     def __sub__(self, other: 'ShardsCollection') -> 'ShardsCollection':
         """
         Returns a difference between two collections. Uses
         SingleShardDistributor for the new collection
         """
-        # todo rewrite
         new = ShardsCollectionFactory.difference()
-
-        current = ChainMap(*[shard.raw for _, shard in self])
-        other = ChainMap(*[shard.raw for _, shard in other])
-        for key, part in current.items():
-            other_part = other.get(key)
+        for part, other_part in self._pairs(other):
             if not other_part:  # definitely new
                 new.put_part(part)
                 continue
-            current_res = set(hashable(res) for res in part.resources)
-            other_res = set(hashable(res) for res in other_part.resources)
+            previous = set(map(resource_digest, other_part.resources))
             new.put_part(ShardPart(
                 policy=part.policy,
                 location=part.location,
-                resources=list(current_res - other_res)
+                resources=[res for res in part.resources
+                           if resource_digest(res) not in previous]
             ))
         return new
 
+    def _pairs(self, other: 'ShardsCollection'
+               ) -> Generator[tuple[BaseShardPart, BaseShardPart | None],
+                              None, None]:
+        """
+        Yields each part of this collection along with the part of the
+        other collection that has the same policy and location. Collections
+        can use different distributors so parts are matched by their keys
+        """
+        others = {}
+        for _, shard in other:
+            others.update(shard.raw)
+        for _, shard in self:
+            for key, part in shard.raw.items():
+                yield part, others.get(key)
+
     @property
     def distributor(self) -> ShardDataDistributor:
         return self._distributor
@@ -506,20 +1370,39 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         for part in parts:
             self.put_part(part)
 
-    def write_all(self):
+    def write_all(self, skip_unchanged: bool = False):
         """
         Writes all the shards that are currently in memory
+        :param skip_unchanged: compare content digests with the stored
+        ones and do not write shards that are not changed
         :return:
         """
-        self._io.write_many(iter(self))
+        self._io.write_many(iter(self), skip_unchanged=skip_unchanged)
 
     def fetch_by_indexes(self, it: Iterable[int]):
         """
         Fetches shards by specified indexes
         """
-        for parts in self._io.read_raw_many(set(it)):
+        for parts in self._io.read_raw_many(sorted(set(it))):
             self.put_parts(parts)
 
+    def iter_stored_parts(self, it: Iterable[int] | None = None
+                          ) -> Generator[BaseShardPart, None, None]:
+        """
+        Yields parts of the stored shards one by one without putting them
+        to this collection. Shards are read one after another, so with
+        formats that support streaming only one part is kept in memory.
+        Can be used instead of fetching when the data is needed only once
+        :param it: shards indexes, all the shards by default
+        :return:
+        """
+        if it is None:
+            it = range(self._distributor.shards_number)
+        for n in sorted(set(it)):
+            parts = self._io.iter_raw(n)
+            if parts is not None:
+                yield from parts
+
     def fetch_all(self):
         """
         Fetches all the shards
@@ -528,6 +1411,24 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         it = range(self._distributor.shards_number)
         self.fetch_by_indexes(it)
 
+    def fetch_parts(self, policies: set[str] | None = None,
+                    locations: set[str] | None = None):
+        """
+        Fetches only parts that belong to the given policies and
+        locations. Only shards that can contain such parts are read, and
+        IO implementations that support random access download only these
+        parts instead of whole shards
+        :param policies:
+        :param locations:
+        :return:
+        """
+        it = self._io.read_parts_many(
+            sorted(self._distributor.shards_for(policies, locations)),
+            policies, locations
+        )
+        for parts in it:
+            self.put_parts(parts)
+
     def fetch(self, **kwargs):
         """
         Fetch only one shard, distributes its part to the right local
@@ -538,6 +1439,17 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
         n = self._distributor.distribute(**kwargs)
         self.fetch_by_indexes([n])
 
+    def fetch_by_parts(self, parts: Iterable[BaseShardPart]):
+        """
+        Fetches shards that the given parts would be distributed to.
+        Unlike fetching by indexes of another collection, it works even if
+        that collection has a different distributor
+        :param parts:
+        :return:
+        """
+        it = map(self._distributor.distribute_part, parts)
+        self.fetch_by_indexes(it)
+
     def fetch_multiple(self, params: list[dict]):
         it = [self._distributor.distribute(**kw) for kw in params]
         self.fetch_by_indexes(it)
@@ -556,57 +1468,209 @@ class ShardsCollection(Iterable[tuple[int, Shard]]):
     def fetch_meta(self):
         self.update_meta(self._io.read_meta())
 
-    def write_meta(self):
-        if self.meta:
+    def write_meta(self, skip_unchanged: bool = False):
+        if not self.meta:
+            return
+        if skip_unchanged:
+            self._io.write_meta_if_changed(self.meta)
+        else:
             self._io.write_meta(self.meta)
 
 
 class ShardingConfig:
     filename = '.conf'
 
-    __slots__ = 'version',
+    __slots__ = 'version', 'distributor', 'shards', 'codec', 'level', \
+        'dictionary'
+
+    distributors: dict[str, type[ShardDataDistributor]] = {
+        cls.name: cls for cls in (SingleShardDistributor,
+                                  AWSRegionDistributor,
+                                  PolicyHashDistributor)
+    }
 
-    def __init__(self, version: Literal[1, 2]):
+    # trained dictionaries are immutable, so they are downloaded once
+    _dictionaries: dict[tuple[str, str], bytes] = {}
+
+    def __init__(self, version: Literal[1, 2, 3],
+                 distributor: str | None = None,
+                 shards: int | None = None,
+                 codec: str | None = None,
+                 level: int | None = None,
+                 dictionary: str | None = None):
         """
         :param version:
         1 - one shard is a json - list of dits
         2 - one shard is a bunch of JSONs separated by newline
+        3 - one shard is a bunch of separately compressed parts with an
+        index in the end of file
+        :param distributor: name of distributor. The default one for cloud
+        is used if not specified
+        :param shards: number of shards for the distributor
+        :param codec: compression of shards and meta, gzip by default
+        :param level: compression level, codec default if not specified
+        :param dictionary: key of trained zstd dictionary inside the same
+        bucket. Usually one dictionary per cloud
         """
         self.version = version
-        # todo add distributor, and maybe smt else here
+        self.distributor = distributor
+        self.shards = shards
+        self.codec = codec
+        self.level = level
+        self.dictionary = dictionary
 
     @classmethod
     def from_raw(cls, dct: dict) -> 'ShardingConfig':
         return cls(**dct)
 
+    def serialize(self) -> dict:
+        res = {'version': self.version}
+        if self.distributor:
+            res['distributor'] = self.distributor
+        if self.shards:
+            res['shards'] = self.shards
+        if self.codec:
+            res['codec'] = self.codec
+        if self.level is not None:
+            res['level'] = self.level
+        if self.dictionary:
+            res['dictionary'] = self.dictionary
+        return res
+
     @classmethod
     def build_default(cls) -> 'ShardingConfig':
         return cls(version=1)
 
+    @classmethod
+    def build_configured(cls, current: 'ShardingConfig'
+                         ) -> 'ShardingConfig | None':
+        """
+        Returns the config with version and codec from envs that a prefix
+        with the given config must be resharded to. None if the format is
+        not configured or the prefix already has it. Distributor of the
+        current config is kept
+        :param current: config of the prefix
+        :return:
+        """
+        version = SP.environment_service.shards_version()
+        if not version:
+            return
+        codec = SP.environment_service.shards_codec()
+        if current.version == version and current.codec == codec:
+            return
+        if current.codec == codec:
+            level, dictionary = current.level, current.dictionary
+        else:  # they are specific to codec
+            level, dictionary = None, None
+        return cls(version=version, distributor=current.distributor,
+                   shards=current.shards, codec=codec, level=level,
+                   dictionary=dictionary)
+
+    def build_distributor(self, cloud: Cloud) -> ShardDataDistributor:
+        if not self.distributor:
+            return ShardsCollectionFactory._cloud_distributor(cloud)
+        _class = self.distributors.get(self.distributor)
+        if not _class:
+            raise RuntimeError('Invalid shards distributor')
+        return _class(self.shards or 1)
+
+    def build_codec(self, bucket: str, client: S3Client) -> Codec:
+        dictionary = None
+        if self.dictionary:
+            dictionary = self._dictionaries.get((bucket, self.dictionary))
+            if dictionary is None:
+                obj = client.get_object(bucket, self.dictionary)
+                if not obj:
+                    raise RuntimeError('Compression dictionary not found')
+                dictionary = cast(io.BytesIO, obj).getvalue()
+                self._dictionaries[(bucket, self.dictionary)] = dictionary
+        try:
+            return build_codec(self.codec, self.level, dictionary)
+        except ValueError:
+            raise RuntimeError('Invalid shards codec')
+
+    def build_io(self, bucket: str, key: str, client: S3Client,
+                 manifest: dict[str, str] | None = None) -> ShardsS3IO:
+        match self.version:
+            case 1:
+                _class = ShardsS3IO
+            case 2:
+                _class = ShardsS3IOV2
+            case 3:
+                _class = ShardsS3IOV3
+            case _:
+                raise RuntimeError('Invalid shards version')
+        return _class(bucket=bucket, key=key, client=client,
+                      codec=self.build_codec(bucket, client),
+                      manifest=manifest)
+
 
 class ShardsCollectionFactory:
     """
     Builds distributors but without writers
     """
     @staticmethod
-    def from_s3_key(cloud: Cloud, key: str) -> ShardsCollection:
-        bucket = SP.environment_service.default_reports_bucket_name()
-        item = SP.s3.gz_get_json(bucket, urljoin(key, ShardingConfig.filename))
+    def read_config(key: str, bucket: str | None = None,
+                    client: S3Client | None = None) -> ShardingConfig:
+        bucket = bucket or SP.environment_service.default_reports_bucket_name()
+        client = client or SP.s3
+        item = client.gz_get_json(bucket, urljoin(key, ShardingConfig.filename))
         if item:
-            conf = ShardingConfig(item)
-        else:
-            conf = ShardingConfig.build_default()
-        col = ShardsCollection(
-            distributor=ShardsCollectionFactory._cloud_distributor(cloud)
+            return ShardingConfig.from_raw(item)
+        return ShardingConfig.build_default()
+
+    @staticmethod
+    def write_config(key: str, config: ShardingConfig,
+                     bucket: str | None = None,
+                     client: S3Client | None = None):
+        bucket = bucket or SP.environment_service.default_reports_bucket_name()
+        client = client or SP.s3
+        client.gz_put_json(
+            bucket=bucket,
+            key=urljoin(key, ShardingConfig.filename),
+            obj=config.serialize()
+        )
+
+    @staticmethod
+    def from_s3_key(cloud: Cloud, key: str, bucket: str | None = None,
+                    client: S3Client | None = None) -> ShardsCollection:
+        """
+        Builds collection with distributor and writer according to the
+        sharding config that is kept under the given key. Must be used for
+        prefixes that can be resharded (latest and snapshots)
+        """
+        bucket = bucket or SP.environment_service.default_reports_bucket_name()
+        client = client or SP.s3
+        conf = ShardsCollectionFactory.read_config(key, bucket, client)
+        return ShardsCollection(
+            distributor=conf.build_distributor(cloud),
+            io=conf.build_io(bucket, key, client)
+        )
+
+    @staticmethod
+    def from_snapshot_key(cloud: Cloud, key: str, bucket: str | None = None,
+                          client: S3Client | None = None
+                          ) -> ShardsCollection:
+        """
+        Builds read-only collection for the snapshot under the given key.
+        New snapshots keep only a manifest that refers to content-addressed
+        blobs. Old ones are full copies of latest and are read as is
+        """
+        bucket = bucket or SP.environment_service.default_reports_bucket_name()
+        client = client or SP.s3
+        manifest = client.gz_get_json(bucket, urljoin(key, MANIFEST_FILENAME))
+        if not manifest:
+            return ShardsCollectionFactory.from_s3_key(cloud, key, bucket,
+                                                       client)
+        files = manifest.get('files') or {}
+        conf_key = files.get(ShardingConfig.filename + GZIP.extension)
+        conf = ShardingConfig.build_default()
+        if conf_key and (item := client.gz_get_json(bucket, conf_key)):
+            conf = ShardingConfig.from_raw(item)
+        return ShardsCollection(
+            distributor=conf.build_distributor(cloud),
+            io=conf.build_io(bucket, key, client, manifest=files)
         )
-        match conf.version:
-            case 1:
-                col.io = ShardsS3IO(bucket=bucket, key=key, client=SP.s3)
-            case 2:
-                col.io = ShardsS3IOV2(bucket=bucket, key=key, client=SP.s3)
-            case _:
-                raise RuntimeError('Invalid shards version')
-        return col
 
     @staticmethod
     def _cloud_distributor(cloud: Cloud) -> ShardDataDistributor:
@@ -635,3 +1699,73 @@ class ShardsCollectionFactory:
         there
         """
         return ShardsCollection(distributor=SingleShardDistributor())
+
+
+def reshard(cloud: Cloud, key: str, config: ShardingConfig,
+            bucket: str | None = None,
+            client: S3Client | None = None) -> ShardsCollection:
+    """
+    Rewrites shards and meta that are kept under the given key into the
+    layout described by the given config and saves the config there.
+    Shards of the previous layout that are not overwritten are removed.
+    It is not atomic, so it must not be executed concurrently with jobs
+    that update the same prefix
+    :param cloud:
+    :param key: root of shards, usually latest
+    :param config: new sharding config
+    :param bucket:
+    :param client:
+    :return: resharded collection
+    """
+    bucket = bucket or SP.environment_service.default_reports_bucket_name()
+    client = client or SP.s3
+    old = ShardsCollectionFactory.from_s3_key(cloud, key, bucket, client)
+    old.fetch_all()
+    old.fetch_meta()
+
+    new = ShardsCollection(
+        distributor=config.build_distributor(cloud),
+        io=config.build_io(bucket, key, client)
+    )
+    new.put_parts(old.iter_parts())
+    new.meta = old.meta
+    _LOG.info(f'Resharding {key}: {old.distributor.shards_number} -> '
+              f'{new.distributor.shards_number} shards')
+    new.write_all()
+    new.write_meta()
+    ShardsCollectionFactory.write_config(key, config, bucket, client)
+
+    old_io = cast(ShardsS3IO, old.io)
+    new_io = cast(ShardsS3IO, new.io)
+    for n in range(old.distributor.shards_number):
+        if n in new.shards and old_io._object_key(n) == new_io._object_key(n):
+            continue
+        old_io.delete(n)
+    if old_io.codec.key(old_io._meta_key()) != \
+            new_io.codec.key(new_io._meta_key()):
+        old_io.delete_meta()
+    return new
+
+
+def reshard_to_configured(cloud: Cloud, key: str, bucket: str | None = None,
+                          client: S3Client | None = None) -> bool:
+    """
+    Reshards the prefix to the format that is configured by envs if it's
+    kept in another one. A prefix that does not exist yet just gets the
+    config, so it's written in that format from the beginning. The same
+    restrictions as for reshard apply
+    :param cloud:
+    :param key: root of shards, usually latest
+    :param bucket:
+    :param client:
+    :return: whether the prefix was resharded
+    """
+    bucket = bucket or SP.environment_service.default_reports_bucket_name()
+    client = client or SP.s3
+    config = ShardingConfig.build_configured(
+        ShardsCollectionFactory.read_config(key, bucket, client)
+    )
+    if not config:
+        return False
+    reshard(cloud, key, config, bucket, client)
+    return True
@@ -0,0 +1,167 @@
+"""
+Benchmark of the whole standard job against replayed cloud API responses.
+See README.md next to it
+"""
+import json
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip('c7n')
+
+FIXTURES = os.environ.get('CAAS_BENCHMARK_FIXTURES')
+OUTPUT = os.environ.get('CAAS_BENCHMARK_OUTPUT')
+MODES = ('consistent', 'concurrent', 'parallel_processes')
+# models require mongo in docker mode, though the benchmark does not use it
+DEFAULT_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-east-1',  # set by run.main()
+    'CAAS_MONGO_URI': 'mongodb://127.0.0.1:27017',
+    'CAAS_MONGO_DATABASE': 'custodian_as_a_service',
+    'SYSTEM_CUSTOMER_NAME': 'SYSTEM',
+}
+DEFAULT_CREDENTIALS = {
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+}
+
+pytestmark = pytest.mark.skipif(
+    not FIXTURES, reason='CAAS_BENCHMARK_FIXTURES is not set'
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def s3_endpoint():
+    """
+    MinIO if its endpoint is given, otherwise moto server
+    """
+    if os.environ.get('CAAS_MINIO_ENDPOINT'):
+        yield
+        return
+    server = pytest.importorskip('moto.server')
+    port = _free_port()
+    moto = server.ThreadedMotoServer(ip_address='127.0.0.1', port=port)
+    moto.start()
+    with patch.dict(os.environ, {
+        'CAAS_MINIO_ENDPOINT': f'http://127.0.0.1:{port}',
+        'CAAS_MINIO_ACCESS_KEY_ID': 'benchmark',
+        'CAAS_MINIO_SECRET_ACCESS_KEY': 'benchmark',
+    }):
+        yield
+    moto.stop()
+
+
+@pytest.fixture(scope='module')
+def fixtures() -> Path:
+    path = Path(FIXTURES)
+    assert path.joinpath('cassette').is_dir(), \
+        f'{path} must contain a cassette directory with recorded responses'
+    return path
+
+
+def _read_json(path: Path, default=None):
+    if not path.exists():
+        return default
+    return json.loads(path.read_text())
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch, fixtures, s3_endpoint):
+    tenant = _read_json(fixtures / 'tenant.json')
+    for name, value in DEFAULT_ENVIRONMENT.items():
+        if name not in os.environ:
+            monkeypatch.setenv(name, value)
+    # Custodian file cache is written to the current directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('CAAS_SERVICE_MODE', 'docker')
+    monkeypatch.setenv('AWS_BATCH_JOB_ID', str(uuid.uuid4()))
+    monkeypatch.setenv('TARGET_REGIONS', ','.join(tenant.get('regions', [])))
+    monkeypatch.setenv('POLICIES_CACHE_DIR', str(tmp_path / 'compiled'))
+    monkeypatch.delenv('CAAS_SHARDS_CACHE_DIR', raising=False)
+    return tenant
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_standard_job(mode, tmp_path, monkeypatch, fixtures, environment):
+    monkeypatch.setenv('EXECUTOR_MODE', mode)
+
+    import run
+    from executor.helpers.replay import CloudApiCassette
+    from executor.services.policy_service import PoliciesService
+    from models.job import Job
+    from modular_sdk.models.tenant import Tenant
+    from services import SP
+    from services.reports_bucket import StatisticsBucketKeysBuilder
+
+    for bucket in (SP.environment_service.default_reports_bucket_name(),
+                   SP.environment_service.get_statistics_bucket_name()):
+        if not SP.s3.bucket_exists(bucket):
+            SP.s3.create_bucket(bucket, 'eu-west-1')
+
+    tenant = Tenant(
+        name=environment['name'],
+        display_name=environment['name'],
+        is_active=True,
+        customer_name=environment['customer_name'],
+        cloud=environment['cloud'],
+        project=environment['project']
+    )
+    job = Job(
+        id=str(uuid.uuid4()),
+        tenant_name=tenant.name,
+        customer_name=tenant.customer_name,
+        status='RUNNING'
+    )
+    policies = _read_json(fixtures / 'policies.json')
+    if isinstance(policies, dict):  # ruleset file
+        policies = policies['policies']
+    credentials = _read_json(fixtures / 'credentials.json',
+                             DEFAULT_CREDENTIALS)
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    run.get_time_left()
+    with patch.object(run, 'get_licensed_ruleset_dto_list', return_value=[]), \
+            patch.object(PoliciesService, 'get_standard_rulesets',
+                         return_value=[]), \
+            patch.object(PoliciesService, 'get_policies',
+                         return_value=policies), \
+            patch.object(run, 'get_credentials', return_value=credentials), \
+            patch.object(run, 'get_rules_to_exclude', return_value=set()), \
+            patch.object(run, 'upload_to_siem'), \
+            CloudApiCassette(fixtures / 'cassette', replay=True):
+        start = time.perf_counter()
+        continued = run.standard_job(job, tenant, work_dir)
+        seconds = time.perf_counter() - start
+
+    assert not continued
+    statistics = SP.s3.gz_get_json(
+        bucket=SP.environment_service.get_statistics_bucket_name(),
+        key=StatisticsBucketKeysBuilder.job_statistics(job)
+    )
+    failed = [item for item in statistics if 'error_type' in item]
+    missed = [item['policy'] for item in failed
+              if 'ReplayMissError' in ''.join(item.get('traceback') or ())]
+    assert not missed, f'responses were not recorded for {missed}'
+
+    result = {
+        'mode': mode,
+        'policies': len(statistics),
+        'failed': len(failed),
+        'seconds': round(seconds, 3),
+        'policies_per_second': round(len(statistics) / seconds, 3),
+    }
+    print(json.dumps(result))
+    if OUTPUT:
+        with open(OUTPUT, 'a') as file:
+            file.write(json.dumps(result) + '\n')
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from .commons import SOURCE
+
+pytest.importorskip('c7n')
+
+# must be imported only when a job needs them
+LAZY_MODULES = (
+    'googleapiclient',
+    'google.auth',
+    'msrestazure',
+    'services.clients.chronicle',
+    'services.clients.dojo_client',
+    'services.udm_generator',
+    'services.report_convertors',
+    'aws_xray_sdk.ext.botocore',
+)
+# import usually takes less than a second. Network calls at import
+# (e.g. to AWS Batch) would exceed it
+MAX_IMPORT_SECONDS = 10
+
+SCRIPT = f'''
+import json, sys, time
+start = time.perf_counter()
+import run
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]
+}}))
+'''
+
+
+def test_run_import():
+    env = {k: v for k, v in os.environ.items() if k != 'AWS_BATCH_JOB_ID'}
+    env.update(AWS_REGION='eu-central-1', CAAS_TESTING='true',
+               SYSTEM_CUSTOMER_NAME='SYSTEM')
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT], cwd=SOURCE, env=env,
+        capture_output=True, check=True, timeout=60
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    assert result['loaded'] == []
+    assert result['seconds'] < MAX_IMPORT_SECONDS
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import create_autospec
+
+import pytest
+
+from lambdas.custodian_metrics_updater.processors.findings_processor import \
+    FindingsUpdater
+from services.clients.s3 import S3Client
+
+ROOT = 'raw/TEST-CUSTOMER/AWS/123/'
+LATEST = ROOT + 'latest/'
+BLOBS = ROOT + 'blobs/'
+DATE = datetime(2023, 12, 10, 14, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client():
+    client = create_autospec(S3Client)
+    client.list_objects.return_value = [
+        SimpleNamespace(key=LATEST + '0.json.gz', e_tag='"aaa"'),
+        SimpleNamespace(key=LATEST + '1.json.gz', e_tag='"bbb"'),
+        SimpleNamespace(key=LATEST + 'meta.json.gz', e_tag='"ccc"'),
+    ]
+    client.gz_get_json.side_effect = lambda bucket, key: {
+        ROOT + 'snapshots/index.json': {'dates': ['2023-12-10-10']},
+        ROOT + 'snapshots/2023-12-10-10/manifest.json': {'files': {
+            '0.json.gz': BLOBS + 'aaa.json.gz',
+            'meta.json.gz': BLOBS + 'old.json.gz'
+        }}
+    }.get(key, {})
+    return client
+
+
+def test_make_snapshot(client):
+    client.object_exists.side_effect = lambda bucket, key: \
+        key == BLOBS + 'ccc.json.gz'
+    files = FindingsUpdater(client, None).make_snapshot('reports', LATEST,
+                                                        DATE)
+    assert files == {
+        '0.json.gz': BLOBS + 'aaa.json.gz',
+        '1.json.gz': BLOBS + 'bbb.json.gz',
+        'meta.json.gz': BLOBS + 'ccc.json.gz'
+    }
+    # blobs folder is not listed, the previous snapshot's ones are known
+    client.list_objects.assert_called_once_with(bucket='reports',
+                                                prefix=LATEST)
+    assert [c.args[1] for c in client.object_exists.call_args_list] == [
+        BLOBS + 'bbb.json.gz', BLOBS + 'ccc.json.gz'
+    ]
+    client.copy.assert_called_once_with(
+        bucket='reports',
+        key=LATEST + '1.json.gz',
+        destination_bucket='reports',
+        destination_key=BLOBS + 'bbb.json.gz'
+    )
+    keys = [c.kwargs['key'] for c in client.gz_put_json.call_args_list]
+    assert keys == [ROOT + 'snapshots/2023-12-10-14/manifest.json',
+                    ROOT + 'snapshots/index.json']
+    assert client.gz_put_json.call_args.kwargs['obj'] == {
+        'dates': ['2023-12-10-10', '2023-12-10-14']
+    }
+
+
+def test_make_snapshot_after_old_ones(client):
+    # only full copies without a manifest exist
+    client.gz_get_json.side_effect = lambda bucket, key: {}
+    client.common_prefixes.return_value = iter([
+        ROOT + 'snapshots/2023-12-10-10/'
+    ])
+    client.object_exists.return_value = False
+    FindingsUpdater(client, None).make_snapshot('reports', LATEST, DATE)
+    assert client.object_exists.call_count == 3
+    assert client.copy.call_count == 3
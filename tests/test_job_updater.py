@@ -0,0 +1,94 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from helpers.constants import BatchJobType
+from lambdas.custodian_job_updater import handler as module
+from models.job import Job
+
+
+def event(batch_job_id: str, status: str, continuation: int | None = None):
+    environment = [
+        {'name': 'JOB_TYPE', 'value': BatchJobType.STANDARD.value},
+        {'name': 'CUSTODIAN_JOB_ID', 'value': 'job-id'},
+        {'name': 'CREDENTIALS_KEY', 'value': 'credentials'},
+    ]
+    if continuation is not None:
+        environment.append({'name': 'CONTINUATION',
+                            'value': str(continuation)})
+    return {
+        'detail-type': 'Batch Job State Change',
+        'detail': {
+            'jobId': batch_job_id,
+            'jobQueue': 'queue',
+            'jobDefinition': 'definition',
+            'status': status,
+            'container': {'environment': environment}
+        }
+    }
+
+
+@pytest.fixture
+def updaters(monkeypatch):
+    items = []
+
+    def build(job):
+        items.append(MagicMock(job=job))
+        return items[-1]
+
+    monkeypatch.setattr(module, 'JobUpdater', build)
+    return items
+
+
+def build_handler(job: Job) -> module.JobUpdaterHandler:
+    job_service = MagicMock()
+    job_service.get_nullable.return_value = job
+    return module.JobUpdaterHandler(
+        ssm=MagicMock(),
+        license_manager_service=MagicMock(),
+        job_service=job_service
+    )
+
+
+def test_first_batch_job(updaters):
+    job = Job(id='job-id', batch_job_id='batch-1', tenant_name='tenant',
+              customer_name='customer')
+    handler = build_handler(job)
+    handler.handle_request(event('batch-1', 'SUCCEEDED'), None)
+    assert len(updaters) == 1
+    assert updaters[0].status == 'SUCCEEDED'
+    updaters[0].update.assert_called_once()
+    handler.ssm.delete_parameter.assert_called_once_with(
+        secret_name='credentials'
+    )
+
+
+def test_continued_batch_job_skipped(updaters):
+    # the continuation was saved, but its batch job id was not
+    job = Job(id='job-id', batch_job_id='batch-1', tenant_name='tenant',
+              customer_name='customer', continuation=1)
+    handler = build_handler(job)
+    handler.handle_request(event('batch-1', 'SUCCEEDED'), None)
+    assert updaters == []
+    handler.ssm.delete_parameter.assert_not_called()
+
+    handler.handle_request(event('batch-2', 'RUNNING', continuation=1), None)
+    assert len(updaters) == 1
+    assert updaters[0].batch_job_id == 'batch-2'
+    assert updaters[0].status == 'RUNNING'
+    handler.ssm.delete_parameter.assert_not_called()
+
+    handler.handle_request(event('batch-2', 'SUCCEEDED', continuation=1),
+                           None)
+    handler.ssm.delete_parameter.assert_called_once_with(
+        secret_name='credentials'
+    )
+
+
+def test_previous_continuation_skipped(updaters):
+    job = Job(id='job-id', batch_job_id='batch-3', tenant_name='tenant',
+              customer_name='customer', continuation=2)
+    handler = build_handler(job)
+    handler.handle_request(event('batch-2', 'SUCCEEDED', continuation=1),
+                           None)
+    assert updaters == []
@@ -0,0 +1,58 @@
+import io
+from unittest.mock import MagicMock
+
+import pytest
+from modular_sdk.models.tenant import Tenant
+
+from helpers.constants import Cloud
+from lambdas.custodian_report_generation_handler.handler import \
+    ReportGenerator
+from services.clients.s3 import S3Client
+from services.reports_bucket import TenantReportsBucketKeysBuilder
+from services.sharding import ShardingConfig, ShardsCollectionFactory
+
+
+class InMemoryS3Client(S3Client):
+    def __init__(self):
+        super().__init__()
+        self.storage = {}
+
+    def put_object(self, bucket, key, body, *args, **kwargs):
+        if not isinstance(body, bytes):
+            body = body.read()
+        self.storage[(bucket, key)] = body
+
+    def get_object(self, bucket, key, buffer=None):
+        if (bucket, key) not in self.storage:
+            return
+        buffer = buffer or io.BytesIO()
+        buffer.write(self.storage[(bucket, key)])
+        buffer.seek(0)
+        return buffer
+
+
+def test_fetch_latest_meta_zstd():
+    pytest.importorskip('zstandard')
+    client = InMemoryS3Client()
+    tenant = Tenant(
+        name='TEST-TENANT',
+        display_name='Test tenant',
+        is_active=True,
+        customer_name='TEST-CUSTOMER',
+        cloud='AWS',
+        project='123123123123'
+    )
+    key = TenantReportsBucketKeysBuilder(tenant).latest_key()
+    ShardsCollectionFactory.write_config(
+        key, ShardingConfig(2, codec='zstd'), 'reports', client
+    )
+    latest = ShardsCollectionFactory.from_s3_key(Cloud.AWS, key, 'reports',
+                                                 client)
+    latest.meta = {'policy1': {'resource': 'aws.s3'}}
+    latest.write_meta()
+    assert ('reports', f'{key}meta.json.zst') in client.storage
+
+    generator = ReportGenerator(*(MagicMock() for _ in range(12)))
+    generator.s3_service = client
+    assert generator._fetch_latest_meta(tenant, 'reports') == \
+        {'policy1': {'resource': 'aws.s3'}}
@@ -0,0 +1,308 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip('c7n')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from helpers.constants import PolicyErrorType  # noqa: E402
+
+
+class StubPolicy:
+    """
+    Looks like a regional AWS policy for the runner
+    """
+    provider_name = 'aws'
+    data = {}
+    resource_manager = SimpleNamespace(resource_type=SimpleNamespace(
+        global_resource=False, service='ec2'
+    ))
+
+    def __init__(self, name: str, error: Exception | None = None,
+                 sleep: float = 0):
+        self.name = name
+        self.options = SimpleNamespace(region='eu-west-1')
+        self._error = error
+        self._sleep = sleep
+
+    def __call__(self):
+        time.sleep(self._sleep)
+        if self._error:
+            raise self._error
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': code}},
+                       'DescribeInstances')
+
+
+@pytest.fixture
+def run(monkeypatch):
+    import run
+    monkeypatch.setattr(run, 'get_time_left', lambda: time.time() + 3600)
+    return run
+
+
+class TestStartProcesses:
+    def test_failed_merged(self, run):
+        policies = [
+            StubPolicy('ok-1'),
+            StubPolicy('access', client_error('AccessDenied')),
+            StubPolicy('ok-2'),
+            StubPolicy('internal', ValueError('boom')),
+            StubPolicy('ok-3'),
+        ]
+        runner = run.AWSRunner(policies)
+        runner.start_processes(2)
+        assert set(runner.failed) == {('eu-west-1', 'access'),
+                                      ('eu-west-1', 'internal')}
+        assert runner.failed[('eu-west-1', 'access')][0] == \
+            PolicyErrorType.ACCESS
+        error_type, message, tb = runner.failed[('eu-west-1', 'internal')]
+        assert error_type == PolicyErrorType.INTERNAL
+        assert 'boom' in message and tb
+        assert not runner.time_exceeded
+
+    def test_stopped(self, run):
+        policies = [
+            StubPolicy('credentials', client_error('ExpiredToken')),
+            StubPolicy('slow', sleep=0.5),
+            *(StubPolicy(f'rest-{i}') for i in range(6))
+        ]
+        runner = run.AWSRunner(policies)
+        runner.start_processes(2)
+        failed = runner.failed
+        # the slow one could have been started before the job was stopped
+        expected = {('eu-west-1', p.name) for p in policies} - \
+            {('eu-west-1', 'slow')}
+        assert expected <= set(failed)
+        for key in expected:
+            assert failed[key][0] == PolicyErrorType.CREDENTIALS
+            assert failed[key][1] == 'ExpiredToken'
+        assert not runner._is_ongoing
+
+    def test_no_policies(self, run):
+        runner = run.AWSRunner([])
+        runner.start_processes(2)
+        assert runner.failed == {}
+
+
+class TestStartThreads:
+    def test_throttled_calls_fed(self, run, monkeypatch):
+        from executor.helpers.scheduler import AdaptiveScheduler
+        from executor.helpers.throttling import ThrottlingCounter
+
+        counters = []
+
+        class Counter(ThrottlingCounter):
+            def install(self):
+                counters.append(self)
+
+        fed = []
+        feedback = AdaptiveScheduler.feedback
+
+        def spy(scheduler, future, throttled=None):
+            fed.append(dict(throttled or {}))
+            feedback(scheduler, future, throttled)
+
+        monkeypatch.setattr(run, 'ThrottlingCounter', Counter)
+        monkeypatch.setattr(AdaptiveScheduler, 'feedback', spy)
+
+        class Throttled(StubPolicy):
+            def __call__(self):
+                counters[0].add(('eu-west-1', 'ec2'))
+                counters[0].add(('us-east-1', 'iam'))  # global service
+
+        iam = StubPolicy('iam')
+        runner = run.AWSRunner([Throttled('ec2'), iam])
+        monkeypatch.setattr(run.AWSRunner, '_policy_group', staticmethod(
+            lambda p: ('global', 'iam') if p is iam else ('eu-west-1', 'ec2')
+        ))
+        runner.start_threads(threads=1)
+        assert runner.failed == {}
+        assert {('eu-west-1', 'ec2'), ('global', 'iam')} == \
+            {group for item in fed for group in item}
+
+
+class TestContinuation:
+    @pytest.fixture
+    def providers(self, run, monkeypatch):
+        sp, bsp = MagicMock(), MagicMock()
+        bsp.env.continuation.return_value = 0
+        bsp.env.batch_job_id.return_value = 'batch-1'
+        bsp.env.is_docker.return_value = False
+        sp.batch.get_job.return_value = {
+            'jobName': 'job', 'jobQueue': 'queue', 'jobDefinition': 'def',
+            'container': {'environment': [{'name': 'KEY', 'value': 'v'}]}
+        }
+        monkeypatch.setattr(run, 'SP', sp)
+        monkeypatch.setattr(run, 'BSP', bsp)
+        return sp, bsp
+
+    @pytest.fixture
+    def updates(self, run, monkeypatch):
+        """
+        Updates of job attributes in order they are saved
+        """
+        saved = []
+
+        class Updater:
+            def __init__(self, job):
+                self._pending = {}
+
+            def __setattr__(self, key, value):
+                if key.startswith('_'):
+                    return super().__setattr__(key, value)
+                self._pending[key] = value
+
+            def update(self):
+                saved.append(self._pending.copy())
+                self._pending.clear()
+
+        monkeypatch.setattr(run, 'JobUpdater', Updater)
+        return saved
+
+    def test_submit_continuation(self, run, providers, updates):
+        sp, _ = providers
+
+        def submit_job(**kwargs):
+            # the job already belongs to the continuation
+            assert updates == [{'continuation': 1}]
+            return {'jobId': 'batch-2'}
+
+        sp.batch.submit_job.side_effect = submit_job
+        job = run.Job(id='job-id', tenant_name='tenant', customer_name='c')
+        assert run.submit_continuation(job, 'checkpoints/job-id') == 'batch-2'
+        assert updates == [{'continuation': 1}, {'batch_job_id': 'batch-2'}]
+        env = sp.batch.submit_job.call_args.kwargs['environment_variables']
+        assert env == {
+            'KEY': 'v',
+            'CUSTODIAN_JOB_ID': 'job-id',
+            'CHECKPOINT_KEY': 'checkpoints/job-id',
+            'CONTINUATION': '1'
+        }
+
+    def test_submit_continuation_failed(self, run, providers, updates):
+        sp, bsp = providers
+        bsp.env.continuation.return_value = 2
+        sp.batch.submit_job.side_effect = RuntimeError('quota')
+        job = run.Job(id='job-id', tenant_name='tenant', customer_name='c')
+        with pytest.raises(RuntimeError):
+            run.submit_continuation(job, 'checkpoints/job-id')
+        # given back to the current batch job
+        assert updates == [{'continuation': 3}, {'continuation': 2}]
+
+    def test_standard_job_continued(self, run, providers, monkeypatch,
+                                    tmp_path):
+        from executor.helpers.constants import ExecutorMode
+        from helpers.constants import BatchJobType
+
+        _, bsp = providers
+        bsp.env.platform_id.return_value = None
+        bsp.env.job_type.return_value = BatchJobType.STANDARD
+        bsp.env.checkpoint_key.return_value = None
+        bsp.env.can_continue.return_value = True
+        bsp.env.target_regions.return_value = {'eu-west-1'}
+        bsp.environment_service.executor_mode.return_value = \
+            ExecutorMode.CONSISTENT
+        bsp.policies_service.get_standard_rulesets.return_value = []
+        monkeypatch.setattr(run, 'get_licensed_ruleset_dto_list',
+                            lambda *args: [])
+        monkeypatch.setattr(run, 'get_credentials', lambda *args: {})
+        monkeypatch.setattr(run, 'get_rules_to_exclude', lambda *args: set())
+        monkeypatch.setattr(run, 'CompiledPoliciesCache', MagicMock())
+        monkeypatch.setattr(run.PoliciesLoader, 'load_from_policies',
+                            lambda self, policies: [StubPolicy('p1'),
+                                                    StubPolicy('p2')])
+        monkeypatch.setattr(run, 'get_time_left', lambda: 0)  # exceeded
+        submitted = []
+        monkeypatch.setattr(run, 'submit_continuation',
+                            lambda *args: submitted.append(args) or 'b-2')
+
+        job = run.Job(id='job-id', tenant_name='tenant', customer_name='c')
+        tenant = SimpleNamespace(name='tenant', cloud='AWS',
+                                 customer_name='c')
+        assert run.standard_job(job, tenant, tmp_path) is True
+        assert submitted == [
+            (job, run.StatisticsBucketKeysBuilder.job_checkpoint(job))
+        ]
+
+        bsp.env.can_continue.return_value = False
+        submitted.clear()
+        monkeypatch.setattr(run, 'JobResult', MagicMock(
+            side_effect=RuntimeError('reports are written')
+        ))
+        with pytest.raises(RuntimeError, match='reports are written'):
+            run.standard_job(job, tenant, tmp_path)
+        assert submitted == []
+
+
+def process_item(br_uuid: str, threshold: float) -> None:
+    """
+    Stub target of batch results processes
+    """
+    import os
+    from pathlib import Path
+
+    if br_uuid == 'broken':
+        os._exit(3)
+    time.sleep(0.5)
+    Path(os.environ['PROCESSED_DIR'], br_uuid).write_text(str(threshold))
+
+
+class TestEventDriven:
+    @pytest.fixture
+    def job(self, run, monkeypatch, tmp_path):
+        bsp = MagicMock()
+        monkeypatch.setattr(run, 'BSP', bsp)
+        monkeypatch.setenv('PROCESSED_DIR', str(tmp_path))
+        # stub target is inherited only by forked processes
+        monkeypatch.setattr(run, 'BATCH_RESULTS_START_METHOD', 'fork')
+        monkeypatch.setattr(run, 'process_spawned_batch_results',
+                            process_item)
+        monkeypatch.setattr(run, 'CACHE_FILE', str(tmp_path / 'cache'))
+        failed = {}
+        monkeypatch.setattr(run, 'fail_batch_results',
+                            lambda br_uuid, reason: failed.update({
+                                br_uuid: reason
+                            }))
+
+        def job(items, processes, threshold):
+            bsp.environment_service.batch_results_ids.return_value = items
+            bsp.environment_service.event_driven_processes.return_value = \
+                processes
+            monkeypatch.setattr(run, 'get_time_left', lambda: threshold)
+            assert run.multi_account_event_driven_job() == 0
+            return {p.name for p in tmp_path.iterdir()}, failed
+        return job
+
+    def test_parallel(self, job):
+        processed, failed = job(['one', 'broken', 'two'], 2,
+                                time.time() + 3600)
+        assert processed == {'one', 'two'}
+        assert failed == {'broken': 'Process exited with code 3'}
+
+    def test_time_exceeded(self, run, job):
+        processed, failed = job(['one', 'two', 'three', 'four'], 2,
+                                time.time() + 0.25)
+        # started before the threshold, the rest could not be started
+        assert processed == {'one', 'two'}
+        assert failed == {'three': run.Runner.TIME_EXCEEDED_MESSAGE,
+                          'four': run.Runner.TIME_EXCEEDED_MESSAGE}
+
+    def test_spawned_process(self, run, monkeypatch):
+        processed = []
+        monkeypatch.setattr(run, 'BSP', MagicMock())
+        monkeypatch.setattr(run, '_TIME_THRESHOLD', None)
+        monkeypatch.setattr(run, 'install_cloud_api_cassette', MagicMock())
+        monkeypatch.setattr(run, 'process_batch_results',
+                            lambda br_uuid: processed.append(
+                                (br_uuid, run._TIME_THRESHOLD)
+                            ))
+        run.BSP.env.profiler_enabled.return_value = False
+        run.process_spawned_batch_results('one', 123.)
+        # get_time_left returns the threshold of the job
+        assert processed == [('one', 123.)]
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+from helpers.codecs import (GZIP, GzipCodec, ZstdCodec, build_codec,
+                            train_dictionary)
+
+zstandard = pytest.importorskip('zstandard')
+
+
+@pytest.fixture
+def data() -> bytes:
+    return b'\n'.join(
+        b'{"id":"i-%d","region":"eu-west-1","arn":"arn:aws:ec2:::%d"}'
+        % (i, i) for i in range(500)
+    )
+
+
+def test_build_codec():
+    assert build_codec() is GZIP
+    assert build_codec('gzip') is GZIP
+    assert isinstance(build_codec('gzip', 1), GzipCodec)
+    assert isinstance(build_codec('zstd'), ZstdCodec)
+    with pytest.raises(ValueError):
+        build_codec('brotli')
+
+
+def test_key():
+    assert GZIP.key('one/0.json') == 'one/0.json.gz'
+    assert GZIP.key('one/0.json.gz') == 'one/0.json.gz'
+    assert ZstdCodec().key('one/0.json') == 'one/0.json.zst'
+
+
+@pytest.mark.parametrize('codec', [GZIP, ZstdCodec(), ZstdCodec(level=10)])
+def test_roundtrip(codec, data):
+    assert codec.decompress(codec.compress(data)) == data
+
+    compressed = io.BytesIO()
+    codec.compress_stream(io.BytesIO(data), compressed)
+    compressed.seek(0)
+    assert codec.decompress(compressed.getvalue()) == data
+    assert list(codec.reader(compressed)) == data.splitlines(keepends=True)
+
+
+def test_zstd_dictionary(data):
+    samples = [line * 3 for line in data.splitlines()]
+    dictionary = train_dictionary(samples, 1024)
+    codec = ZstdCodec(dictionary=dictionary)
+    line = data.splitlines()[0]
+    compressed = codec.compress(line)
+    assert len(compressed) < len(ZstdCodec().compress(line))
+    assert codec.decompress(compressed) == line
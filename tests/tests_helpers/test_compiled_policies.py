@@ -0,0 +1,94 @@
+from unittest.mock import create_autospec
+
+import msgspec
+import pytest
+
+pytest.importorskip('c7n')
+
+from executor.helpers.compiled_policies import (  # noqa: E402
+    CompiledPolicies,
+    CompiledPoliciesCache,
+    has_variables,
+)
+from services.clients.s3 import S3Client  # noqa: E402
+
+
+def test_has_variables():
+    assert not has_variables({
+        'name': 'ec2',
+        'resource': 'aws.ec2',
+        'filters': [{'type': 'value', 'key': 'State.Name', 'value': 1}]
+    })
+    assert has_variables({
+        'name': 'ec2',
+        'resource': 'aws.ec2',
+        'filters': [{'type': 'value', 'key': 'OwnerId',
+                     'value': '{account_id}'}]
+    })
+    assert has_variables({'mode': {'role': 'arn:{partition}:iam::role'}})
+
+
+def test_cache(tmp_path):
+    cache = CompiledPoliciesCache(tmp_path / 'compiled')
+    assert cache.get('hash') is None
+    cache.put('hash', CompiledPolicies(invalid={'a'}, static={'b'}))
+    cache.put('hash', CompiledPolicies(static={'c'}))
+    item = cache.get('hash')
+    assert item.invalid == {'a'}
+    assert item.static == {'b', 'c'}
+    assert item.known('a') and item.known('c') and not item.known('d')
+    assert cache.get('another') is None
+
+
+def test_cache_broken_file(tmp_path):
+    cache = CompiledPoliciesCache(tmp_path)
+    cache.put('hash', CompiledPolicies(static={'b'}))
+    path, = tmp_path.iterdir()
+    path.write_bytes(b'{')
+    assert cache.get('hash') is None
+    cache.put('hash', CompiledPolicies(static={'c'}))
+    assert cache.get('hash').static == {'c'}
+
+
+def test_cache_bucket(tmp_path):
+    storage = {}
+    client = create_autospec(S3Client)
+    client.gz_get_json.side_effect = \
+        lambda bucket, key, **kw: storage.get((bucket, key))
+    client.gz_put_json.side_effect = \
+        lambda bucket, key, obj, **kw: storage.__setitem__(
+            (bucket, key), msgspec.json.decode(msgspec.json.encode(obj))
+        )
+
+    # a job in one container learns and another one in a fresh container
+    # finds it in the bucket
+    first = CompiledPoliciesCache(tmp_path / 'first', client, 'rulesets')
+    first.put('hash', CompiledPolicies(invalid={'a'}, static={'b'}))
+    assert len(storage) == 1
+    second = CompiledPoliciesCache(tmp_path / 'second', client, 'rulesets')
+    item = second.get('hash')
+    assert item.invalid == {'a'} and item.static == {'b'}
+    assert (tmp_path / 'second').exists()
+
+    client.gz_get_json.reset_mock()
+    assert second.get('hash') is not None
+    client.gz_get_json.assert_not_called()  # served from the directory
+
+    second.put('hash', CompiledPolicies(static={'c'}))
+    assert first.get('hash').static == {'b'}  # its directory is first
+    third = CompiledPoliciesCache(tmp_path / 'third', client, 'rulesets')
+    assert third.get('hash').static == {'b', 'c'}
+
+    client.gz_put_json.reset_mock()
+    second.put('hash', CompiledPolicies(static={'c'}))
+    client.gz_put_json.assert_not_called()  # nothing new
+
+
+def test_cache_bucket_unavailable(tmp_path):
+    client = create_autospec(S3Client)
+    client.gz_get_json.side_effect = Exception('Access denied')
+    client.gz_put_json.side_effect = Exception('Access denied')
+    cache = CompiledPoliciesCache(tmp_path, client, 'rulesets')
+    assert cache.get('hash') is None
+    cache.put('hash', CompiledPolicies(static={'b'}))
+    assert cache.get('hash').static == {'b'}
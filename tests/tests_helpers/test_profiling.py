@@ -0,0 +1,53 @@
+import json
+import threading
+import time
+
+from executor.helpers.profiling import StackSampler
+
+
+def busy_function(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def profile() -> StackSampler:
+    sampler = StackSampler()
+    sampler.put_tag('ignored', 'because sampler is not started')
+    sampler.start(0.001)
+    sampler.put_tag('tenant', 'one')
+    sampler.put_tag('tenant', 'two')
+    sampler.put_tag('tenant', 'one')
+    sampler.put_tag('cloud', 'AWS')
+
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_function, args=(stop,),
+                              name='busy')
+    thread.start()
+    time.sleep(0.2)
+    stop.set()
+    thread.join()
+    sampler.stop()
+    return sampler
+
+
+def test_collapsed():
+    sampler = profile()
+    assert sampler.enabled
+    assert sampler.tags == {'tenant': 'one,two', 'cloud': 'AWS'}
+    lines = sampler.collapsed().decode().splitlines()
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in lines) == \
+           sampler.samples
+    busy = [line for line in lines if line.startswith('busy;')]
+    assert busy and all('busy_function (' in line for line in busy)
+
+
+def test_speedscope():
+    sampler = profile()
+    data = json.loads(sampler.speedscope())
+    assert data['name'] == 'tenant=one,two cloud=AWS'
+    frames = data['shared']['frames']
+    profile_, = data['profiles']
+    assert len(profile_['samples']) == len(profile_['weights'])
+    assert abs(sum(profile_['weights']) - sampler.samples * 0.001) < 1e-6
+    names = {frames[i]['name'] for s in profile_['samples'] for i in s}
+    assert {'busy', 'busy_function'} <= names
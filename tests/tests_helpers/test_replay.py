@@ -0,0 +1,102 @@
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import httplib2
+import pytest
+import requests
+
+from executor.helpers.replay import CloudApiCassette, ReplayMissError
+
+IDENTITY = '''<GetCallerIdentityResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <GetCallerIdentityResult>
+    <Arn>arn:aws:iam::123456789012:user/test</Arn>
+    <UserId>AIDTEST</UserId>
+    <Account>{account}</Account>
+  </GetCallerIdentityResult>
+  <ResponseMetadata><RequestId>1</RequestId></ResponseMetadata>
+</GetCallerIdentityResponse>'''
+
+
+class Handler(BaseHTTPRequestHandler):
+    counter = itertools.count()
+
+    def _respond(self, body: str, content_type: str):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond(f'{{"n": {next(self.counter)}}}', 'application/json')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        account = str(next(self.counter)).zfill(12)
+        self._respond(IDENTITY.format(account=account), 'text/xml')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{srv.server_address[1]}'
+    srv.shutdown()
+    srv.server_close()
+
+
+def sts_client(url: str):
+    return boto3.Session(
+        aws_access_key_id='key',
+        aws_secret_access_key='secret',
+        region_name='eu-west-1'
+    ).client('sts', endpoint_url=url)
+
+
+def account(client) -> str:
+    return client.get_caller_identity()['Account']
+
+
+def test_record_and_replay(tmp_path, server):
+    existing = sts_client(server)  # like clients of the executor
+    with CloudApiCassette(tmp_path, hosts=('127.0.0.1',)):
+        recorded = [
+            requests.get(f'{server}/a').json()['n'],
+            requests.get(f'{server}/a').json()['n'],
+            httplib2.Http().request(f'{server}/b')[1],
+            account(sts_client(server)),
+            requests.post(f'{server}/token', data=b'secret=1').text
+        ]
+        account(existing)
+    assert len(list(tmp_path.iterdir())) == 5
+
+    # served from the directory, the server would return new numbers
+    with CloudApiCassette(tmp_path, replay=True, hosts=('127.0.0.1',)):
+        assert requests.get(f'{server}/a').json()['n'] == recorded[0]
+        assert requests.get(f'{server}/a').json()['n'] == recorded[1]
+        assert requests.get(f'{server}/a').json()['n'] == recorded[1]
+        response, content = httplib2.Http().request(f'{server}/b')
+        assert response.status == 200 and content == recorded[2]
+        assert account(sts_client(server)) == recorded[3]
+        # served by method and url, body of the request differs
+        assert requests.post(f'{server}/token',
+                             data=b'secret=2').text == recorded[4]
+
+        with pytest.raises(ReplayMissError):
+            requests.get(f'{server}/c')
+
+
+def test_uninstall(tmp_path, server):
+    cassette = CloudApiCassette(tmp_path, replay=True, hosts=('127.0.0.1',))
+    with cassette:
+        with pytest.raises(ReplayMissError):
+            requests.get(f'{server}/a')
+    assert requests.get(f'{server}/a').status_code == 200
+    assert account(sts_client(server))
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+c7n_cache = pytest.importorskip('c7n.cache')
+
+from c7n.config import Config  # noqa: E402
+
+from executor.helpers.resources_cache import ResourcesCache  # noqa: E402
+
+KEY = {'account': '123', 'region': 'eu-west-1', 'resource': 'Instance',
+       'source': 'describe', 'q': None}
+
+
+@pytest.fixture
+def config(tmp_path) -> Config:
+    return Config.empty(cache=str(tmp_path / 'cache'), cache_period=30)
+
+
+def test_install(config):
+    original = c7n_cache.factory
+    with ResourcesCache() as cache:
+        assert c7n_cache.factory is not original
+        assert isinstance(c7n_cache.factory(Config.empty(cache_period=0)),
+                          c7n_cache.NullCache)
+        assert cache.installed
+    assert c7n_cache.factory is original
+    assert not cache.installed
+
+
+def test_copies(config):
+    with ResourcesCache():
+        one, two = c7n_cache.factory(config), c7n_cache.factory(config)
+        with one:
+            assert one.get(KEY) is None
+            one.save(KEY, [{'InstanceId': 'i-1'}])
+        with two:
+            resources = two.get(KEY)
+            assert resources == [{'InstanceId': 'i-1'}]
+            resources[0]['c7n:MatchedFilters'] = ['State.Name']
+        with one:
+            assert one.get(KEY) == [{'InstanceId': 'i-1'}]
+
+
+def test_single_flight(config):
+    described = []
+    results = []
+
+    def describe():
+        manager_cache = c7n_cache.factory(config)
+        with manager_cache:
+            resources = manager_cache.get(KEY)
+            if resources is None:
+                time.sleep(0.05)
+                described.append(1)
+                resources = [{'InstanceId': 'i-1'}]
+                manager_cache.save(KEY, resources)
+        results.append(resources)
+
+    with ResourcesCache():
+        threads = [threading.Thread(target=describe) for _ in range(5)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+    assert len(described) == 1
+    assert results == [[{'InstanceId': 'i-1'}]] * 5
+
+
+def test_failed_describe_releases_key(config):
+    with ResourcesCache():
+        one, two = c7n_cache.factory(config), c7n_cache.factory(config)
+        with one:
+            assert one.get(KEY) is None
+        # not saved, so the next manager must describe resources itself
+        with two:
+            assert two.get(KEY) is None
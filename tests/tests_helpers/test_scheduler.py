@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import Counter
+
+from executor.helpers.scheduler import (AIMDLimit, AdaptiveScheduler,
+                                        PoliciesDurations)
+
+
+def test_aimd_limit():
+    limit = AIMDLimit(initial=4, maximum=8)
+    assert limit.value == 4
+    for _ in range(5):
+        limit.increase()
+    assert limit.value == 5
+
+    started_at = time.monotonic()
+    assert limit.decrease(started_at)
+    assert limit.value == 2
+    # calls from the same window do not decrease it again
+    assert not limit.decrease(started_at)
+    assert limit.value == 2
+    assert limit.decrease(time.monotonic())
+    assert limit.value == 1
+    assert limit.decrease(time.monotonic())
+    assert limit.value == 1
+
+    for _ in range(100):
+        limit.increase()
+    assert limit.value == 8
+
+
+def test_scheduler_respects_group_limits():
+    lock = threading.Lock()
+    running, peak = Counter(), Counter()
+
+    def call(item):
+        group = item[0]
+        with lock:
+            running[group] += 1
+            peak[group] = max(peak[group], running[group])
+        time.sleep(0.01)
+        with lock:
+            running[group] -= 1
+
+    items = [('ec2', i) for i in range(20)] + [('iam', i) for i in range(5)]
+    scheduler = AdaptiveScheduler(workers=8, initial=2, maximum=3)
+    done = []
+    for item, future in scheduler.run(items, lambda i: i[0], call):
+        assert future.exception() is None
+        done.append(item)
+    assert sorted(done) == sorted(items)
+    assert peak['ec2'] <= 3
+    assert peak['iam'] <= 3
+    assert scheduler.limits == {'ec2': 3, 'iam': 3}
+
+
+def test_scheduler_throttling_feedback():
+    items = list(range(10))
+    scheduler = AdaptiveScheduler(workers=4, initial=4, maximum=4)
+    it = scheduler.run(items, lambda i: 'ec2', lambda i: None)
+    for _, future in it:
+        scheduler.feedback(future, {'iam': time.monotonic()})
+    # throttling of another group does not decrease the own one
+    assert scheduler.limits == {'ec2': 4, 'iam': 1}
+
+    scheduler = AdaptiveScheduler(workers=4, initial=4, maximum=4)
+    it = scheduler.run(items, lambda i: 'ec2', lambda i: None)
+    observed_at = time.monotonic()
+    for _, future in it:
+        # reported at once, so it's decreased only once
+        scheduler.feedback(future, {'ec2': observed_at})
+    assert scheduler.limits == {'ec2': 2}
+
+
+def test_policies_durations():
+    durations = PoliciesDurations(alpha=0.5)
+    durations.update([
+        {'region': 'eu-west-1', 'policy': 'slow', 'start_time': 10.,
+         'end_time': 110.},
+        {'region': 'eu-west-1', 'policy': 'fast', 'start_time': 10.,
+         'end_time': 11.},
+        {'region': 'us-east-1', 'policy': 'slow', 'start_time': 10.,
+         'end_time': 60.},
+        {'region': 'eu-west-1', 'policy': 'failed'}
+    ])
+    assert len(durations) == 3
+    durations.update([{'region': 'eu-west-1', 'policy': 'fast',
+                       'start_time': 10., 'end_time': 13.}])
+    assert durations.get('eu-west-1', 'fast') == 2.
+    assert durations.get('eu-central-1', 'slow') == 75.
+    assert durations.get('eu-west-1', 'new') is None
+
+
+def test_longest_first():
+    durations = PoliciesDurations({
+        'eu-west-1': {'a': 1., 'b': 10., 'c': 5.},
+        'global': {'d': 100.}
+    })
+    items = [('eu-west-1', 'a'), ('eu-west-1', 'new'), ('global', 'd'),
+             ('eu-west-1', 'c'), ('eu-west-1', 'b')]
+    assert durations.longest_first(items, lambda i: i) == [
+        ('global', 'd'), ('eu-west-1', 'b'), ('eu-west-1', 'new'),
+        ('eu-west-1', 'c'), ('eu-west-1', 'a')
+    ]
+    assert PoliciesDurations().longest_first(items, lambda i: i) == items
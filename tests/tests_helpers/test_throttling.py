@@ -0,0 +1,91 @@
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+from requests import Request, Response
+from requests.adapters import HTTPAdapter
+
+from executor.helpers.throttling import (ThrottlingCounter, azure_service,
+                                         google_service)
+
+THROTTLED = b'''<?xml version="1.0" encoding="UTF-8"?>
+<Response><Errors><Error><Code>RequestLimitExceeded</Code>
+<Message>Request limit exceeded.</Message></Error></Errors>
+<RequestID>1</RequestID></Response>'''
+
+
+class _Body:
+    def __init__(self, content: bytes):
+        self._content = content
+
+    def stream(self, **kwargs):
+        yield self._content
+
+
+def test_azure_service():
+    assert azure_service(
+        'https://management.azure.com/subscriptions/1/providers/'
+        'Microsoft.Compute/virtualMachines?api-version=2023-03-01'
+    ) == 'azure.mgmt.compute'
+    assert azure_service(
+        'https://management.azure.com/subscriptions/1/resourcegroups'
+    ) == 'azure.mgmt.resource'
+    assert azure_service('https://login.microsoftonline.com/token') is None
+
+
+def test_google_service():
+    assert google_service(
+        'https://compute.googleapis.com/compute/v1/projects/p/zones'
+    ) == 'compute'
+    assert google_service(
+        'https://www.googleapis.com/storage/v1/b?project=p'
+    ) == 'storage'
+    assert google_service('https://example.com/compute') is None
+
+
+def test_botocore(monkeypatch):
+    import botocore.endpoint
+    monkeypatch.setattr(botocore.endpoint.time, 'sleep', lambda s: None)
+
+    with ThrottlingCounter() as counter:
+        session = boto3.Session(aws_access_key_id='key',
+                                aws_secret_access_key='secret')
+    client = session.client('ec2', region_name='eu-west-1')
+    sent = []
+
+    def before_send(request, **kwargs):
+        sent.append(request)
+        return AWSResponse(request.url, 503, {}, _Body(THROTTLED))
+
+    client.meta.events.register('before-send', before_send)
+    with pytest.raises(ClientError):
+        client.describe_instances()
+    # each attempt is counted, not only the last one
+    assert len(sent) > 1
+    assert counter.total == {('eu-west-1', 'ec2'): len(sent)}
+    assert list(counter.drain()) == [('eu-west-1', 'ec2')]
+    assert counter.drain() == {}
+
+    other = boto3.Session(aws_access_key_id='key',
+                          aws_secret_access_key='secret')
+    client = other.client('ec2', region_name='eu-west-1')
+    client.meta.events.register('before-send', before_send)
+    with pytest.raises(ClientError):
+        client.describe_instances()
+    assert counter.drain() == {}  # uninstalled
+
+
+def test_requests(monkeypatch):
+    def send(adapter, request, *args, **kwargs):
+        response = Response()
+        response.status_code = 429
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, 'send', send)
+    url = ('https://management.azure.com/subscriptions/1/providers/'
+           'Microsoft.Storage/storageAccounts')
+    with ThrottlingCounter() as counter:
+        HTTPAdapter().send(Request('GET', url).prepare())
+    HTTPAdapter().send(Request('GET', url).prepare())  # uninstalled
+    assert HTTPAdapter.send is send
+    assert counter.total == {('global', 'azure.mgmt.storage'): 1}
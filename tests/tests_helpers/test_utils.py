@@ -8,7 +8,8 @@ from helpers import (deep_get, deep_set, title_keys, setdefault, filter_dict,
                      hashable, urljoin, skip_indexes, peek, without_duplicates,
                      MultipleCursorsWithOneLimitIterator, catchdefault,
                      batches, dereference_json, NextToken, iter_values,
-                     flip_dict, Version)
+                     flip_dict, Version, compile_json_path, json_path_get,
+                     json_path_steps_get)
 
 
 @pytest.fixture
@@ -321,3 +322,15 @@ def test_version():
 
     ver = Version('1.2.3')
     assert Version(ver) is ver
+
+
+def test_json_path():
+    data = {'a': {'b': [1, {'c': 2}]}, 'd': None, 'e': 'str'}
+    assert compile_json_path('$.a.b[1].c') == ('a', 'b', 1, 'c')
+    assert compile_json_path('a.b[-1][0]') == ('a', 'b', -1, 0)
+    assert json_path_steps_get(data, ('a', 'b', 1, 'c')) == 2
+    assert json_path_get(data, 'a.b[1].c') == 2
+    assert json_path_get(data, 'a.b[5].c') is None
+    assert json_path_get(data, 'd.b') is None
+    assert json_path_get(data, 'e.b') is None
+    assert json_path_get([-1, {'one': 'two'}], '[-1].one') == 'two'
@@ -1,4 +1,5 @@
 from datetime import datetime, timezone
+from unittest.mock import create_autospec
 
 import pytest
 from modular_sdk.models.parent import Parent
@@ -7,11 +8,11 @@ from modular_sdk.models.tenant import Tenant
 from helpers.constants import Cloud
 from models.batch_results import BatchResults
 from models.job import Job
-from services.clients.s3 import S3Url
+from services.clients.s3 import S3Client, S3Url
 from services.platform_service import Platform
 from services.reports_bucket import TenantReportsBucketKeysBuilder, \
     ReportsBucketKeysBuilder, PlatformReportsBucketKeysBuilder, \
-    StatisticsBucketKeysBuilder
+    StatisticsBucketKeysBuilder, SnapshotsIndex
 
 
 @pytest.fixture
@@ -155,6 +156,17 @@ class TestStatisticsBucketKeyBuilder:
         res = StatisticsBucketKeysBuilder.job_statistics(ed_job)
         assert res == 'job-statistics/event-driven/job_id/statistics.json'
 
+    def test_job_checkpoint(self, standard_job):
+        res = StatisticsBucketKeysBuilder.job_checkpoint(standard_job)
+        assert res == 'job-statistics/checkpoints/job_id.tar.gz'
+
+    def test_policies_durations(self, aws_tenant, k8s_platform):
+        res = StatisticsBucketKeysBuilder.policies_durations(aws_tenant)
+        assert res == 'job-statistics/durations/TEST-CUSTOMER/TEST-TENANT.json'
+        res = StatisticsBucketKeysBuilder.policies_durations(aws_tenant,
+                                                             k8s_platform)
+        assert res == 'job-statistics/durations/TEST-CUSTOMER/platform_id.json'
+
     def test_report_statistics(self):
         now = datetime.now(timezone.utc)
         res = StatisticsBucketKeysBuilder.report_statistics(
@@ -168,6 +180,14 @@ class TestStatisticsBucketKeyBuilder:
         res = StatisticsBucketKeysBuilder.xray_log('job_id')
         assert res == f'xray/executor/{now.year}/{now.month}/{now.day}/job_id.log'
 
+    def test_profile(self):
+        now = datetime.now(timezone.utc)
+        res = StatisticsBucketKeysBuilder.profile('job_id', 'speedscope.json')
+        assert res == f'xray/executor/{now.year}/{now.month}/{now.day}/job_id.profile.speedscope.json'
+        res = StatisticsBucketKeysBuilder.profile('job_id', 'collapsed.txt',
+                                                  'br_id')
+        assert res == f'xray/executor/{now.year}/{now.month}/{now.day}/job_id.br_id.profile.collapsed.txt'
+
 
 def test_s3_url():
     url = S3Url('s3://bucket/path/to/file')
@@ -181,3 +201,33 @@ def test_s3_url():
     url = S3Url('bucket/path/to/file/')
     assert url.bucket == 'bucket'
     assert url.key == 'path/to/file/'
+
+
+class TestSnapshotsIndex:
+    def test_nearest(self):
+        index = SnapshotsIndex(['2023-12-10-14', '2023-12-10-10',
+                                '2023-12-11-02'])
+        assert index.nearest('2023-12-10-09') == '2023-12-10-10'
+        assert index.nearest('2023-12-10-10') == '2023-12-10-10'
+        assert index.nearest('2023-12-10-13') == '2023-12-10-10'
+        assert index.nearest('2023-12-12-00') == '2023-12-11-02'
+        assert SnapshotsIndex().nearest('2023-12-12-00') is None
+
+    def test_add(self):
+        index = SnapshotsIndex(['2023-12-10-14'])
+        assert index.add('2023-12-10-10')
+        assert not index.add('2023-12-10-14')
+        assert list(index) == ['2023-12-10-10', '2023-12-10-14']
+        assert index.last == '2023-12-10-14'
+        assert SnapshotsIndex().last is None
+
+    def test_from_prefixes(self):
+        client = create_autospec(S3Client)
+        client.common_prefixes.return_value = iter([
+            'raw/TEST-CUSTOMER/AWS/123/snapshots/2023-12-10-10/',
+            'raw/TEST-CUSTOMER/AWS/123/snapshots/2023-12-10-14/'
+        ])
+        index = SnapshotsIndex.from_prefixes(
+            client, 'reports', 'raw/TEST-CUSTOMER/AWS/123/snapshots/'
+        )
+        assert list(index) == ['2023-12-10-10', '2023-12-10-14']
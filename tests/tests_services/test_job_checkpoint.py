@@ -0,0 +1,64 @@
+import io
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip('c7n')
+
+from executor.services.report_service import JobCheckpoint  # noqa: E402
+from helpers.constants import PolicyErrorType  # noqa: E402
+
+
+def write_output(root, region, policy, resources=None):
+    folder = root / region / policy
+    folder.mkdir(parents=True)
+    (folder / 'metadata.json').write_text(json.dumps({'policy': {}}))
+    if resources is not None:
+        (folder / 'resources.json').write_text(json.dumps(resources))
+
+
+@pytest.fixture
+def client():
+    storage = {}
+    client = MagicMock()
+
+    def put_object(bucket, key, body, **kwargs):
+        storage[key] = body.read()
+
+    def get_object(bucket, key, buffer=None):
+        if key not in storage:
+            return
+        buffer = buffer or io.BytesIO()
+        buffer.write(storage[key])
+        buffer.seek(0)
+        return buffer
+
+    client.put_object.side_effect = put_object
+    client.get_object.side_effect = get_object
+    return client
+
+
+def test_save_restore(tmp_path, client):
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+    write_output(first, 'eu-west-1', 'p1', [{'id': 'i-1'}])
+    write_output(first, 'global', 'p2', [])
+    write_output(first, 'eu-west-1', 'p3')  # failed
+    failed = {('eu-west-1', 'p3'): (PolicyErrorType.ACCESS, 'denied', [])}
+
+    checkpoint = JobCheckpoint(first)
+    assert checkpoint.completed() == {('eu-west-1', 'p1'), ('global', 'p2'),
+                                      ('eu-west-1', 'p3')}
+    checkpoint.save(client, 'bucket', 'checkpoints/job.tar.gz', failed)
+
+    restored = JobCheckpoint(second)
+    assert restored.restore(client, 'bucket', 'checkpoints/job.tar.gz') == failed
+    assert restored.completed() == checkpoint.completed()
+    assert json.loads(
+        (second / 'eu-west-1' / 'p1' / 'resources.json').read_text()
+    ) == [{'id': 'i-1'}]
+    assert not (second / 'failed.json').exists()
+
+    assert JobCheckpoint(second).restore(client, 'bucket', 'missing') == {}
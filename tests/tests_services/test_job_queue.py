@@ -0,0 +1,70 @@
+from unittest.mock import MagicMock, patch
+
+from services.clients.batch import SubprocessBatchClient
+from services.clients.job_queue import (
+    EVENT_DRIVEN_PRIORITY,
+    QUEUED,
+    STANDARD_PRIORITY,
+    pick_next,
+)
+
+
+def job(_id: str, customer: str, submitted_at: float,
+        priority: int = STANDARD_PRIORITY) -> dict:
+    return {'_id': _id, 'customer': customer, 'priority': priority,
+            'submitted_at': submitted_at}
+
+
+def test_pick_next_empty():
+    assert pick_next([], {}) is None
+
+
+def test_pick_next_event_driven_first():
+    queued = [job('a1', 'A', 1), job('ed', 'SYSTEM', 2, EVENT_DRIVEN_PRIORITY)]
+    assert pick_next(queued, {})['_id'] == 'ed'
+
+
+def test_pick_next_round_robin():
+    queued = [job('a1', 'A', 1), job('a2', 'A', 2), job('b1', 'B', 3),
+              job('c1', 'C', 4)]
+    # customer that has never been served goes first
+    assert pick_next(queued, {'A': 10})['_id'] == 'b1'
+    assert pick_next(queued, {'A': 10, 'B': 11})['_id'] == 'c1'
+    assert pick_next(queued, {'A': 10, 'B': 11, 'C': 12})['_id'] == 'a1'
+    # among customers never served the oldest job goes first
+    assert pick_next(queued, {})['_id'] == 'a1'
+
+
+def test_has_capacity():
+    queue = MagicMock()
+    client = SubprocessBatchClient(queue=queue, max_jobs=2, job_memory=100)
+    with patch('services.clients.batch.available_memory', return_value=50):
+        queue.running.return_value = []
+        assert client._has_capacity()  # one job can always run
+        queue.running.return_value = [{}]
+        assert not client._has_capacity()
+    with patch('services.clients.batch.available_memory', return_value=200):
+        assert client._has_capacity()
+        queue.running.return_value = [{}, {}]
+        assert not client._has_capacity()
+
+
+def test_submit_job_without_dispatch():
+    queue = MagicMock()
+    queue.put.side_effect = lambda job_id, name, customer, priority, env: {
+        '_id': job_id, 'name': name, 'customer': customer,
+        'priority': priority, 'status': QUEUED, 'env': env,
+        'submitted_at': 1
+    }
+    client = SubprocessBatchClient(queue=queue)
+    with patch('services.clients.batch.subprocess.Popen') as popen, \
+            patch('services.clients.batch.threading.Thread') as thread:
+        job = client.submit_job({'CUSTOMER_NAME': 'A'}, 'continuation',
+                                dispatch=False)
+        assert job['status'] == QUEUED
+        client.get_job(job['jobId'])
+    queue.put.assert_called_once()
+    queue.acquire.assert_not_called()
+    queue.claim.assert_not_called()
+    popen.assert_not_called()
+    thread.assert_not_called()
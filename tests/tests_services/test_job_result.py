@@ -0,0 +1,93 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytest.importorskip('c7n')
+
+from executor.services.report_service import JobResult  # noqa: E402
+from helpers.constants import Cloud, PolicyErrorType  # noqa: E402
+
+
+def write_output(root, region, policy, resources=None, resource='aws.ec2'):
+    folder = root / region / policy
+    folder.mkdir(parents=True)
+    (folder / 'metadata.json').write_text(json.dumps({
+        'policy': {'name': policy, 'resource': resource, 'filters': [],
+                   'description': policy},
+        'execution': {'start': 10., 'end_time': 12.},
+        'metrics': [{'MetricName': 'ResourceCount', 'Value': 1}]
+    }))
+    if resources is not None:
+        (folder / 'resources.json').write_text(json.dumps(resources))
+
+
+@pytest.fixture
+def fields():
+    with patch('executor.services.report_service.ReportFieldsLoader') as rfl:
+        rfl.accessors.return_value = (('id', ('InstanceId',)),)
+        yield rfl
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_ingest(tmp_path, fields, workers):
+    write_output(tmp_path, 'eu-west-1', 'ec2-one', [{'InstanceId': 'i-1'}])
+    write_output(tmp_path, 'eu-west-1', 'ec2-two', [])
+    write_output(tmp_path, 'us-east-1', 'ec2-one', [{'InstanceId': 'i-2'}])
+    write_output(tmp_path, 'us-east-1', 'ec2-failed')
+
+    result = JobResult(tmp_path, Cloud.AWS, workers=workers)
+    with patch.object(result, '_load_raw_rule_output',
+                      wraps=result._load_raw_rule_output) as load:
+        parts = list(result.iter_shard_parts())
+        meta = result.rules_meta()
+        tenant = MagicMock()
+        tenant.name, tenant.customer_name = 'tenant', 'customer'
+        statistics = result.statistics(tenant, {})
+    assert load.call_count == 4  # each directory is read only once
+
+    assert sorted((p.location, p.policy) for p in parts) == [
+        ('eu-west-1', 'ec2-one'), ('eu-west-1', 'ec2-two'),
+        ('us-east-1', 'ec2-one')
+    ]
+    by_key = {(p.location, p.policy): p.resources for p in parts}
+    assert by_key[('us-east-1', 'ec2-one')] == [
+        {'InstanceId': 'i-2', 'id': 'i-2'}
+    ]
+    assert meta['ec2-one'] == {'resource': 'aws.ec2',
+                               'description': 'ec2-one'}
+    assert len(statistics) == 4
+    failed, = [s for s in statistics if s['policy'] == 'ec2-failed']
+    assert failed['error_type'] == PolicyErrorType.INTERNAL
+    result.close()
+
+
+def test_ingest_azure_locations(tmp_path, fields):
+    write_output(tmp_path, 'AzureCloud', 'vm', [
+        {'InstanceId': 'a', 'location': 'westeurope'},
+        {'InstanceId': 'b'}
+    ], resource='azure.vm')
+    result = JobResult(tmp_path, Cloud.AZURE)
+    parts = {p.location: p.resources for p in result.iter_shard_parts()}
+    assert parts == {
+        'westeurope': [{'InstanceId': 'a', 'location': 'westeurope',
+                        'id': 'a'}],
+        'global': [{'InstanceId': 'b', 'id': 'b'}]
+    }
+    assert result.statistics(MagicMock(), {})[0]['region'] == 'AzureCloud'
+    result.close()
+
+
+def test_extend_resources():
+    resources = [
+        {'InstanceId': 'i-1', 'Tags': [{'Key': 'Name', 'Value': 'one'}]},
+        {'InstanceId': 'i-2', 'Tags': []}
+    ]
+    JobResult.extend_resources(resources, (
+        ('id', ('InstanceId',)),
+        ('name', ('Tags', 0, 'Value')),
+        ('arn', ('Arn',))
+    ))
+    assert [(r.get('id'), r.get('name'), 'arn' in r) for r in resources] == [
+        ('i-1', 'one', False), ('i-2', None, False)
+    ]
@@ -1,13 +1,23 @@
+import gzip
 import io
 import operator
+import os
 from unittest.mock import create_autospec, MagicMock
 
 import pytest
 
 from services.clients.s3 import S3Client
+from helpers.codecs import GZIP, ZstdCodec
+from helpers.constants import Cloud
 from services.sharding import (SingleShardDistributor, ShardPart,
                                AWSRegionDistributor, Shard, ShardsIterator,
-                               ShardsS3IO, ShardsCollection)
+                               ShardsS3IO, ShardsS3IOV2, ShardsS3IOV3,
+                               ShardsCollection,
+                               PolicyHashDistributor, ShardingConfig,
+                               ShardsCollectionFactory, reshard,
+                               reshard_to_configured,
+                               SpillStore, SpilledShardPart,
+                               ShardsDiskCache)
 
 
 @pytest.fixture
@@ -72,6 +82,65 @@ class TestShardDistributors:
         assert item.distribute_part(make_shard_part('eu-west-2')) == 14
         assert item.distribute_part(make_shard_part('eu-west-1')) == 13
 
+    def test_policy_hash(self, make_shard_part):
+        item = PolicyHashDistributor(4)
+        n = item.distribute_part(make_shard_part('global', 'policy1'))
+        assert 0 <= n < 4
+        assert item.distribute_part(make_shard_part('eu-west-1', 'policy1')) == n
+        assert item.distribute(policy='policy1') == n
+
+
+class TestShardingConfig:
+    def test_default(self):
+        conf = ShardingConfig.from_raw({'version': 1})
+        assert conf.serialize() == {'version': 1}
+        distributor = conf.build_distributor(Cloud.AWS)
+        assert isinstance(distributor, AWSRegionDistributor)
+        assert distributor.shards_number == 2
+        assert isinstance(conf.build_distributor(Cloud.AZURE),
+                          SingleShardDistributor)
+
+    def test_custom(self):
+        raw = {'version': 3, 'distributor': 'policy_hash', 'shards': 8}
+        conf = ShardingConfig.from_raw(raw)
+        assert conf.serialize() == raw
+        distributor = conf.build_distributor(Cloud.AWS)
+        assert isinstance(distributor, PolicyHashDistributor)
+        assert distributor.shards_number == 8
+        io_ = conf.build_io('reports', 'latest', create_autospec(S3Client))
+        assert isinstance(io_, ShardsS3IOV3)
+
+    def test_codec(self):
+        pytest.importorskip('zstandard')
+        client = create_autospec(S3Client)
+        client.get_object.return_value = io.BytesIO(b'raw content dict')
+        raw = {'version': 2, 'codec': 'zstd', 'level': 10,
+               'dictionary': 'dictionaries/aws.zdict'}
+        conf = ShardingConfig.from_raw(raw)
+        assert conf.serialize() == raw
+        conf.build_io('reports', 'latest', client)
+        conf.build_io('reports', 'latest', client)
+        client.get_object.assert_called_once_with('reports',
+                                                  'dictionaries/aws.zdict')
+
+        conf = ShardingConfig(2, codec='zstd')
+        io_ = conf.build_io('reports', 'latest', client)
+        assert isinstance(io_.codec, ZstdCodec)
+        assert io_._object_key(0) == 'latest/0.json.zst'
+        assert ShardingConfig(1).build_io('reports', 'latest',
+                                          client).codec is GZIP
+
+    def test_invalid(self):
+        with pytest.raises(RuntimeError):
+            ShardingConfig(1, 'unknown').build_distributor(Cloud.AWS)
+        with pytest.raises(RuntimeError):
+            ShardingConfig(1, codec='unknown').build_io(
+                'reports', 'latest', create_autospec(S3Client)
+            )
+        with pytest.raises(RuntimeError):
+            ShardingConfig(4).build_io('reports', 'latest',
+                                       create_autospec(S3Client))
+
 
 class TestShardPart:
     def test_serialize_deserialize(self, make_shard_part):
@@ -111,6 +180,20 @@ class TestShard:
         assert len(shard1) == 2
         assert tuple(shard1) == (part2, part3)
 
+    def test_digest(self, make_shard_part):
+        part1 = make_shard_part('global', 'policy1', [{'k1': 'v1', 'a': 1}])
+        part2 = make_shard_part('global', 'policy2', [{'k2': 'v2'}])
+        shard1 = Shard()
+        shard1.put(part1)
+        shard1.put(part2)
+        shard2 = Shard()
+        shard2.put(make_shard_part('global', 'policy2', [{'k2': 'v2'}]))
+        shard2.put(make_shard_part('global', 'policy1', [{'a': 1, 'k1': 'v1'}]))
+        assert shard1.digest() == shard2.digest()
+
+        shard2.put(make_shard_part('global', 'policy1', [{'a': 2, 'k1': 'v1'}]))
+        assert shard1.digest() != shard2.digest()
+
 
 class TestShardIterator:
     def test_it(self, make_shard):
@@ -147,13 +230,37 @@ class TestShardsS3IO:
         writer.write(1, shard)
         client.gz_put_object.assert_called()
 
+    def test_write_many_concurrently(self, make_shard):
+        writer, client = self.create_writer()
+        writer._workers = 3
+        writer.write_many((i, make_shard()) for i in range(5))
+        keys = {c.kwargs['key'] for c in client.gz_put_object.call_args_list}
+        assert keys == {f'one/two/three/{i}.json' for i in range(5)}
+
+    def test_read_raw_many_order(self):
+        writer, client = self.create_writer()
+        writer._workers = 3
+
+        def get_object(bucket, key, **kwargs):
+            if key.endswith('2.json'):
+                return
+            n = key.rsplit('/', maxsplit=1)[-1].split('.')[0]
+            return io.BytesIO(f'[{{"p":"policy{n}","t":1.0}}]'.encode())
+
+        client.gz_get_object.side_effect = get_object
+        res = list(writer.read_raw_many(range(5)))
+        assert [parts[0].policy for parts in res] == [
+            'policy0', 'policy1', 'policy3', 'policy4'
+        ]
+
     def test_write_meta(self):
         writer, client = self.create_writer()
         writer.write_meta({})
         client.gz_put_json.assert_called_with(
             bucket='reports',
             key='one/two/three/meta.json',
-            obj={}
+            obj={},
+            codec=GZIP
         )
 
     def test_read_raw(self):
@@ -166,16 +273,204 @@ class TestShardsS3IO:
                                  timestamp=1711309249.0, resources=[])]
         client.gz_get_object.assert_called()
 
+    def test_write_if_changed(self, make_shard):
+        shard = make_shard()
+        writer, client = self.create_writer()
+        client.gz_object_metadata.return_value = None
+        assert writer.write_if_changed(1, shard)
+        client.gz_put_object.assert_called_once()
+        digest = client.gz_put_object.call_args.kwargs['metadata']['digest']
+        assert digest == shard.digest()
+
+        client.gz_put_object.reset_mock()
+        client.gz_object_metadata.return_value = {'digest': digest}
+        assert not writer.write_if_changed(1, make_shard())
+        client.gz_put_object.assert_not_called()
+
+    def test_write_meta_if_changed(self):
+        writer, client = self.create_writer()
+        client.gz_object_metadata.return_value = {}
+        assert writer.write_meta_if_changed({'policy': {'a': 'b'}})
+        metadata = client.gz_put_json.call_args.kwargs['metadata']
+
+        client.gz_put_json.reset_mock()
+        client.gz_object_metadata.return_value = metadata
+        assert not writer.write_meta_if_changed({'policy': {'a': 'b'}})
+        client.gz_put_json.assert_not_called()
+
     def test_read_meta(self):
         writer, client = self.create_writer()
         client.gz_get_json.return_value = {'policy': {'description': 'data'}}
         assert writer.read_meta() == {'policy': {'description': 'data'}}
         client.gz_get_json.assert_called_with(
             bucket='reports',
-            key='one/two/three/meta.json'
+            key='one/two/three/meta.json',
+            codec=GZIP
         )
 
 
+class TestShardsS3IOV2:
+    @staticmethod
+    def create_writer() -> tuple[ShardsS3IOV2, MagicMock, dict]:
+        storage = {}
+        client = create_autospec(S3Client)
+
+        def gz_put_object(bucket, key, body, **kwargs):
+            storage[key] = body.read()
+
+        def gz_iter_lines(bucket, key, **kwargs):
+            if key not in storage:
+                return
+            return iter(io.BytesIO(storage[key]))
+
+        client.gz_put_object.side_effect = gz_put_object
+        client.gz_iter_lines.side_effect = gz_iter_lines
+        writer = ShardsS3IOV2(
+            bucket='reports',
+            key='one/two/three',
+            client=client
+        )
+        return writer, client, storage
+
+    def test_write_read_raw(self, make_shard):
+        shard = make_shard()
+        writer, client, storage = self.create_writer()
+        writer.write(1, shard)
+        assert storage['one/two/three/1.json'].count(b'\n') == 1
+        assert writer.read_raw(1) == list(shard)
+        assert writer.read_raw(2) is None
+
+    def test_iter_raw_lazy(self, make_shard):
+        writer, client, _ = self.create_writer()
+        client.gz_iter_lines.side_effect = None
+        lines = iter([
+            b'{"p":"policy1","l":"global","t":1.0,"r":[]}\n',
+            b'{"p":"policy2","l":"global","t":1.0,"r":[]}',
+        ])
+        client.gz_iter_lines.return_value = lines
+        it = writer.iter_raw(1)
+        assert next(it).policy == 'policy1'
+        assert next(lines).startswith(b'{"p":"policy2"')  # not consumed yet
+
+
+class TestS3ClientStreaming:
+    def test_gz_iter_lines(self):
+        client = S3Client()
+        client._client = MagicMock()
+        body = io.BytesIO(gzip.compress(b'one\ntwo\nthree'))
+        client.client.get_object.return_value = {'Body': body}
+        assert list(client.gz_iter_lines('bucket', 'key.json')) == [
+            b'one\n', b'two\n', b'three'
+        ]
+        client.client.get_object.assert_called_once_with(
+            Bucket='bucket', Key='key.json.gz'
+        )
+        assert body.closed
+
+
+class TestShardsS3IOV3:
+    @staticmethod
+    def create_writer() -> tuple[ShardsS3IOV3, MagicMock, dict]:
+        storage = {}
+        client = create_autospec(S3Client)
+
+        def put_object(bucket, key, body, **kwargs):
+            storage[key] = body.read()
+
+        def get_object(bucket, key, **kwargs):
+            if key not in storage:
+                return
+            return io.BytesIO(storage[key])
+
+        def get_object_range(bucket, key, start=None, end=None):
+            if key not in storage:
+                return
+            data = storage[key]
+            if start is None:
+                return data[-end:]
+            return data[start:end + 1]
+
+        client.put_object.side_effect = put_object
+        client.get_object.side_effect = get_object
+        client.get_object_range.side_effect = get_object_range
+        writer = ShardsS3IOV3(
+            bucket='reports',
+            key='one/two/three',
+            client=client
+        )
+        return writer, client, storage
+
+    @staticmethod
+    def make_big_shard(make_shard_part) -> Shard:
+        shard = Shard()
+        for i in range(5):
+            shard.put(make_shard_part(
+                'eu-west-1', f'policy{i}',
+                [{'id': f'{i}-{j}', 'data': str(j) * 100} for j in range(50)]
+            ))
+        return shard
+
+    def test_write_read_raw(self, make_shard):
+        shard = make_shard()
+        writer, client, storage = self.create_writer()
+        writer.write(1, shard)
+        assert list(storage) == ['one/two/three/1.bin']
+        assert writer.read_raw(1) == list(shard)
+        assert writer.read_raw(2) is None
+
+    def test_read_index(self, make_shard):
+        writer, client, _ = self.create_writer()
+        writer.write(1, make_shard())
+        index = writer.read_index(1)
+        assert [(i.policy, i.location, i.count) for i in index] == [
+            ('policy1', 'global', 1), ('policy2', 'global', 1)
+        ]
+
+    def test_zstd(self, make_shard):
+        pytest.importorskip('zstandard')
+        shard = make_shard()
+        _, client, storage = self.create_writer()
+        writer = ShardsS3IOV3('reports', 'one/two/three', client,
+                              codec=ZstdCodec())
+        writer.write(1, shard)
+        assert sorted(writer.read_raw(1), key=operator.attrgetter('policy')) \
+            == sorted(shard, key=operator.attrgetter('policy'))
+        assert writer.read_parts(1, policies={'policy2'}) == \
+            [p for p in shard if p.policy == 'policy2']
+
+    def test_read_parts_from_tail(self, make_shard):
+        shard = make_shard()
+        writer, client, _ = self.create_writer()
+        writer.write(1, shard)
+        parts = writer.read_parts(1, policies={'policy2'})
+        assert parts == [p for p in shard if p.policy == 'policy2']
+        # the whole small shard is inside the first ranged GET
+        assert client.get_object_range.call_count == 1
+        client.get_object.assert_not_called()
+
+    def test_read_parts_ranged(self, make_shard_part, monkeypatch):
+        monkeypatch.setattr(ShardsS3IOV3, 'tail_size', 64)
+        monkeypatch.setattr(ShardsS3IOV3, 'max_gap', 0)
+        shard = self.make_big_shard(make_shard_part)
+        writer, client, _ = self.create_writer()
+        writer.write(0, shard)
+        parts = writer.read_parts(0, policies={'policy1', 'policy3'})
+        assert parts == [p for p in shard
+                         if p.policy in ('policy1', 'policy3')]
+        # tail, index, two separate ranges for parts
+        assert client.get_object_range.call_count == 4
+
+        client.get_object_range.reset_mock()
+        assert writer.read_parts(0, locations={'global'}) == []
+        assert writer.read_parts(1) is None
+
+    def test_invalid_file(self):
+        writer, client, storage = self.create_writer()
+        storage['one/two/three/1.bin'] = b'[{"p": "policy"}]'
+        with pytest.raises(ValueError):
+            writer.read_raw(1)
+
+
 class TestShardCollection:
     @staticmethod
     def create_collection() -> ShardsCollection:
@@ -257,3 +552,304 @@ class TestShardCollection:
         assert (len(p1.resources) == 2 and {'k2': 'v2'} in p1.resources
                 and {'k3': 'v3'} in p1.resources)
         assert p2.resources == [{'k3': 'v3'}]
+
+    def test_diff(self, make_shard_part):
+        old = [make_shard_part('global', 'policy1',
+                               [{'a': 1, 'b': [1, 2]}, {'k1': 'v1'}]),
+               make_shard_part('global', 'policy3', [{'k4': 'v4'}])]
+        current = [make_shard_part('global', 'policy1',
+                                   [{'b': [1, 2], 'a': 1}, {'k2': 'v2'}]),
+                   make_shard_part('eu-west-1', 'policy2', [{'k3': 'v3'}])]
+        c1 = self.create_collection()
+        c1.put_parts(old)
+        c2 = ShardsCollection(SingleShardDistributor(), MagicMock())
+        c2.put_parts(current)
+
+        new, removed = c2.diff(c1)
+        parts = sorted(new.iter_parts(), key=operator.attrgetter('policy'))
+        assert [(p.policy, p.resources) for p in parts] == [
+            ('policy1', [{'k2': 'v2'}]),
+            ('policy2', [{'k3': 'v3'}])
+        ]
+        # policy3 was not scanned so its resources are not removed
+        assert [(p.policy, p.resources) for p in removed.iter_parts()] == [
+            ('policy1', [{'k1': 'v1'}])
+        ]
+
+    def test_fetch_parts(self, make_shard_part):
+        part1 = make_shard_part('global', 'policy1', [{'k1': 'v1'}])
+        part2 = make_shard_part('eu-west-1', 'policy1', [{'k2': 'v2'}])
+        part3 = make_shard_part('eu-west-1', 'policy2', [{'k3': 'v3'}])
+        writer, client, _ = TestShardsS3IOV3.create_writer()
+        c1 = self.create_collection()
+        c1.io = writer
+        c1.put_parts((part1, part2, part3))
+        c1.write_all()
+
+        c2 = self.create_collection()
+        c2.io = writer
+        c2.fetch_parts(policies={'policy1'})
+        assert tuple(c2.iter_parts()) == (part1, part2)
+
+    def test_fetch_parts_shards(self):
+        c = ShardsCollection(distributor=AWSRegionDistributor(4))
+        c.io = MagicMock()
+        c.io.read_parts_many.return_value = []
+        c.fetch_parts(locations={'eu-west-1'})
+        c.io.read_parts_many.assert_called_once_with(
+            [AWSRegionDistributor(4).distribute(region='eu-west-1')],
+            None, {'eu-west-1'}
+        )
+
+        c = ShardsCollection(distributor=PolicyHashDistributor(16))
+        c.io = MagicMock()
+        c.io.read_parts_many.return_value = []
+        c.fetch_parts(policies={'policy1'}, locations={'eu-west-1'})
+        c.io.read_parts_many.assert_called_once_with(
+            [PolicyHashDistributor(16).distribute(policy='policy1')],
+            {'policy1'}, {'eu-west-1'}
+        )
+
+    def test_fetch_by_parts(self, make_shard_part):
+        c = ShardsCollection(distributor=PolicyHashDistributor(16))
+        c.io = MagicMock()
+        c.io.read_raw_many.return_value = []
+        parts = [make_shard_part('global', 'policy1'),
+                 make_shard_part('eu-west-1', 'policy1')]
+        c.fetch_by_parts(parts)
+        c.io.read_raw_many.assert_called_once_with(
+            [PolicyHashDistributor(16).distribute(policy='policy1')]
+        )
+
+
+class TestReshard:
+    def test_reshard(self, make_shard_part):
+        writer, client, storage = TestShardsS3IOV3.create_writer()
+        configs = {}
+        client.gz_get_json.side_effect = \
+            lambda bucket, key, **kw: configs.get(key)
+        client.gz_put_json.side_effect = \
+            lambda bucket, key, obj, **kw: configs.__setitem__(key, obj)
+        client.delete_object.side_effect = \
+            lambda bucket, key: storage.pop(key)
+
+        parts = [make_shard_part(region, f'policy{i}', [{'id': i}])
+                 for i, region in enumerate(('global', 'eu-west-1',
+                                             'eu-central-1', 'us-east-1'))]
+        configs['one/two/three/.conf'] = {'version': 3}
+        old = ShardsCollectionFactory.from_s3_key(
+            Cloud.AWS, 'one/two/three', 'reports', client
+        )
+        old.put_parts(parts)
+        old.meta = {'policy0': {'resource': 'aws.s3'}}
+        old.write_all()
+        old.write_meta()
+        assert {'one/two/three/0.bin', 'one/two/three/1.bin'} <= set(storage)
+
+        config = ShardingConfig(3, 'single')
+        new = reshard(Cloud.AWS, 'one/two/three', config, 'reports', client)
+        assert configs['one/two/three/.conf'] == config.serialize()
+        assert 'one/two/three/0.bin' in storage
+        assert 'one/two/three/1.bin' not in storage
+        assert new.meta == {'policy0': {'resource': 'aws.s3'}}
+
+        fetched = ShardsCollectionFactory.from_s3_key(
+            Cloud.AWS, 'one/two/three', 'reports', client
+        )
+        assert isinstance(fetched.distributor, SingleShardDistributor)
+        fetched.fetch_all()
+        assert sorted(fetched.iter_parts(), key=lambda p: p.policy) == parts
+
+    def test_reshard_to_configured(self, make_shard_part, monkeypatch):
+        writer, client, storage = TestShardsS3IOV3.create_writer()
+        configs = {}
+        client.gz_get_json.side_effect = \
+            lambda bucket, key, **kw: configs.get(key)
+        client.gz_put_json.side_effect = \
+            lambda bucket, key, obj, **kw: configs.__setitem__(key, obj)
+        client.delete_object.side_effect = \
+            lambda bucket, key: storage.pop(key, None)
+        client.gz_get_object.return_value = None  # v1 prefix does not exist
+
+        assert not reshard_to_configured(Cloud.AWS, 'one/two/three',
+                                         'reports', client)
+        monkeypatch.setenv('CAAS_SHARDS_VERSION', '3')
+        assert reshard_to_configured(Cloud.AWS, 'one/two/three', 'reports',
+                                     client)
+        assert configs['one/two/three/.conf'] == {'version': 3}
+        assert not reshard_to_configured(Cloud.AWS, 'one/two/three',
+                                         'reports', client)
+
+        configs['one/two/three/.conf'] = {'version': 3, 'codec': 'zstd',
+                                          'distributor': 'single',
+                                          'dictionary': 'aws.dict'}
+        config = ShardingConfig.build_configured(
+            ShardingConfig.from_raw(configs['one/two/three/.conf'])
+        )
+        assert config.serialize() == {'version': 3, 'distributor': 'single'}
+
+
+class TestIterStoredParts:
+    def test_iter_stored_parts(self, make_shard_part):
+        writer, client, _ = TestShardsS3IOV2.create_writer()
+        parts = [make_shard_part('global', 'policy1', [{'k1': 'v1'}]),
+                 make_shard_part('eu-west-1', 'policy1', [{'k2': 'v2'}])]
+        c1 = ShardsCollection(distributor=AWSRegionDistributor(2), io=writer)
+        c1.put_parts(parts)
+        c1.write_all()
+
+        c2 = ShardsCollection(distributor=AWSRegionDistributor(2), io=writer)
+        assert list(c2.iter_stored_parts()) == parts
+        assert len(c2) == 0
+
+
+class TestSpillStore:
+    def test_put_view(self):
+        with SpillStore() as store:
+            assert store.put(b'first') == (0, 5)
+            assert store.put(b'') == (5, 0)
+            assert store.put(b'second') == (5, 6)
+            assert bytes(store.view(0, 5)) == b'first'
+            assert store.put(b'third') == (11, 5)  # remaps
+            assert bytes(store.view(11, 5)) == b'third'
+            assert bytes(store.view(5, 6)) == b'second'
+            assert bytes(store.view(5, 0)) == b''
+            assert len(store) == 16
+
+    def test_spilled_part(self):
+        with SpillStore() as store:
+            resources = [{'id': 1, 'name': 'one'}, {'id': 2}]
+            part = SpilledShardPart.from_resources(
+                store, resources, 'policy1', 'eu-west-1'
+            )
+            empty = SpilledShardPart.from_resources(store, [], 'policy2')
+            assert part.resources == resources
+            assert empty.resources == []
+            part.drop()
+            assert part.resources == resources
+
+    def test_spilled_part_serialized_as_is(self):
+        writer, client, storage = TestShardsS3IOV2.create_writer()
+        with SpillStore() as store:
+            part = SpilledShardPart.from_resources(
+                store, [{'id': 1}], 'policy1', 'eu-west-1'
+            )
+            shard = Shard()
+            shard.put(part)
+            writer.write(0, shard)
+            read = writer.read_raw(0)
+        assert list(read) == [ShardPart(
+            policy='policy1',
+            location='eu-west-1',
+            timestamp=part.timestamp,
+            resources=[{'id': 1}]
+        )]
+
+
+class TestShardsDiskCache:
+    def test_put_get(self, tmp_path, make_shard):
+        cache = ShardsDiskCache(tmp_path, 1 << 20)
+        parts = list(make_shard())
+        assert cache.etag('reports', 'one/0.json.gz') is None
+        cache.put('reports', 'one/0.json.gz', '"etag1"', parts)
+        assert cache.etag('reports', 'one/0.json.gz') == '"etag1"'
+        assert cache.get('reports', 'one/0.json.gz', '"etag1"') == parts
+        assert cache.get('reports', 'one/0.json.gz', '"etag2"') is None
+        cache.delete('reports', 'one/0.json.gz')
+        assert cache.etag('reports', 'one/0.json.gz') is None
+
+    def test_evict(self, tmp_path, make_shard_part):
+        parts = [make_shard_part(resources=[{'id': 'x' * 1000}])]
+        cache = ShardsDiskCache(tmp_path, 3800)
+        for i in range(3):
+            cache.put('reports', str(i), 'etag', parts)
+        cache.get('reports', '0', 'etag')  # makes it recently used
+        os.utime(cache._path('reports', '1'), (0, 0))
+        cache.put('reports', '3', 'etag', parts)
+        assert cache.etag('reports', '0') == 'etag'
+        assert cache.etag('reports', '1') is None
+        assert cache.etag('reports', '3') == 'etag'
+
+    def test_size_overwrite(self, tmp_path, make_shard_part):
+        parts = [make_shard_part(resources=[{'id': 'x' * 1000}])]
+        cache = ShardsDiskCache(tmp_path, 1 << 20)
+        cache.put('reports', '0', 'etag1', parts)
+        size = cache._size
+        cache.put('reports', '0', 'etag2', parts)
+        assert cache._size == size
+        cache.delete('reports', '0')
+        assert cache._size == 0
+
+    @pytest.mark.parametrize('io_class', [ShardsS3IO, ShardsS3IOV2,
+                                          ShardsS3IOV3])
+    def test_io_with_cache(self, tmp_path, make_shard, io_class):
+        storage = {}
+        client = create_autospec(S3Client)
+
+        def get_object_if_changed(bucket, key, etag=None, buffer=None):
+            if key not in storage:
+                return None, None
+            if etag == f'"{len(storage[key])}"':
+                return None, etag
+            return io.BytesIO(storage[key]), f'"{len(storage[key])}"'
+
+        client.get_object_if_changed.side_effect = get_object_if_changed
+        shard = make_shard()
+        writer = io_class('reports', 'one/two/three', client,
+                          cache=ShardsDiskCache(tmp_path, 1 << 20))
+        data = writer.shard_to_filelike(shard).read()
+        if io_class is not ShardsS3IOV3:  # v3 compresses parts itself
+            data = GZIP.compress(data)
+        storage[writer._object_key(0)] = data
+
+        assert writer.read_raw(0) == list(shard)
+        assert writer.read_raw(0) == list(shard)
+        assert writer.read_parts(0, {'policy2'}) == \
+            [p for p in shard if p.policy == 'policy2']
+        assert writer.read_raw(1) is None
+        etag = f'"{len(storage[writer._object_key(0)])}"'
+        calls = client.get_object_if_changed.call_args_list
+        # downloaded once, then only validated
+        assert [c.args[2] for c in calls[:3]] == [None, etag, etag]
+        client.get_object.assert_not_called()
+
+
+class TestSnapshotManifest:
+    def test_from_snapshot_key(self, make_shard_part):
+        writer, client, storage = TestShardsS3IOV2.create_writer()
+        parts = [make_shard_part('global', 'policy1', [{'k1': 'v1'}]),
+                 make_shard_part('eu-west-1', 'policy2', [{'k2': 'v2'}])]
+        c = ShardsCollection(distributor=AWSRegionDistributor(2), io=writer)
+        c.put_parts(parts)
+        c.write_all()
+        # objects are moved to blobs, the snapshot keeps only manifest
+        files = {}
+        for key in list(storage):
+            name = key.rsplit('/', maxsplit=1)[-1] + '.gz'
+            blob = f'blobs/{hash(key)}.json.gz'
+            storage[blob] = storage.pop(key)
+            files[name] = blob
+        jsons = {
+            'snapshots/2023-12-10-14/manifest.json': {'files': files},
+            'blobs/conf.gz': {'version': 2}
+        }
+        files['.conf.gz'] = 'blobs/conf.gz'
+        client.gz_get_json.side_effect = \
+            lambda bucket, key, **kw: jsons.get(key)
+
+        snapshot = ShardsCollectionFactory.from_snapshot_key(
+            Cloud.AWS, 'snapshots/2023-12-10-14/', 'reports', client
+        )
+        assert isinstance(snapshot.io, ShardsS3IOV2)
+        snapshot.fetch_all()
+        assert sorted(snapshot.iter_parts(),
+                      key=operator.attrgetter('policy')) == parts
+
+    def test_from_old_snapshot_key(self):
+        client = create_autospec(S3Client)
+        client.gz_get_json.return_value = {}
+        snapshot = ShardsCollectionFactory.from_snapshot_key(
+            Cloud.AWS, 'snapshots/2023-12-10-14/', 'reports', client
+        )
+        assert isinstance(snapshot.io, ShardsS3IO)
+        assert snapshot.io._key(0) == 'snapshots/2023-12-10-14/0.json'
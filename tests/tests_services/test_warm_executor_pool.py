@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from services.clients.batch import SubprocessBatchClient, WarmExecutorPool
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'),
+                                reason='fork is required')
+
+SCRIPT = '''
+import os
+import sys
+import time
+with open(os.environ['OUT'], 'w') as file:
+    file.write(os.environ['AWS_BATCH_JOB_ID'])
+time.sleep(float(os.environ.get('SLEEP', 0)))
+sys.exit(int(os.environ.get('CODE', 0)))
+'''
+
+
+def wait_for(job: dict, client: SubprocessBatchClient, timeout: float = 20):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        item = client.get_job(job['jobId'])
+        if item['status'] != 'RUNNING':
+            return item
+        time.sleep(0.05)
+    raise TimeoutError
+
+
+@pytest.fixture
+def client(tmp_path):
+    script = tmp_path / 'job.py'
+    script.write_text(SCRIPT)
+    pool = WarmExecutorPool(script=script)
+    yield SubprocessBatchClient(pool=pool)
+    pool.close()
+
+
+def test_warm_pool(client, tmp_path):
+    one = client.submit_job({'OUT': str(tmp_path / 'one')}, job_name='one')
+    two = client.submit_job({'OUT': str(tmp_path / 'two'), 'CODE': '3'},
+                            job_name='two')
+    assert wait_for(one, client)['status'] == 'SUCCEEDED'
+    assert wait_for(two, client)['status'] == 'FAILED'
+    assert (tmp_path / 'one').read_text() == one['jobId']
+    assert (tmp_path / 'two').read_text() == two['jobId']
+
+    # finished jobs are forgotten when the next one is submitted
+    three = client.submit_job({'OUT': str(tmp_path / 'three'),
+                               'SLEEP': '30'})
+    assert client.get_job(one['jobId']) is None
+    assert client.get_job(three['jobId'])['status'] == 'RUNNING'
+    client.terminate_job(three['jobId'])
+    assert client.get_job(three['jobId']) is None
+
+
+def test_fallback_to_subprocess(tmp_path, monkeypatch):
+    script = tmp_path / 'job.py'
+    script.write_text(SCRIPT)
+    monkeypatch.setattr('services.clients.batch.RUN_SCRIPT', script)
+    pool = WarmExecutorPool(script=script)
+
+    def submit(job_id, env):
+        raise RuntimeError('Warm executor worker is gone')
+
+    monkeypatch.setattr(pool, 'submit', submit)
+    client = SubprocessBatchClient(pool=pool)
+    job = client.submit_job({'OUT': str(tmp_path / 'out')})
+    assert wait_for(job, client)['status'] == 'SUCCEEDED'
+    assert (tmp_path / 'out').read_text() == job['jobId']